@@ -0,0 +1,88 @@
+"""
+Upload image pipeline benchmark: event-loop responsiveness while 20 MP images are processed.
+
+Usage (from backend/):
+    python benchmarks/bench_image_uploads.py --uploads 4 --megapixels 20
+
+Runs the same uploads twice - inline on the event loop (the old upload_image behaviour) and through
+core.images.ImageProcessor - while a probe coroutine stands in for API requests, sleeping 10 ms and
+recording how late it wakes up. Reports upload wall time and probe latency percentiles for both.
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.images import ImageProcessor, render_variant, IMAGE_VARIANTS  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+def make_jpeg(megapixels: float) -> bytes:
+    width = int((megapixels * 1e6 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    rng = np.random.default_rng(1)
+    # Gradient plus noise, so the encoder has real detail to work on
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 20, pixels.shape).astype(np.float32)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def inline_upload(contents: bytes, file_id: str, upload_dir: str):
+    for name, (dimensions, quality) in IMAGE_VARIANTS.items():
+        render_variant(contents, dimensions, quality, os.path.join(upload_dir, f"{file_id}_{name}.webp"))
+
+
+async def measure(label: str, upload, contents: bytes, uploads: int, upload_dir: str):
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(contents, f"bench{i}", upload_dir) for i in range(uploads)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    lags.sort()
+    print(f"{label:>8}: {uploads} uploads in {elapsed:.2f}s | probe latency p50={statistics.median(lags):.1f}ms "
+          f"p99={lags[int(len(lags) * 0.99) - 1]:.1f}ms max={lags[-1]:.1f}ms ({len(lags)} probes)")
+
+
+async def run(args):
+    contents = make_jpeg(args.megapixels)
+    print(f"Source JPEG: {args.megapixels} MP, {len(contents) / 1e6:.1f} MB")
+    processor = ImageProcessor(workers=args.workers, max_concurrent=args.max_concurrent)
+    with tempfile.TemporaryDirectory() as upload_dir:
+        # Warm the pool so worker start-up is not billed to the first upload
+        await processor.process_upload(make_jpeg(0.1), "warmup", upload_dir)
+        await measure("inline", inline_upload, contents, args.uploads, upload_dir)
+        await measure("pool", processor.process_upload, contents, args.uploads, upload_dir)
+    processor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--megapixels", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4))
+    parser.add_argument("--max-concurrent", type=int, default=2)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""
+Offline load benchmark: NOWPayments gateway wrapper against the local fake gateway.
+
+Usage (from backend/):
+    python benchmarks/bench_payments_gateway.py --orders 2000 --concurrency 100 --latency-ms 50 --error-rate 0.05
+
+Each simulated order creates an invoice and then polls /payment/ like the
+verify endpoint does. Reports throughput, latency percentiles and the
+breaker / retry counters so fault-injection settings can be compared.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.gateway import NOWPaymentsGateway, GatewayUnavailable  # noqa: E402
+from tests.fake_nowpayments import create_app, FakeConfig  # noqa: E402
+
+
+async def run(args):
+    fake = create_app(FakeConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        confirm_after=0,
+        send_ipn=False,
+    ))
+    gw = NOWPaymentsGateway("http://fake-nowpayments/v1", "bench-key", transport=httpx.ASGITransport(app=fake))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    outcomes = {"ok": 0, "gateway_error": 0, "short_circuited": 0}
+
+    async def one_order(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                invoice = await gw.post("/invoice", json={"price_amount": 5, "price_currency": "usd", "order_id": f"bench_{i}"})
+                if invoice.status_code != 200:
+                    outcomes["gateway_error"] += 1
+                    return
+                status = await gw.get("/payment/", params={"invoiceId": invoice.json()["id"]})
+                outcomes["ok" if status.status_code == 200 else "gateway_error"] += 1
+            except GatewayUnavailable:
+                outcomes["short_circuited"] += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_order(i) for i in range(args.orders)))
+    elapsed = time.perf_counter() - started
+    await gw.aclose()
+
+    latencies.sort()
+    print(f"orders={args.orders} concurrency={args.concurrency} elapsed={elapsed:.2f}s throughput={args.orders / elapsed:.0f} orders/s")
+    print(f"latency p50={statistics.median(latencies) * 1000:.1f}ms p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+    print(f"outcomes={outcomes}")
+    print(f"gateway={gw.metrics()['stats']} breaker={gw.metrics()['breaker']['state']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    asyncio.run(run(parser.parse_args()))
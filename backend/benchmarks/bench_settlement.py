@@ -0,0 +1,81 @@
+"""
+Settlement benchmark: seed a poll with N votes and time set_poll_result's engine.
+
+Needs a MongoDB replica set (settlement chunks run in transactions), e.g.
+    MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" python benchmarks/bench_settlement.py --votes 100000
+
+Data goes into a throwaway database (BENCH_DB_NAME, default polling_bench)
+which is dropped at the end unless --keep is passed.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+os.environ.setdefault("DB_NAME", os.environ.get("BENCH_DB_NAME", "polling_bench"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.database import db, client, ensure_indexes  # noqa: E402
+from core.settlement import settle_poll  # noqa: E402
+
+
+async def seed(num_votes: int, num_options: int) -> dict:
+    poll_id = str(uuid.uuid4())
+    options = [{"name": f"Option {i + 1}", "votes_count": 0, "total_amount": 0} for i in range(num_options)]
+    users = []
+    votes = []
+    for i in range(num_votes):
+        user_id = str(uuid.uuid4())
+        option_index = random.randrange(num_options)
+        num = random.randint(1, 20)
+        users.append({"id": user_id, "email": f"bench{i}@example.com", "role": "user", "cash_wallet": 0.0})
+        votes.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "poll_id": poll_id,
+            "option_index": option_index,
+            "num_votes": num,
+            "amount_paid": num * 1.0,
+            "payment_status": "success",
+            "result": "pending",
+            "winning_amount": 0
+        })
+        options[option_index]["votes_count"] += num
+        options[option_index]["total_amount"] += num * 1.0
+
+    poll = {"id": poll_id, "title": "Benchmark poll", "options": options, "vote_price": 1.0, "status": "active"}
+    await db.polls.insert_one(dict(poll))
+    for start in range(0, num_votes, 10000):
+        await db.users.insert_many(users[start:start + 10000], ordered=False)
+        await db.user_votes.insert_many(votes[start:start + 10000], ordered=False)
+    return poll
+
+
+async def run(args):
+    await ensure_indexes()
+    print(f"Seeding {args.votes} votes into {db.name}...")
+    poll = await seed(args.votes, args.options)
+
+    started = time.perf_counter()
+    summary = await settle_poll(poll, 0, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - started
+
+    print(f"Settled {summary['processed_votes']} votes ({summary['winners']} winners) in {elapsed:.2f}s "
+          f"-> {summary['processed_votes'] / elapsed:.0f} votes/s, chunk_size={args.chunk_size}")
+    credited = await db.users.count_documents({"cash_wallet": {"$gt": 0}})
+    print(f"Wallets credited: {credited}, transactions written: {await db.transactions.count_documents({'poll_id': poll['id']})}")
+
+    if not args.keep:
+        await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--votes", type=int, default=100000)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Upload serving benchmark: thumbnail-heavy home page loads against StaticFiles vs UploadFiles.
+
+Usage (from backend/):
+    python benchmarks/bench_static_uploads.py --thumbnails 24 --visits 200
+
+Each visit loads a home page's worth of thumbnails through a simulated browser cache that honours
+Cache-Control and revalidates with If-None-Match, the way a browser does. Reports page loads per
+second for new visitors (empty cache, every thumbnail a 200) and returning visitors (warm cache),
+with the requests and 304s a returning visit still costs. Requests go through httpx's ASGI
+transport, so the numbers measure the application layer, not the network.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.static_files import UploadFiles  # noqa: E402
+
+
+class BrowserCache:
+    """Just enough of a browser HTTP cache: fresh entries skip the network, stale ones revalidate"""
+
+    def __init__(self):
+        self.entries = {}
+
+    async def get(self, client: httpx.AsyncClient, url: str, stats: dict):
+        entry = self.entries.get(url)
+        if entry and "immutable" in entry["cache_control"]:
+            return entry["body"]
+        headers = {"If-None-Match": entry["etag"]} if entry else {}
+        response = await client.get(url, headers=headers)
+        stats["requests"] += 1
+        if response.status_code == 304:
+            stats["not_modified"] += 1
+            return entry["body"]
+        stats["bytes"] += len(response.content)
+        self.entries[url] = {"etag": response.headers.get("etag"), "cache_control": response.headers.get("cache-control", ""),
+                             "body": response.content}
+        return response.content
+
+
+async def load_pages(client: httpx.AsyncClient, urls: list, visits: int, cache: BrowserCache = None) -> tuple:
+    """Load the page visits times; a shared cache models one returning visitor, None a new visitor each time"""
+    stats = {"requests": 0, "not_modified": 0, "bytes": 0}
+    started = time.perf_counter()
+    for _ in range(visits):
+        page_cache = cache or BrowserCache()
+        await asyncio.gather(*(page_cache.get(client, url, stats) for url in urls))
+    return visits / (time.perf_counter() - started), stats
+
+
+async def measure(label: str, app, urls: list, visits: int):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        cold_rate, cold = await load_pages(client, urls, visits)
+        cache = BrowserCache()
+        await load_pages(client, urls, 1, cache)
+        repeat_rate, repeat = await load_pages(client, urls, visits, cache)
+    print(f"{label:>12}: new visitors {cold_rate:,.0f} pages/s ({cold_rate * len(urls):,.0f} req/s, "
+          f"{cold['bytes'] / visits / 1024:.0f} KiB/page) | returning visitors {repeat_rate:,.0f} pages/s, "
+          f"{repeat['requests'] / visits:.1f} requests/page ({repeat['not_modified'] / visits:.1f} x 304)")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as upload_dir:
+        urls = []
+        for i in range(args.thumbnails):
+            name = f"{i:032x}_thumb.webp"
+            with open(os.path.join(upload_dir, name), "wb") as f:
+                f.write(os.urandom(args.thumbnail_kib * 1024))
+            urls.append(f"/api/uploads/{name}")
+
+        static_app = Starlette(routes=[Mount("/api/uploads", StaticFiles(directory=upload_dir))])
+        upload_app = Starlette(routes=[Mount("/api/uploads", UploadFiles(directory=upload_dir))])
+        await measure("StaticFiles", static_app, urls, args.visits)
+        await measure("UploadFiles", upload_app, urls, args.visits)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thumbnails", type=int, default=24)
+    parser.add_argument("--thumbnail-kib", type=int, default=12)
+    parser.add_argument("--visits", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
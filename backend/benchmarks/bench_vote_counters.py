@@ -0,0 +1,97 @@
+"""
+Load test: vote finalization throughput on a single hot poll, poll-document counters vs sharded counters.
+
+Needs a MongoDB replica set (finalization runs in a transaction, as in process_successful_payment), e.g.
+    MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" python benchmarks/bench_vote_counters.py --votes 5000 --concurrency 64 --shards 0 16
+
+Every simulated payment credits one order through routes.payments.credit_votes inside a
+transaction; transactions aborted by write conflicts are retried, and the retries are reported.
+Data goes into a throwaway database (BENCH_DB_NAME, default polling_bench) dropped at the end.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault("DB_NAME", os.environ.get("BENCH_DB_NAME", "polling_bench"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import PyMongoError  # noqa: E402
+
+from core.database import db, client, ensure_indexes  # noqa: E402
+from core.vote_counters import vote_counters  # noqa: E402
+from routes.payments import credit_votes  # noqa: E402
+
+
+async def finalize(order: dict, stats: dict):
+    while True:
+        try:
+            async with await client.start_session() as session:
+                async with session.start_transaction():
+                    await credit_votes(order, payment_method="bench", session=session)
+            return
+        except PyMongoError as e:
+            if not e.has_error_label("TransientTransactionError"):
+                raise
+            stats["retries"] += 1
+
+
+async def run_mode(args, shards: int) -> dict:
+    vote_counters.shards = shards
+    poll_id = str(uuid.uuid4())
+    options = [{"name": f"Option {i + 1}", "votes_count": 0, "total_amount": 0} for i in range(args.options)]
+    await db.polls.insert_one({"id": poll_id, "title": "Hot poll", "options": options, "vote_price": 1.0, "status": "active"})
+
+    orders = [{
+        "id": f"order_{uuid.uuid4().hex[:12]}",
+        "user_id": str(uuid.uuid4()),
+        "poll_id": poll_id,
+        "option_index": i % args.options,
+        "num_votes": 1,
+        "base_amount": 1.0,
+        "gateway_charge": 0
+    } for i in range(args.votes)]
+
+    stats = {"retries": 0}
+    queue = asyncio.Queue()
+    for order in orders:
+        queue.put_nowait(order)
+
+    async def worker():
+        while not queue.empty():
+            await finalize(queue.get_nowait(), stats)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    await vote_counters.fold(poll_id)
+    poll = await db.polls.find_one({"id": poll_id})
+    counted = sum(option["votes_count"] for option in poll["options"])
+    assert counted == args.votes, f"Lost votes: counted {counted} of {args.votes}"
+    return {"shards": shards, "elapsed": elapsed, "throughput": args.votes / elapsed, "retries": stats["retries"]}
+
+
+async def run(args):
+    await ensure_indexes()
+    try:
+        for shards in args.shards:
+            result = await run_mode(args, shards)
+            label = "poll document" if shards == 0 else f"{shards} shards/option"
+            print(f"{label:>20}: {args.votes} votes in {result['elapsed']:.2f}s -> {result['throughput']:.0f} votes/s, "
+                  f"{result['retries']} conflict retries")
+    finally:
+        if not args.keep:
+            await client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--votes", type=int, default=5000)
+    parser.add_argument("--options", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 16], help="Shard counts to compare (0 = poll document)")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from pymongo import ReplaceOne
+from pymongo.errors import CollectionInvalid
+
+from core.config import ARCHIVE_POLLS_AFTER_DAYS, ARCHIVE_TRANSACTIONS_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_HOURS
+from core.database import db, run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+# Cold collections; zstd block compression trades a little read CPU for much less disk and cache
+ARCHIVE_COLLECTIONS = ["archived_polls", "archived_user_votes", "archived_transactions"]
+
+
+async def ensure_archive_collections():
+    existing = set(await db.list_collection_names())
+    for name in ARCHIVE_COLLECTIONS:
+        if name in existing:
+            continue
+        try:
+            await db.create_collection(name, storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+        except CollectionInvalid:
+            pass
+    await db.archived_polls.create_index("id", unique=True)
+    await db.archived_user_votes.create_index("user_id")
+    await db.archived_user_votes.create_index([("poll_id", 1), ("result", 1)])
+    await db.archived_transactions.create_index([("user_id", 1), ("created_at", -1)])
+    # Latest archival run first, for the admin status page
+    await db.archive_runs.create_index([("started_at", -1)])
+
+
+# --- Reads: hot collections first, archive as fallback ---
+
+def is_archived(poll: dict) -> bool:
+    return bool(poll.get("archived_at"))
+
+
+def votes_collection(poll: dict):
+    """user_votes of an archived poll live (completely) in the archive"""
+    return db.archived_user_votes if is_archived(poll) else db.user_votes
+
+
+async def find_poll(poll_id: str):
+    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
+    if poll is None:
+        poll = await db.archived_polls.find_one({"id": poll_id}, {"_id": 0})
+    return poll
+
+
+async def find_polls(poll_ids: list) -> dict:
+    """{poll_id: poll} for the given ids, from both collections"""
+    polls = {poll["id"]: poll async for poll in db.polls.find({"id": {"$in": poll_ids}}, {"_id": 0})}
+    missing = [poll_id for poll_id in poll_ids if poll_id not in polls]
+    if missing:
+        async for poll in db.archived_polls.find({"id": {"$in": missing}}, {"_id": 0}):
+            polls[poll["id"]] = poll
+    return polls
+
+
+async def find_user_votes(query: dict, limit: int) -> list:
+    """Vote summaries from both collections; a document mid-move may be in both, so dedupe by id"""
+    votes = await db.user_votes.find(query, {"_id": 0}).to_list(limit)
+    seen = {vote["id"] for vote in votes}
+    archived = await db.archived_user_votes.find(query, {"_id": 0}).to_list(limit)
+    return votes + [vote for vote in archived if vote["id"] not in seen]
+
+
+async def recent_transactions(user_id: str, limit: int) -> list:
+    """Newest-first ledger rows; archived rows are all older than hot ones, so they only fill the tail"""
+    transactions = await db.transactions.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(limit)
+    if len(transactions) < limit:
+        seen = {txn["id"] for txn in transactions}
+        older = await db.archived_transactions.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(limit)
+        transactions += [txn for txn in older if txn["id"] not in seen][:limit - len(transactions)]
+    return transactions
+
+
+# --- Archival job ---
+
+async def _copy(source, target, query: dict, batch_size: int, delete: bool, on_batch=None) -> int:
+    """Upsert matching documents into target by _id (idempotent); optionally remove them from source.
+
+    on_batch(moved) is awaited after every batch with the running total.
+    """
+    moved = 0
+    last_id = None
+    while True:
+        batch_query = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        docs = await source.find(batch_query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return moved
+        await target.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+        if delete:
+            await source.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += len(docs)
+        last_id = docs[-1]["_id"]
+        if on_batch:
+            await on_batch(moved)
+        await asyncio.sleep(0)
+
+
+async def archive_poll(poll: dict, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move one settled poll and its votes to the archive.
+
+    Votes are copied first while the poll still reads from the hot collection; then the poll switches
+    to the archive in one transaction, and only then are the hot votes removed. Readers therefore
+    always see one complete copy, and a rerun after a crash picks up where it stopped.
+    """
+    poll_id = poll["id"]
+    copied = await _copy(db.user_votes, db.archived_user_votes, {"poll_id": poll_id}, batch_size, delete=False)
+    archived_poll = dict(poll, archived_at=datetime.now(timezone.utc).isoformat(), votes_purged=False)
+    archived_poll.pop("_id", None)
+
+    async def switch_to_archive(session):
+        await db.archived_polls.replace_one({"id": poll_id}, archived_poll, upsert=True, session=session)
+        await db.polls.delete_one({"id": poll_id}, session=session)
+
+    await run_in_transaction(switch_to_archive)
+    await purge_archived_votes(poll_id, batch_size)
+    await db.archived_polls.update_one({"id": poll_id}, {"$set": {"votes_purged": True}})
+    logger.info(f"Archived poll {poll_id} with {copied} vote summaries")
+    return copied
+
+
+async def purge_archived_votes(poll_id: str, batch_size: int = ARCHIVE_BATCH_SIZE):
+    """Delete the hot user_votes of an archived poll (all already copied)"""
+    while True:
+        ids = [doc["_id"] for doc in await db.user_votes.find({"poll_id": poll_id}, {"_id": 1}).limit(batch_size).to_list(batch_size)]
+        if not ids:
+            return
+        await db.user_votes.delete_many({"_id": {"$in": ids}})
+
+
+async def run_archival(poll_days: int = ARCHIVE_POLLS_AFTER_DAYS, transaction_days: int = ARCHIVE_TRANSACTIONS_AFTER_DAYS,
+                       batch_size: int = ARCHIVE_BATCH_SIZE, progress=None) -> dict:
+    """Archive polls settled more than poll_days ago and ledger rows older than transaction_days.
+
+    progress(counts), when given, is awaited after every poll and every ledger batch with the counts so far.
+    """
+    async def report(**counts):
+        if progress:
+            await progress(counts)
+
+    now = datetime.now(timezone.utc)
+    poll_cutoff = (now - timedelta(days=poll_days)).isoformat()
+    transaction_cutoff = (now - timedelta(days=transaction_days)).isoformat()
+
+    # Finish hot-vote removal for polls a previous run switched over but did not purge
+    async for poll in db.archived_polls.find({"votes_purged": False}, {"_id": 0, "id": 1}):
+        await purge_archived_votes(poll["id"], batch_size)
+        await db.archived_polls.update_one({"id": poll["id"]}, {"$set": {"votes_purged": True}})
+
+    polls = 0
+    votes = 0
+    query = {"status": "result_declared", "result_declared_at": {"$lt": poll_cutoff}}
+    await report(total_polls=await db.polls.count_documents(query))
+    async for poll in db.polls.find(query, {"_id": 0}):
+        settlement = await db.poll_settlements.find_one({"poll_id": poll["id"]}, {"_id": 0, "status": 1})
+        if settlement and settlement.get("status") != "completed":
+            continue
+        votes += await archive_poll(poll, batch_size)
+        polls += 1
+        await report(polls=polls, user_votes=votes)
+
+    transactions = await _copy(
+        db.transactions, db.archived_transactions, {"created_at": {"$lt": transaction_cutoff}}, batch_size, delete=True,
+        on_batch=lambda moved: report(transactions=moved)
+    )
+    result = {"polls": polls, "user_votes": votes, "transactions": transactions, "completed_at": datetime.now(timezone.utc).isoformat()}
+    logger.info(f"Archival run: {polls} polls, {votes} vote summaries, {transactions} transactions")
+    return result
+
+
+class Archiver:
+    """Runs the archival job periodically (interval_hours=0 disables it; it can still be run on demand).
+
+    Every run, scheduled or on demand, records its progress in an archive_runs document.
+    """
+
+    def __init__(self, interval_hours: float = ARCHIVE_INTERVAL_HOURS):
+        self.interval_hours = interval_hours
+        self._task = None
+        self._current = None
+        self._lock = asyncio.Lock()
+
+    async def _new_run(self, started_by: str = None) -> dict:
+        run = {
+            "id": str(uuid.uuid4()),
+            "status": "running",
+            "total_polls": None,
+            "polls": 0,
+            "user_votes": 0,
+            "transactions": 0,
+            "error": None,
+            "started_by": started_by,
+            "started_at": datetime.now(timezone.utc).isoformat()
+        }
+        await db.archive_runs.insert_one(dict(run))
+        return run
+
+    async def run(self, run_id: str = None) -> dict:
+        """Archive now, recording progress on the run document; returns the finished run"""
+        async with self._lock:
+            if run_id is None:
+                run_id = (await self._new_run())["id"]
+
+            async def progress(counts: dict):
+                await db.archive_runs.update_one(
+                    {"id": run_id}, {"$set": {**counts, "updated_at": datetime.now(timezone.utc).isoformat()}}
+                )
+
+            try:
+                result = await run_archival(progress=progress)
+                update = {**result, "status": "completed"}
+            except asyncio.CancelledError:
+                # Shutting down; the next run picks up where this one stopped
+                await db.archive_runs.update_one({"id": run_id}, {"$set": {"status": "interrupted"}})
+                raise
+            except Exception as e:
+                logger.error(f"Archival run {run_id} failed: {str(e)}")
+                update = {"status": "failed", "error": str(e), "completed_at": datetime.now(timezone.utc).isoformat()}
+            await db.archive_runs.update_one({"id": run_id}, {"$set": update})
+            return await db.archive_runs.find_one({"id": run_id}, {"_id": 0})
+
+    async def start_run(self, started_by: str = None) -> dict:
+        """Archive in the background; while a run is in progress, return that one instead of starting another"""
+        if self._current is not None and not self._current.done():
+            return await self.latest_run()
+        run = await self._new_run(started_by)
+        self._current = asyncio.create_task(self.run(run["id"]))
+        return run
+
+    async def latest_run(self):
+        return await db.archive_runs.find_one({}, {"_id": 0}, sort=[("started_at", -1)])
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Archival run failed: {str(e)}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self):
+        if self._task is None and self.interval_hours > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._current):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._current = None
+
+
+archiver = Archiver()
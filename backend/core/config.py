@@ -7,9 +7,74 @@ MONGO_URL = os.getenv("MONGO_URL")
 DB_NAME = os.getenv("DB_NAME")
 JWT_SECRET = os.getenv("JWT_SECRET")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "https://votevault.preview.emergentagent.com").rstrip("/")
 
 NOWPAYMENTS_API_KEY = os.getenv("NOWPAYMENTS_API_KEY")
 NOWPAYMENTS_IPN_SECRET = os.getenv("NOWPAYMENTS_IPN_SECRET")
+NOWPAYMENTS_API_URL = os.getenv("NOWPAYMENTS_API_URL", "https://api.nowpayments.io/v1")
+
+# Gateway timeout / retry / circuit breaker policy
+NOWPAYMENTS_CONNECT_TIMEOUT = float(os.getenv("NOWPAYMENTS_CONNECT_TIMEOUT", "3"))
+NOWPAYMENTS_READ_TIMEOUT = float(os.getenv("NOWPAYMENTS_READ_TIMEOUT", "10"))
+NOWPAYMENTS_MAX_RETRIES = int(os.getenv("NOWPAYMENTS_MAX_RETRIES", "2"))
+NOWPAYMENTS_RETRY_BUDGET_RATIO = float(os.getenv("NOWPAYMENTS_RETRY_BUDGET_RATIO", "0.2"))
+NOWPAYMENTS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("NOWPAYMENTS_BREAKER_FAILURE_THRESHOLD", "5"))
+NOWPAYMENTS_BREAKER_RESET_SECONDS = float(os.getenv("NOWPAYMENTS_BREAKER_RESET_SECONDS", "30"))
+
+# Per-currency minimum amount / USD estimate cache
+NOWPAYMENTS_QUOTE_CURRENCIES = os.getenv("NOWPAYMENTS_QUOTE_CURRENCIES", "btc,eth,usdt,usdc,bnb,ltc,trx,doge,sol,matic").split(",")
+NOWPAYMENTS_QUOTE_REFRESH_SECONDS = float(os.getenv("NOWPAYMENTS_QUOTE_REFRESH_SECONDS", "300"))
+
+# Result settlement: user_votes processed per bulk-write chunk, and cursor batch size for vote scans
+SETTLEMENT_CHUNK_SIZE = int(os.getenv("SETTLEMENT_CHUNK_SIZE", "1000"))
+VOTE_SCAN_BATCH_SIZE = int(os.getenv("VOTE_SCAN_BATCH_SIZE", "1000"))
+
+# Sharded poll vote counters: 0 keeps counts on the poll document, K > 0 spreads them over K docs per option
+VOTE_COUNTER_SHARDS = int(os.getenv("VOTE_COUNTER_SHARDS", "0"))
+VOTE_COUNTER_CACHE_SECONDS = float(os.getenv("VOTE_COUNTER_CACHE_SECONDS", "2"))
+
+# Append-only vote event log; deferred mode leaves user_votes and poll counters to the compaction worker
+VOTE_EVENTS_DEFERRED = os.getenv("VOTE_EVENTS_DEFERRED", "0") == "1"
+VOTE_EVENT_COMPACTION_BATCH = int(os.getenv("VOTE_EVENT_COMPACTION_BATCH", "500"))
+VOTE_EVENT_COMPACTION_INTERVAL = float(os.getenv("VOTE_EVENT_COMPACTION_INTERVAL", "1"))
+
+# Counter reconciliation: polls checked per chunk and pause between chunks
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "20"))
+RECONCILE_PAUSE_SECONDS = float(os.getenv("RECONCILE_PAUSE_SECONDS", "0.5"))
+
+# Poll delete cascade: dependent documents removed per batch and pause between batches
+CASCADE_BATCH_SIZE = int(os.getenv("CASCADE_BATCH_SIZE", "500"))
+CASCADE_PAUSE_SECONDS = float(os.getenv("CASCADE_PAUSE_SECONDS", "0.2"))
+
+# NOWPayments invoices left in "waiting" expire after this long; older ones can no longer be paid
+INVOICE_EXPIRY_HOURS = float(os.getenv("INVOICE_EXPIRY_HOURS", "168"))
+
+# Cold-storage archival: polls settled / ledger rows created more than N days ago, batch size,
+# and how often the archiver runs (0 = only on demand from the admin API)
+ARCHIVE_POLLS_AFTER_DAYS = int(os.getenv("ARCHIVE_POLLS_AFTER_DAYS", "90"))
+ARCHIVE_TRANSACTIONS_AFTER_DAYS = int(os.getenv("ARCHIVE_TRANSACTIONS_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+
+# Bulk poll import: polls inserted per insert_many chunk, and concurrent image downloads
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+IMPORT_IMAGE_WORKERS = int(os.getenv("IMPORT_IMAGE_WORKERS", "8"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Admin exports: documents per cursor batch, each enriched and written to the response in one go
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Upload image processing: worker processes, and uploads processed at once (the rest queue)
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(os.cpu_count() or 1, 4))))
+IMAGE_MAX_CONCURRENT_UPLOADS = int(os.getenv("IMAGE_MAX_CONCURRENT_UPLOADS", "2"))
+
+# On-demand image variants: allowed widths and the disk budget of the generated-variant cache
+IMAGE_VARIANT_WIDTHS = sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "200,400,800,1200").split(","))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Upload limits: bytes accepted per upload, and decoded pixels per image (decompression-bomb guard)
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+
+from core.config import NOWPAYMENTS_QUOTE_CURRENCIES, NOWPAYMENTS_QUOTE_REFRESH_SECONDS
+from core.gateway import NOWPaymentsGateway
+
+logger = logging.getLogger(__name__)
+
+# Rates move between refreshes, so keep a little headroom over the gateway's own minimum
+MIN_AMOUNT_SAFETY_MARGIN = 1.05
+
+
+class CurrencyQuoteCache:
+    """Per-currency NOWPayments minimums and USD estimates, refreshed in the background.
+
+    Quote refreshes go through their own gateway client, so a burst of failed quote calls trips this
+    cache's breaker and retry budget, never the one order creation and payment checks depend on.
+    """
+
+    def __init__(self, gateway: NOWPaymentsGateway = None, currencies=NOWPAYMENTS_QUOTE_CURRENCIES,
+                 refresh_seconds: float = NOWPAYMENTS_QUOTE_REFRESH_SECONDS, clock=time.monotonic):
+        self._owns_gateway = gateway is None
+        self.gateway = gateway or NOWPaymentsGateway()
+        self.currencies = [c.strip().lower() for c in currencies if c.strip()]
+        self.refresh_seconds = refresh_seconds
+        # Quotes older than this are ignored and callers fall back to the static floor
+        self.max_age = refresh_seconds * 3
+        self.clock = clock
+        self.quotes = {}
+        self._task = None
+
+    async def refresh_currency(self, currency: str):
+        min_response = await self.gateway.get(
+            "/min-amount",
+            params={"currency_from": currency, "currency_to": currency, "fiat_equivalent": "usd"},
+        )
+        estimate_response = await self.gateway.get(
+            "/estimate",
+            params={"amount": 1, "currency_from": "usd", "currency_to": currency},
+        )
+        if min_response.status_code != 200 or estimate_response.status_code != 200:
+            logger.warning(f"Could not refresh {currency} quote: {min_response.status_code}/{estimate_response.status_code}")
+            return
+        min_data = min_response.json()
+        estimate = float(estimate_response.json().get("estimated_amount", 0))
+        self.quotes[currency] = {
+            "currency": currency,
+            "min_amount": float(min_data.get("min_amount", 0)),
+            "min_usd": float(min_data.get("fiat_equivalent", 0)),
+            "crypto_per_usd": estimate,
+            "refreshed_at": self.clock(),
+        }
+
+    async def refresh_all(self):
+        results = await asyncio.gather(*(self.refresh_currency(c) for c in self.currencies), return_exceptions=True)
+        for currency, result in zip(self.currencies, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not refresh {currency} quote: {type(result).__name__}")
+
+    async def _run(self):
+        while True:
+            await self.refresh_all()
+            await asyncio.sleep(self.refresh_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._owns_gateway:
+            await self.gateway.aclose()
+
+    def get(self, currency: str):
+        quote = self.quotes.get((currency or "").lower())
+        if quote and self.clock() - quote["refreshed_at"] <= self.max_age:
+            return quote
+        return None
+
+    def min_usd(self, currency: str):
+        """Minimum order in USD for the currency, or None when no fresh quote is cached"""
+        quote = self.get(currency)
+        if not quote or not quote["min_usd"]:
+            return None
+        return round(quote["min_usd"] * MIN_AMOUNT_SAFETY_MARGIN, 2)
+
+    def estimate(self, currency: str, usd_amount: float):
+        """Estimated crypto amount for a USD price, or None when no fresh quote is cached"""
+        quote = self.get(currency)
+        if not quote or not quote["crypto_per_usd"]:
+            return None
+        return usd_amount * quote["crypto_per_usd"]
+
+    def snapshot(self, usd_amount: float = None) -> list:
+        items = []
+        for currency in self.currencies:
+            quote = self.get(currency)
+            if not quote:
+                continue
+            item = {
+                "currency": currency,
+                "min_amount": quote["min_amount"],
+                "min_usd": self.min_usd(currency),
+                "crypto_per_usd": quote["crypto_per_usd"],
+                "age_seconds": round(self.clock() - quote["refreshed_at"], 1),
+            }
+            if usd_amount is not None:
+                item["estimated_amount"] = self.estimate(currency, usd_amount)
+            items.append(item)
+        return items
+
+
+currency_quotes = CurrencyQuoteCache()
@@ -1,5 +1,100 @@
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 from core.config import MONGO_URL, DB_NAME
 
+logger = logging.getLogger(__name__)
+
 client = AsyncIOMotorClient(MONGO_URL)
 db = client[DB_NAME]
+
+
+async def run_in_transaction(callback):
+    """Run callback(session) in a transaction.
+
+    with_transaction retries the whole callback on TransientTransactionError (e.g. a WriteConflict
+    with a concurrent vote on the same poll or wallet) and the commit on an unknown commit result,
+    so callers only see errors that persisted past the retry window.
+    """
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+async def ensure_transactions_supported():
+    """Refuse to start against a standalone mongod.
+
+    Vote payments, settlement, archival and poll deletes commit through multi-document transactions,
+    which need a replica set (a single-node one is enough) or a sharded cluster.
+    """
+    hello = await client.admin.command("hello")
+    if not hello.get("setName") and hello.get("msg") != "isdbgrid":
+        raise RuntimeError(
+            "MongoDB at MONGO_URL is a standalone server, but payments need multi-document transactions. "
+            "Run it as a replica set (e.g. mongod --replSet rs0, then rs.initiate()) or point MONGO_URL at a cluster; "
+            "README.md has the steps for converting an existing standalone deployment."
+        )
+
+
+async def ensure_indexes():
+    """Create the indexes the hot query paths rely on (no-op when they already exist)"""
+    # One vote summary per user and option; vote recording upserts against it
+    try:
+        await db.user_votes.create_index([("user_id", 1), ("poll_id", 1), ("option_index", 1)], unique=True)
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        merged = await merge_duplicate_user_votes()
+        logger.warning(f"Merged {merged} duplicate user_votes documents before building the unique vote index")
+        await db.user_votes.create_index([("user_id", 1), ("poll_id", 1), ("option_index", 1)], unique=True)
+    # Settlement walks a poll's votes in _id order
+    await db.user_votes.create_index([("poll_id", 1), ("_id", 1)])
+    # Result stats page winners by payout and losers by amount paid
+    await db.user_votes.create_index([("poll_id", 1), ("result", 1), ("winning_amount", -1), ("_id", -1)])
+    await db.user_votes.create_index([("poll_id", 1), ("result", 1), ("amount_paid", -1), ("_id", -1)])
+    await db.users.create_index("id")
+    await db.poll_settlements.create_index("poll_id", unique=True)
+    # Sharded vote counter rollups
+    await db.poll_vote_counters.create_index("poll_id")
+    # Vote event log: compaction scans pending events in _id order, counter rebuilds group by poll
+    await db.vote_events.create_index([("compacted", 1), ("poll_id", 1), ("_id", 1)])
+    await db.vote_events.create_index("poll_id")
+    # Counter reconciliation walks polls by id and totals each poll's orders
+    await db.polls.create_index("id")
+    await db.orders.create_index("poll_id")
+    # Poll delete cascades, and the per-poll lookups they and the orphan report run
+    await db.poll_deletions.create_index("poll_id", unique=True)
+    await db.transactions.create_index("poll_id")
+    # Admin lists and exports walk these newest first
+    await db.transactions.create_index([("created_at", -1)])
+    await db.orders.create_index([("created_at", -1)])
+    await db.users.create_index([("role", 1), ("created_at", -1)])
+    await db.withdrawal_requests.create_index([("status", 1), ("requested_at", -1)])
+    await db.withdrawal_requests.create_index([("requested_at", -1)])
+    # Content-addressed upload images
+    await db.images.create_index("id", unique=True)
+
+
+async def merge_duplicate_user_votes() -> int:
+    """Fold duplicate (user_id, poll_id, option_index) vote docs left by racing inserts into the oldest one"""
+    pipeline = [
+        {"$sort": {"_id": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "poll_id": "$poll_id", "option_index": "$option_index"},
+            "ids": {"$push": "$_id"},
+            "num_votes": {"$sum": "$num_votes"},
+            "amount_paid": {"$sum": "$amount_paid"},
+            "winning_amount": {"$sum": {"$ifNull": ["$winning_amount", 0]}},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    merged = 0
+    async for group in db.user_votes.aggregate(pipeline, allowDiskUse=True):
+        keep, duplicates = group["ids"][0], group["ids"][1:]
+        await db.user_votes.update_one(
+            {"_id": keep},
+            {"$set": {"num_votes": group["num_votes"], "amount_paid": group["amount_paid"], "winning_amount": group["winning_amount"]}}
+        )
+        await db.user_votes.delete_many({"_id": {"$in": duplicates}})
+        merged += len(duplicates)
+    return merged
@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from core.config import EXPORT_BATCH_SIZE
+from core.database import db
+from core.archive import find_polls
+
+# format -> media type of the streamed body
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+USER_FIELDS = {"_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1, "upi_id": 1}
+
+
+# --- Filters shared with the paged admin list endpoints ---
+
+def users_query() -> dict:
+    return {"role": "user"}
+
+
+USERS_SORT = [("created_at", -1)]
+
+
+def transactions_query() -> dict:
+    return {}
+
+
+def orders_query() -> dict:
+    return {}
+
+
+def withdrawals_query(status: str = None) -> dict:
+    if status and status != "all":
+        return {"status": status}
+    return {}
+
+
+# --- Per-batch enrichment: one $in lookup per batch instead of one query per row ---
+
+async def attach_users(docs: list, fields: tuple):
+    user_ids = list({doc.get("user_id") for doc in docs if doc.get("user_id")})
+    users = {user["id"]: user async for user in db.users.find({"id": {"$in": user_ids}}, USER_FIELDS)}
+    for doc in docs:
+        user = users.get(doc.get("user_id"))
+        doc["user"] = {field: user.get(field) for field in fields} if user else None
+
+
+async def attach_polls(docs: list):
+    poll_ids = list({doc.get("poll_id") for doc in docs if doc.get("poll_id")})
+    polls = await find_polls(poll_ids) if poll_ids else {}
+    for doc in docs:
+        poll = polls.get(doc.get("poll_id"))
+        doc["poll"] = {"title": poll.get("title")} if poll else None
+
+
+async def enrich_transactions(docs: list):
+    await attach_users(docs, ("name", "email"))
+    await attach_polls(docs)
+
+
+async def enrich_orders(docs: list):
+    await attach_users(docs, ("name", "email", "phone"))
+    await attach_polls(docs)
+
+
+async def enrich_withdrawals(docs: list):
+    await attach_users(docs, ("name", "email", "phone", "upi_id"))
+
+
+# name -> collection, query, projection, sort, enrichment and CSV columns (dotted paths reach into
+# the attached user/poll). NDJSON rows carry the whole document, like the list endpoints' items.
+EXPORTS = {
+    "users": {
+        "collection": "users",
+        "projection": {"_id": 0, "password_hash": 0},
+        "sort": USERS_SORT,
+        "enrich": None,
+        "columns": ["id", "email", "name", "phone", "cash_wallet", "upi_id", "kyc_status", "created_at"]
+    },
+    "transactions": {
+        "collection": "transactions",
+        "projection": {"_id": 0},
+        "sort": [("created_at", -1)],
+        "enrich": enrich_transactions,
+        "columns": ["id", "created_at", "type", "status", "amount", "gateway_charge", "user_id", "user.name",
+                    "user.email", "poll_id", "poll.title", "payment_id", "payment_method"]
+    },
+    "orders": {
+        "collection": "orders",
+        "projection": {"_id": 0},
+        "sort": [("created_at", -1)],
+        "enrich": enrich_orders,
+        "columns": ["id", "created_at", "payment_status", "user_id", "user.name", "user.email", "user.phone",
+                    "poll_id", "poll.title", "option_index", "num_votes", "lines", "base_amount", "gateway_charge",
+                    "total_amount", "pay_currency", "invoice_id"]
+    },
+    "withdrawals": {
+        "collection": "withdrawal_requests",
+        "projection": {"_id": 0},
+        "sort": [("requested_at", -1)],
+        "enrich": enrich_withdrawals,
+        "columns": ["id", "requested_at", "status", "user_id", "user.name", "user.email", "user.phone", "upi_id",
+                    "amount", "withdrawal_charge", "net_amount", "transaction_id", "remarks", "processed_at", "processed_by"]
+    }
+}
+
+
+def column_value(doc: dict, column: str):
+    value = doc
+    for key in column.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+# Leading characters spreadsheets evaluate as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value):
+    """Neutralise user-controlled text (names, titles, remarks) that a spreadsheet would run as a formula"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class CsvEncoder:
+    """Encodes batches of documents as CSV text; the header goes out with the first batch"""
+
+    def __init__(self, columns: list):
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.writer.writerow(columns)
+
+    def encode(self, docs: list) -> str:
+        for doc in docs:
+            self.writer.writerow([csv_cell(column_value(doc, column)) for column in self.columns])
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text
+
+
+def encode_ndjson(docs: list) -> str:
+    return "".join(json.dumps(doc, default=str) + "\n" for doc in docs)
+
+
+async def iter_batches(cursor, batch_size: int):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_export(name: str, query: dict, fmt: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield an export body one batch at a time.
+
+    The cursor fetches batch_size documents per round trip and each batch is enriched, encoded and
+    handed to the response before the next is read, so memory stays at one batch however many rows
+    match. Rows are written in the list endpoint's order.
+    """
+    spec = EXPORTS[name]
+    cursor = db[spec["collection"]].find(query, spec["projection"])
+    if spec["sort"]:
+        cursor = cursor.sort(spec["sort"])
+    cursor = cursor.batch_size(batch_size)
+
+    csv_encoder = CsvEncoder(spec["columns"]) if fmt == "csv" else None
+    rows = 0
+    async for docs in iter_batches(cursor, batch_size):
+        if spec["enrich"]:
+            await spec["enrich"](docs)
+        rows += len(docs)
+        yield (csv_encoder.encode(docs) if csv_encoder else encode_ndjson(docs)).encode()
+    if csv_encoder and rows == 0:
+        # Header only
+        yield csv_encoder.encode([]).encode()
+
+
+def export_filename(name: str, fmt: str) -> str:
+    return f"{name}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{fmt}"
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from collections import deque
+
+import httpx
+
+from core.config import (
+    NOWPAYMENTS_API_URL,
+    NOWPAYMENTS_API_KEY,
+    NOWPAYMENTS_CONNECT_TIMEOUT,
+    NOWPAYMENTS_READ_TIMEOUT,
+    NOWPAYMENTS_MAX_RETRIES,
+    NOWPAYMENTS_RETRY_BUDGET_RATIO,
+    NOWPAYMENTS_BREAKER_FAILURE_THRESHOLD,
+    NOWPAYMENTS_BREAKER_RESET_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mean the gateway itself is struggling (counted as failures, retried when idempotent)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def sign_ipn_payload(data: dict, secret: str) -> str:
+    """NOWPayments IPN signature: HMAC-SHA512 over the key-sorted compact JSON body"""
+    sorted_json = json.dumps(data, separators=(',', ':'), sort_keys=True)
+    return hmac.new(secret.encode(), sorted_json.encode(), hashlib.sha512).hexdigest()
+
+
+class GatewayUnavailable(Exception):
+    """Raised when the circuit breaker is open and the call is rejected without touching the network"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        # Half-open: let a single probe through, reject everything else until it reports back
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            logger.info("NOWPayments circuit breaker closed")
+        self.state = "closed"
+        self.opened_at = None
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"NOWPayments circuit breaker opened after {self.consecutive_failures} failure(s)")
+            self.state = "open"
+            self.opened_at = self.clock()
+
+    def release_probe(self):
+        if self._probe_in_flight:
+            logger.warning("NOWPayments circuit breaker probe did not complete")
+            self.record_failure()
+
+    def snapshot(self) -> dict:
+        retry_in = None
+        if self.state == "open":
+            retry_in = max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_seconds": self.reset_timeout,
+            "retry_in_seconds": retry_in,
+            "times_opened": self.times_opened,
+        }
+
+
+class RetryBudget:
+    """Caps retries to a fraction of recent requests so retries can't amplify a brownout"""
+
+    def __init__(self, ratio: float, min_retries_per_second: float = 1.0, window_seconds: float = 10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries_per_second * window_seconds
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._requests = deque()
+        self._retries = deque()
+
+    def _expire(self, now: float):
+        cutoff = now - self.window_seconds
+        for events in (self._requests, self._retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(self.clock())
+
+    def try_acquire(self) -> bool:
+        now = self.clock()
+        self._expire(now)
+        if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+            return False
+        self._retries.append(now)
+        return True
+
+    def snapshot(self) -> dict:
+        self._expire(self.clock())
+        return {
+            "ratio": self.ratio,
+            "window_seconds": self.window_seconds,
+            "requests_in_window": len(self._requests),
+            "retries_in_window": len(self._retries),
+        }
+
+
+class NOWPaymentsGateway:
+    """NOWPayments HTTP client with timeouts, jittered retries for idempotent reads and a circuit breaker"""
+
+    def __init__(
+        self,
+        base_url: str = NOWPAYMENTS_API_URL,
+        api_key: str = NOWPAYMENTS_API_KEY,
+        *,
+        connect_timeout: float = NOWPAYMENTS_CONNECT_TIMEOUT,
+        read_timeout: float = NOWPAYMENTS_READ_TIMEOUT,
+        max_retries: int = NOWPAYMENTS_MAX_RETRIES,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 2.0,
+        breaker: CircuitBreaker = None,
+        retry_budget: RetryBudget = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker(NOWPAYMENTS_BREAKER_FAILURE_THRESHOLD, NOWPAYMENTS_BREAKER_RESET_SECONDS)
+        self.retry_budget = retry_budget or RetryBudget(NOWPAYMENTS_RETRY_BUDGET_RATIO)
+        self.transport = transport
+        self._client = None
+        self.stats = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "short_circuited": 0,
+            "retries": 0,
+            "retries_denied": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # One pooled client per process instead of a new connection per call
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                headers={"x-api-key": self.api_key or ""},
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def request(self, method: str, path: str, *, idempotent: bool, timeout: float = None, **kwargs) -> httpx.Response:
+        """Send a request through the breaker; only idempotent calls are retried"""
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.timeout.connect)
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        self.retry_budget.record_request()
+
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                self.stats["short_circuited"] += 1
+                raise GatewayUnavailable("NOWPayments circuit breaker is open")
+            probe = self.breaker.state == "half_open"
+
+            self.stats["requests"] += 1
+            try:
+                response = await self._get_client().request(method, path, **kwargs)
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    self.stats["failures"] += 1
+                    self.breaker.record_failure()
+                    logger.warning(f"NOWPayments {method} {path} returned {response.status_code}")
+                else:
+                    # 2xx and client errors (4xx) mean the gateway is healthy
+                    self.stats["successes"] += 1
+                    self.breaker.record_success()
+                    return response
+            except httpx.TransportError as e:
+                self.stats["failures"] += 1
+                self.breaker.record_failure()
+                logger.warning(f"NOWPayments {method} {path} failed: {type(e).__name__}")
+                if not await self._should_retry(attempt, attempts):
+                    raise
+                continue
+            finally:
+                # A half-open probe that never reported back (cancelled, unexpected error) counts as
+                # failed; otherwise the breaker would reject every call until the process restarts
+                if probe:
+                    self.breaker.release_probe()
+
+            if not await self._should_retry(attempt, attempts):
+                return response
+
+    async def _should_retry(self, attempt: int, attempts: int) -> bool:
+        if attempt + 1 >= attempts:
+            return False
+        if not self.retry_budget.try_acquire():
+            self.stats["retries_denied"] += 1
+            return False
+        self.stats["retries"] += 1
+        await asyncio.sleep(self._backoff(attempt))
+        return True
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, idempotent=True, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, idempotent=False, **kwargs)
+
+    def metrics(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "breaker": self.breaker.snapshot(),
+            "retry_budget": self.retry_budget.snapshot(),
+            "stats": dict(self.stats),
+        }
+
+
+gateway = NOWPaymentsGateway()
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class DiskLRUCache:
+    """Size-bounded directory of generated files, evicting the least recently served first.
+
+    Recency is the file's mtime (bumped on every hit), so the cache survives restarts: the index is
+    rebuilt from the directory on first use.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = None  # name -> (size, last_used)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                self._entries[entry.name] = (stat.st_size, stat.st_mtime)
+                self._total += stat.st_size
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, name: str):
+        """Path of a cached file (marking it recently used), or None"""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            now = time.time()
+            self._entries[name] = (entry[0], now)
+        try:
+            os.utime(self.path(name), (now, now))
+        except FileNotFoundError:
+            # Removed behind our back (another process evicted it)
+            with self._lock:
+                if self._entries.pop(name, None):
+                    self._total -= entry[0]
+            return None
+        return self.path(name)
+
+    def put(self, name: str, data: bytes) -> str:
+        """Store data under name (atomically) and evict old entries beyond max_bytes"""
+        with self._lock:
+            self._load()
+        tmp_path = self.path(f".{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(name))
+        with self._lock:
+            previous = self._entries.get(name)
+            if previous:
+                self._total -= previous[0]
+            self._entries[name] = (len(data), time.time())
+            self._total += len(data)
+            self._evict(keep=name)
+        return self.path(name)
+
+    def _evict(self, keep: str):
+        if self._total <= self.max_bytes:
+            return
+        for name, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            del self._entries[name]
+            self._total -= size
+            logger.debug(f"Evicted cached image {name}")
+
+    def discard(self, prefix: str):
+        """Remove every cached file whose name starts with prefix"""
+        with self._lock:
+            self._load()
+            for name in [name for name in self._entries if name.startswith(prefix)]:
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+                self._total -= self._entries.pop(name)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"files": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
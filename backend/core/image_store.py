@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import uuid
+from datetime import datetime, timezone
+import aiofiles
+
+from core.config import IMAGE_CACHE_MAX_BYTES, IMAGE_MAX_UPLOAD_BYTES
+from core.database import db
+from core.image_cache import DiskLRUCache
+from core.images import IMAGE_VARIANTS, image_processor
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
+
+# Generated on-demand variants (routes/images.py)
+variant_cache = DiskLRUCache(os.path.join(UPLOAD_DIR, "cache"), IMAGE_CACHE_MAX_BYTES)
+
+# Image id inside the URLs upload_image hands out: /api/images/{id}?w=... and /api/uploads/{id}_{variant}.webp
+IMAGE_URL_PATTERN = re.compile(r"/api/(?:images/|uploads/)([0-9a-f-]{1,36})(?:[_?/.]|$)")
+
+
+class UploadTooLarge(ValueError):
+    """More than IMAGE_MAX_UPLOAD_BYTES arrived"""
+
+
+def content_id(digest: str) -> str:
+    """Image id for a sha256 hex digest of the upload; 128 bits is plenty to make collisions moot"""
+    return digest[:32]
+
+
+def spool_path() -> str:
+    return os.path.join(tempfile.gettempdir(), f"upload-{uuid.uuid4()}.tmp")
+
+
+async def spool(chunks, path: str, max_bytes: int = IMAGE_MAX_UPLOAD_BYTES) -> tuple:
+    """Write an async iterator of byte chunks to path, hashing on the way; returns (size, image id).
+
+    Memory stays flat however large the upload is. The caller removes path.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(path, "wb") as f:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Image too large. Maximum size is {max_bytes // (1024 * 1024)} MB")
+            digest.update(chunk)
+            await f.write(chunk)
+    return size, content_id(digest.hexdigest())
+
+
+def remove_spool(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def image_id_from_url(url: str):
+    match = IMAGE_URL_PATTERN.search(url or "")
+    return match.group(1) if match else None
+
+
+async def find_image(image_id: str):
+    """Stored image with this content id, if its original is still on disk"""
+    image = await db.images.find_one({"id": image_id}, {"_id": 0})
+    if image and os.path.exists(os.path.join(UPLOAD_DIR, image["filenames"]["original"])):
+        return image
+    return None
+
+
+async def register_image(image_id: str, filenames: dict, size: int):
+    await db.images.update_one(
+        {"id": image_id},
+        {
+            "$set": {"filenames": filenames, "size": size},
+            "$setOnInsert": {"ref_count": 0, "created_at": datetime.now(timezone.utc).isoformat()}
+        },
+        upsert=True
+    )
+
+
+async def ingest(spool_path: str, image_id: str, size: int) -> tuple:
+    """Store a spooled upload under its content id unless it is already stored.
+
+    Returns (filenames, timings, deduplicated); timings is None when nothing had to be rendered.
+    """
+    existing = await find_image(image_id)
+    if existing:
+        return existing["filenames"], None, True
+    # Only the normalised original is written; sized variants are rendered on first request by
+    # /api/images. Workers read the spooled file themselves and check its dimensions before decoding.
+    filenames, timings = await image_processor.process_upload(spool_path, image_id, UPLOAD_DIR, variants=["original"])
+    await register_image(image_id, filenames, size)
+    return filenames, timings, False
+
+
+async def acquire(image_url: str):
+    """Count a poll's reference to a stored image (URLs pointing elsewhere are ignored)"""
+    image_id = image_id_from_url(image_url)
+    if image_id:
+        await db.images.update_one({"id": image_id}, {"$inc": {"ref_count": 1}})
+
+
+async def release(image_url: str):
+    """Drop a poll's reference; the last one removes the image's files and cached variants"""
+    image_id = image_id_from_url(image_url)
+    if not image_id:
+        return
+    image = await db.images.find_one_and_update({"id": image_id}, {"$inc": {"ref_count": -1}}, {"_id": 0}, return_document=True)
+    if not image or image["ref_count"] > 0:
+        return
+    # Counts only exist for polls created since the store did; never delete what a poll still shows
+    still_shown = {"image_url": {"$regex": re.escape(image_id)}}
+    if await db.polls.count_documents(still_shown, limit=1) or await db.archived_polls.count_documents(still_shown, limit=1):
+        await db.images.update_one({"id": image_id}, {"$set": {"ref_count": 1}})
+        return
+    # Claim the deletion first, so a concurrent release cannot remove the files twice
+    claimed = await db.images.delete_one({"id": image_id, "ref_count": {"$lte": 0}})
+    if claimed.deleted_count:
+        await asyncio.to_thread(remove_files, image_id)
+        logger.info(f"Removed unreferenced image {image_id}")
+
+
+def remove_files(image_id: str):
+    for name in IMAGE_VARIANTS:
+        try:
+            os.remove(os.path.join(UPLOAD_DIR, f"{image_id}_{name}.webp"))
+        except FileNotFoundError:
+            pass
+    variant_cache.discard(f"{image_id}_")
@@ -0,0 +1,148 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from core.config import IMAGE_PROCESS_WORKERS, IMAGE_MAX_CONCURRENT_UPLOADS, IMAGE_MAX_PIXELS, IMAGE_VARIANT_WIDTHS
+
+logger = logging.getLogger(__name__)
+
+# Responsive variants; "original" is the normalised master the on-demand variants are rendered from,
+# capped at twice the largest variant so neither it nor its decode grows with the source resolution
+IMAGE_VARIANTS = {
+    "large": ((1200, 800), 85),
+    "medium": ((800, 533), 85),
+    "small": ((400, 267), 85),
+    "thumb": ((200, 133), 85),
+    "original": ((2400, 1600), 90)
+}
+
+
+# The variant a freshly stored image is attached to polls with
+DEFAULT_VARIANT = "large"
+
+
+def variant_path(image_id: str, name: str = DEFAULT_VARIANT) -> str:
+    """/api/images URL of a variant, at the configured width closest to the variant's own"""
+    width = min(IMAGE_VARIANT_WIDTHS, key=lambda w: abs(w - IMAGE_VARIANTS[name][0][0]))
+    return f"/api/images/{image_id}?w={width}"
+
+
+class ImageTooLarge(ValueError):
+    """The image header declares more pixels than IMAGE_MAX_PIXELS"""
+
+
+def open_image(source, max_pixels: int = IMAGE_MAX_PIXELS) -> Image.Image:
+    """Open an image from bytes or a path, reading only its header, and refuse oversized dimensions"""
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    width, height = img.size
+    if width * height > max_pixels:
+        img.close()
+        raise ImageTooLarge(f"Image is {width}x{height}; at most {max_pixels} pixels are allowed")
+    return img
+
+
+def encode_variant(source, dimensions, quality: int, image_format: str = "WebP") -> tuple:
+    """Decode, resize and encode one variant of an image (bytes or a file path).
+
+    Returns (encoded bytes, stage timings). Runs in a worker process.
+    """
+    timings = {}
+    started = time.perf_counter()
+    img = open_image(source)
+    if dimensions and img.format == "JPEG":
+        # Let the JPEG decoder downscale by up to 8x while decoding; far cheaper than a full decode
+        img.draft("RGB", dimensions)
+    img.load()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    timings["decode_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if dimensions:
+        img.thumbnail(dimensions, Image.Resampling.LANCZOS)
+    timings["resize_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    img.save(buffer, image_format, quality=quality, optimize=True)
+    timings["encode_ms"] = (time.perf_counter() - started) * 1000
+    return buffer.getvalue(), timings
+
+
+def render_variant(source, dimensions, quality: int, filepath: str) -> dict:
+    """Encode one WebP variant to filepath; runs in a worker process"""
+    data, timings = encode_variant(source, dimensions, quality)
+    started = time.perf_counter()
+    # Write then rename: identical uploads processed at once render to the same content-addressed name
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+    timings["write_ms"] = (time.perf_counter() - started) * 1000
+    return {k: round(v, 1) for k, v in timings.items()}
+
+
+class ImageProcessor:
+    """Runs upload image pipelines in a process pool so they never block the event loop.
+
+    Every variant is rendered as its own task, so one upload's variants encode in parallel; the
+    semaphore bounds how many uploads are in flight so a burst queues instead of starving the pool.
+    """
+
+    def __init__(self, workers: int = IMAGE_PROCESS_WORKERS, max_concurrent: int = IMAGE_MAX_CONCURRENT_UPLOADS):
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self._executor = None
+        self._semaphore = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the API process runs threads (Motor, the event loop) that must not be forked
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._executor
+
+    async def process_upload(self, source, file_id: str, upload_dir: str, variants: list = None) -> tuple:
+        """Render the given variants (default: all) of an upload; returns ({variant: filename}, timings).
+
+        source is the upload's bytes or, better, the path of the spooled upload: workers then read the
+        file themselves instead of receiving a pickled copy of it.
+        """
+        variants = variants or list(IMAGE_VARIANTS)
+        pool = self._pool()
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            filenames = {name: f"{file_id}_{name}.webp" for name in variants}
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, render_variant, source, *IMAGE_VARIANTS[name], os.path.join(upload_dir, filenames[name]))
+                for name in variants
+            ))
+        finished = time.perf_counter()
+        timings = {
+            "queue_ms": round((started - queued) * 1000, 1),
+            "total_ms": round((finished - queued) * 1000, 1),
+            "variants": dict(zip(variants, results))
+        }
+        return filenames, timings
+
+    async def render(self, source, dimensions, quality: int, image_format: str = "WebP") -> tuple:
+        """Encode a single variant of an image (bytes or a path) in the pool; returns (bytes, timings)"""
+        pool = self._pool()
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(pool, encode_variant, source, dimensions, quality, image_format)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_processor = ImageProcessor()
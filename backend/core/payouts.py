@@ -0,0 +1,79 @@
+import numpy as np
+
+# pot_cents * weight must stay inside int64 for the vectorised floor division
+_INT64_LIMIT = np.iinfo(np.int64).max
+
+
+def to_cents(amount: float) -> int:
+    """Convert a dollar amount to whole cents"""
+    return int(round(amount * 100))
+
+
+def cents_to_amount(cents) -> float:
+    """Convert whole cents back to a dollar amount"""
+    return round(int(cents) / 100, 2)
+
+
+def per_vote_amount(pot_cents: int, total_weight: int) -> float:
+    """Nominal payout per vote; actual payouts differ from it by at most one cent"""
+    if total_weight <= 0:
+        return 0
+    return cents_to_amount(round(pot_cents / total_weight))
+
+
+def plan_payouts(pot_cents: int, weights) -> dict:
+    """Split pot_cents across weights with the largest-remainder method.
+
+    Every entry gets floor(pot * w / W) cents; the cents left over go to the entries with the
+    largest remainders, ties broken by position. The plan only records where that cut falls, so it
+    is small enough to persist and lets allocate() pay any slice of the entries independently.
+    """
+    weights = np.asarray(weights, dtype=np.int64)
+    total_weight = int(weights.sum())
+    plan = {
+        "pot_cents": int(pot_cents),
+        "total_weight": total_weight,
+        "extra_cents": 0,
+        "cutoff_remainder": total_weight,
+        "cutoff_index": -1
+    }
+    if total_weight <= 0:
+        return plan
+    if weights.size and int(weights.max()) > _INT64_LIMIT // max(int(pot_cents), 1):
+        raise ValueError("Pot too large for integer payout allocation")
+
+    scaled = pot_cents * weights
+    remainders = scaled % total_weight
+    extra_cents = int(pot_cents) - int((scaled // total_weight).sum())
+    if extra_cents == 0:
+        return plan
+
+    # The extra_cents-th largest remainder is the cut; entries equal to it are taken in position order
+    cutoff_remainder = int(-np.partition(-remainders, extra_cents - 1)[extra_cents - 1])
+    above = int(np.count_nonzero(remainders > cutoff_remainder))
+    tied = np.flatnonzero(remainders == cutoff_remainder)
+    plan.update({
+        "extra_cents": extra_cents,
+        "cutoff_remainder": cutoff_remainder,
+        "cutoff_index": int(tied[extra_cents - above - 1])
+    })
+    return plan
+
+
+def allocate(plan: dict, weights, start_index: int = 0) -> np.ndarray:
+    """Payouts in cents for a slice of the planned weights starting at position start_index"""
+    weights = np.asarray(weights, dtype=np.int64)
+    if plan["total_weight"] <= 0:
+        return np.zeros(weights.shape, dtype=np.int64)
+    scaled = plan["pot_cents"] * weights
+    remainders = scaled % plan["total_weight"]
+    positions = np.arange(start_index, start_index + weights.size)
+    extra = (remainders > plan["cutoff_remainder"]) | (
+        (remainders == plan["cutoff_remainder"]) & (positions <= plan["cutoff_index"])
+    )
+    return scaled // plan["total_weight"] + extra
+
+
+def allocate_cents(pot_cents: int, weights) -> np.ndarray:
+    """Payouts in cents for all weights; always sums exactly to pot_cents (unless all weights are 0)"""
+    return allocate(plan_payouts(pot_cents, weights), weights)
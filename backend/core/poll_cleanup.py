@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pymongo import ReplaceOne
+
+from core.config import CASCADE_BATCH_SIZE, CASCADE_PAUSE_SECONDS, INVOICE_EXPIRY_HOURS
+from core.database import db, run_in_transaction
+from core.image_store import UPLOAD_DIR, image_id_from_url, release
+
+logger = logging.getLogger(__name__)
+
+# Payment states after which an order can no longer turn into votes
+FINAL_PAYMENT_STATUSES = ["finished", "success", "failed", "expired", "refunded"]
+
+# Per-poll state removed once the poll is gone, in order; poll_settlements goes last so an
+# interrupted cascade still shows the settlement it is cleaning up after
+DELETED_COLLECTIONS = ["vote_events", "poll_vote_counters", "user_votes", "poll_settlements"]
+
+# Collections whose documents belong to a poll, checked by the orphan report. Ledger rows in
+# transactions are wallet history and stay after a poll is deleted, so they are reported apart.
+POLL_COLLECTIONS = DELETED_COLLECTIONS + ["orders"]
+
+_deletion_tasks = {}
+
+
+class DeletionBlocked(Exception):
+    """The poll cannot be deleted (yet); the message says why"""
+
+
+def pending_orders_query(poll_id: str) -> dict:
+    """Orders of the poll that can still turn into votes. Invoices abandoned in "waiting" past their
+    expiry can no longer be paid, so they do not hold the delete up."""
+    expired_before = (datetime.now(timezone.utc) - timedelta(hours=INVOICE_EXPIRY_HOURS)).isoformat()
+    return {
+        "poll_id": poll_id,
+        "payment_status": {"$nin": FINAL_PAYMENT_STATUSES},
+        "$nor": [{"payment_status": "waiting", "created_at": {"$lt": expired_before}}]
+    }
+
+
+async def deletion_blocker(poll: dict):
+    """Why the poll cannot be deleted yet, or None. Deleting must never strand money owed to voters."""
+    poll_id = poll["id"]
+    if poll.get("status") == "settling":
+        return "Poll is being settled; wait for its winnings to be paid out"
+    settlement = await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 0, "status": 1})
+    if settlement and settlement.get("status") != "completed":
+        return "Poll settlement has not completed; resume it before deleting the poll"
+    if poll.get("status") != "result_declared" and await db.user_votes.find_one({"poll_id": poll_id}, {"_id": 1}):
+        return "Poll has paid votes; declare its result so winnings are paid before deleting it"
+    if await db.orders.find_one(pending_orders_query(poll_id), {"_id": 1}):
+        return "Poll has payments in progress; wait for them to finish before deleting it"
+    return None
+
+
+async def start_poll_deletion(poll: dict, started_by: str = None) -> dict:
+    """Delete the poll document and record a cascade job for its dependents, atomically.
+
+    The poll first stops taking orders and votes, and only then are the blockers checked: an order
+    created between an earlier check and the delete would otherwise be removed by the cascade, and
+    its payment notification dropped. Raises DeletionBlocked, with the poll restored, if it can't go.
+    """
+    closed = await db.polls.update_one({"id": poll["id"], "status": poll["status"]}, {"$set": {"status": "deleting"}})
+    if closed.matched_count == 0:
+        raise DeletionBlocked("Poll changed while it was being deleted; try again")
+    job = {
+        "poll_id": poll["id"],
+        "title": poll.get("title"),
+        "image_url": poll.get("image_url"),
+        "status": "running",
+        "removed": {},
+        "archived_orders": 0,
+        "started_by": started_by,
+        "started_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    async def delete_poll(session):
+        await db.poll_deletions.replace_one({"poll_id": poll["id"]}, job, upsert=True, session=session)
+        await db.polls.delete_one({"id": poll["id"]}, session=session)
+
+    try:
+        blocker = await deletion_blocker(poll)
+        if blocker:
+            raise DeletionBlocked(blocker)
+        await run_in_transaction(delete_poll)
+    except Exception:
+        await db.polls.update_one({"id": poll["id"], "status": "deleting"}, {"$set": {"status": poll["status"]}})
+        raise
+    schedule_poll_deletion(poll["id"])
+    return job
+
+
+async def _delete_in_batches(collection, query: dict, batch_size: int, pause_seconds: float) -> int:
+    removed = 0
+    while True:
+        ids = [doc["_id"] for doc in await collection.find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)]
+        if not ids:
+            return removed
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        removed += result.deleted_count
+        # Throttle so a large poll's cascade never competes with live traffic for the database
+        await asyncio.sleep(pause_seconds)
+
+
+async def _archive_orders(poll_id: str, batch_size: int, pause_seconds: float) -> int:
+    """Move paid orders to archived_orders (payment records are kept); drop the rest"""
+    archived = 0
+    paid = {"poll_id": poll_id, "payment_status": {"$in": ["finished", "success"]}}
+    while True:
+        orders = await db.orders.find(paid).limit(batch_size).to_list(batch_size)
+        if not orders:
+            break
+        # Upsert by _id, so a batch repeated after a crash archives nothing twice
+        await db.archived_orders.bulk_write([ReplaceOne({"_id": order["_id"]}, order, upsert=True) for order in orders], ordered=False)
+        await db.orders.delete_many({"_id": {"$in": [order["_id"] for order in orders]}})
+        archived += len(orders)
+        await asyncio.sleep(pause_seconds)
+    await _delete_in_batches(db.orders, {"poll_id": poll_id}, batch_size, pause_seconds)
+    return archived
+
+
+async def run_poll_deletion(poll_id: str, batch_size: int = CASCADE_BATCH_SIZE, pause_seconds: float = CASCADE_PAUSE_SECONDS):
+    """Remove a deleted poll's dependents in throttled batches; safe to re-run after an interruption"""
+    job = await db.poll_deletions.find_one({"poll_id": poll_id}, {"_id": 0})
+    if not job or job["status"] != "running":
+        return
+    try:
+        archived = await _archive_orders(poll_id, batch_size, pause_seconds)
+        await db.poll_deletions.update_one({"poll_id": poll_id}, {"$inc": {"archived_orders": archived}})
+        for name in DELETED_COLLECTIONS:
+            removed = await _delete_in_batches(db[name], {"poll_id": poll_id}, batch_size, pause_seconds)
+            await db.poll_deletions.update_one({"poll_id": poll_id}, {"$inc": {f"removed.{name}": removed}})
+        await release(job.get("image_url"))
+    except Exception as e:
+        logger.error(f"Cascade delete of poll {poll_id} failed: {str(e)}")
+        await db.poll_deletions.update_one({"poll_id": poll_id}, {"$set": {"status": "failed", "error": str(e)}})
+        return
+
+    await db.poll_deletions.update_one(
+        {"poll_id": poll_id},
+        {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    logger.info(f"Cascade delete of poll {poll_id} completed")
+
+
+def schedule_poll_deletion(poll_id: str):
+    task = _deletion_tasks.get(poll_id)
+    if task and not task.done():
+        return task
+    task = asyncio.create_task(run_poll_deletion(poll_id))
+    _deletion_tasks[poll_id] = task
+    task.add_done_callback(lambda t: _deletion_tasks.pop(poll_id, None) if _deletion_tasks.get(poll_id) is t else None)
+    return task
+
+
+async def resume_poll_deletions():
+    """Restart cascades that were running when the previous process stopped"""
+    async for job in db.poll_deletions.find({"status": "running"}, {"_id": 0, "poll_id": 1}):
+        logger.info(f"Scheduling interrupted cascade delete of poll {job['poll_id']}")
+        schedule_poll_deletion(job["poll_id"])
+
+
+async def retry_poll_deletion(poll_id: str) -> dict:
+    """Re-arm a failed cascade, or start one for dependents of a poll deleted before cascades existed"""
+    if await db.polls.find_one({"id": poll_id}, {"_id": 1}):
+        return None
+    await db.poll_deletions.update_one(
+        {"poll_id": poll_id},
+        {
+            "$set": {"status": "running", "error": None},
+            "$setOnInsert": {"removed": {}, "archived_orders": 0, "started_at": datetime.now(timezone.utc).isoformat()}
+        },
+        upsert=True
+    )
+    schedule_poll_deletion(poll_id)
+    return await db.poll_deletions.find_one({"poll_id": poll_id}, {"_id": 0})
+
+
+def orphan_pipeline() -> list:
+    """Documents per poll_id whose poll no longer exists"""
+    return [
+        {"$match": {"poll_id": {"$type": "string"}}},
+        {"$group": {"_id": "$poll_id", "count": {"$sum": 1}}},
+        {"$lookup": {"from": "polls", "localField": "_id", "foreignField": "id", "as": "poll"}},
+        {"$match": {"poll": {"$size": 0}}},
+        # Archived polls still own their orders, settlements and ledger rows
+        {"$lookup": {"from": "archived_polls", "localField": "_id", "foreignField": "id", "as": "archived"}},
+        {"$match": {"archived": {"$size": 0}}},
+        {"$project": {"_id": 0, "poll_id": "$_id", "count": 1}}
+    ]
+
+
+def orphan_files(upload_dir: str, live_ids: set) -> dict:
+    """Upload and cached files whose image id no stored image or poll knows about"""
+    files = []
+    for directory in (upload_dir, os.path.join(upload_dir, "cache")):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            image_id = image_id_from_url(f"/api/uploads/{entry.name}")
+            if image_id and image_id not in live_ids:
+                files.append((os.path.relpath(entry.path, upload_dir), entry.stat().st_size))
+    return {"count": len(files), "bytes": sum(size for _, size in files), "sample": [name for name, _ in files[:50]]}
+
+
+async def orphan_report() -> dict:
+    """Dependents left behind by deleted polls, and upload files nothing references"""
+    in_progress = {job["poll_id"] async for job in db.poll_deletions.find({"status": "running"}, {"_id": 0, "poll_id": 1})}
+    collections = {}
+    orphaned_polls = set()
+    for name in POLL_COLLECTIONS + ["transactions"]:
+        rows = [row for row in await db[name].aggregate(orphan_pipeline()).to_list(None) if row["poll_id"] not in in_progress]
+        collections[name] = {"documents": sum(row["count"] for row in rows), "polls": len(rows)}
+        if name != "transactions":
+            orphaned_polls.update(row["poll_id"] for row in rows)
+
+    live_ids = {image["id"] async for image in db.images.find({}, {"_id": 0, "id": 1})}
+    for collection in (db.polls, db.archived_polls):
+        async for poll in collection.find({}, {"_id": 0, "image_url": 1}):
+            image_id = image_id_from_url(poll.get("image_url"))
+            if image_id:
+                live_ids.add(image_id)
+    files = await asyncio.to_thread(orphan_files, UPLOAD_DIR, live_ids)
+    unreferenced_images = await db.images.count_documents({"ref_count": {"$lte": 0}})
+
+    return {
+        "collections": collections,
+        "orphaned_poll_ids": sorted(orphaned_polls)[:100],
+        "cascades_in_progress": len(in_progress),
+        "files": files,
+        "unreferenced_images": unreferenced_images,
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
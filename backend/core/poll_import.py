@@ -0,0 +1,257 @@
+import asyncio
+import csv
+import ipaddress
+import json
+import logging
+import re
+import socket
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+import httpx
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from core.config import PUBLIC_BASE_URL, IMPORT_CHUNK_SIZE, IMPORT_IMAGE_WORKERS, IMAGE_MAX_UPLOAD_BYTES
+from core.database import db
+from core.image_store import spool, spool_path, remove_spool, ingest, find_image, image_id_from_url
+from core.images import variant_path
+from models.schemas import Poll
+
+logger = logging.getLogger(__name__)
+
+# Keep responses bounded however broken the file is
+MAX_REPORTED_ERRORS = 1000
+IMAGE_FETCH_TIMEOUT = 15
+MAX_IMAGE_REDIRECTS = 5
+CONTENT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class RowError(Exception):
+    """A row that cannot be imported, with a message for the report"""
+
+
+def build_poll_doc(poll: Poll, created_by: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "title": poll.title,
+        "description": poll.description,
+        "image_url": poll.image_url,
+        "options": [{"name": opt, "votes_count": 0, "total_amount": 0} for opt in poll.options],
+        "vote_price": poll.vote_price,
+        "end_datetime": poll.end_datetime,
+        "status": "active",
+        "winning_option": None,
+        "created_by": created_by,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+def parse_rows(lines, fmt: str):
+    """Yield (row number, raw dict) from CSV (header row; options separated by "|") or NDJSON lines"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            row.pop(None, None)  # cells beyond the header
+            if isinstance(row.get("options"), str):
+                row["options"] = [opt.strip() for opt in row["options"].split("|") if opt.strip()]
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, RowError(f"Invalid JSON: {e.msg}")
+            continue
+        if not isinstance(row, dict):
+            yield number, RowError("Each line must be a JSON object")
+            continue
+        yield number, row
+
+
+def validate_row(row) -> Poll:
+    if isinstance(row, RowError):
+        raise row
+    try:
+        return Poll(**row)
+    except ValidationError as e:
+        raise RowError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+
+def image_url_for(image_id: str) -> str:
+    # The same variant and width the upload endpoint hands out as default_url
+    return f"{PUBLIC_BASE_URL}{variant_path(image_id)}"
+
+
+async def host_addresses(host: str, port: int) -> list:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+async def check_public_url(url: httpx.URL):
+    """Refuse image URLs that resolve to loopback, private, link-local or other non-public addresses,
+    so an import can't be used to reach internal services from the server"""
+    if url.scheme not in ("http", "https") or not url.host:
+        raise RowError("Image URL must be http(s)")
+    try:
+        addresses = [url.host] if _is_ip(url.host) else await host_addresses(url.host, url.port or (443 if url.scheme == "https" else 80))
+    except socket.gaierror:
+        raise RowError(f"Image fetch failed: unknown host {url.host}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise RowError(f"Image URL host {url.host} is not a public address")
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+async def fetch_image(http: httpx.AsyncClient, url: str) -> tuple:
+    """Download an external image into the content-addressed store; returns (image id, deduplicated).
+
+    Redirects are followed here rather than by the client so every hop's host is checked.
+    """
+    path = spool_path()
+    try:
+        target = httpx.URL(url)
+        for _ in range(MAX_IMAGE_REDIRECTS + 1):
+            await check_public_url(target)
+            async with http.stream("GET", target) as response:
+                if response.is_redirect:
+                    target = response.next_request.url
+                    continue
+                if response.status_code != 200:
+                    raise RowError(f"Image fetch failed: HTTP {response.status_code}")
+                size, image_id = await spool(response.aiter_bytes(), path, IMAGE_MAX_UPLOAD_BYTES)
+                break
+        else:
+            raise RowError("Image fetch failed: too many redirects")
+        _, _, deduplicated = await ingest(path, image_id, size)
+        return image_id, deduplicated
+    except RowError:
+        raise
+    except httpx.HTTPError as e:
+        raise RowError(f"Image fetch failed: {type(e).__name__}")
+    except Exception as e:
+        raise RowError(f"Image rejected: {str(e) or type(e).__name__}")
+    finally:
+        remove_spool(path)
+
+
+class ImageResolver:
+    """Turns each row's image_url into a stored image, with at most `workers` fetches at once.
+
+    A bare 32-hex content id attaches an image already uploaded; with fetch=True an external
+    http(s) URL is downloaded, processed and stored, each distinct URL only once per import.
+    Anything else is kept as given.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, fetch: bool, workers: int = IMPORT_IMAGE_WORKERS):
+        self.http = http
+        self.fetch = fetch
+        self._semaphore = asyncio.Semaphore(workers)
+        self._fetches = {}
+        self.stats = Counter()
+
+    async def _fetch(self, url: str) -> str:
+        async with self._semaphore:
+            image_id, deduplicated = await fetch_image(self.http, url)
+        # Per distinct URL: "reused" when the downloaded content was already in the store
+        self.stats["reused" if deduplicated else "fetched"] += 1
+        return image_id
+
+    async def resolve(self, image_url: str) -> str:
+        value = image_url.strip()
+        if CONTENT_ID_PATTERN.match(value):
+            if not await find_image(value):
+                raise RowError(f"Unknown image id {value}")
+            self.stats["attached"] += 1
+            return image_url_for(value)
+        if not self.fetch or not value.startswith(("http://", "https://")) or image_id_from_url(value):
+            return image_url
+        if value not in self._fetches:
+            self._fetches[value] = asyncio.ensure_future(self._fetch(value))
+        image_id = await asyncio.shield(self._fetches[value])
+        return image_url_for(image_id)
+
+
+async def prepare_row(number: int, row, resolver: ImageResolver, created_by: str) -> dict:
+    poll = validate_row(row)
+    poll.image_url = await resolver.resolve(poll.image_url)
+    return build_poll_doc(poll, created_by)
+
+
+async def insert_chunk(docs: list, numbers: list, errors: list) -> int:
+    """insert_many one chunk (unordered); failed documents are reported by row"""
+    if not docs:
+        return 0
+    try:
+        result = await db.polls.insert_many(docs, ordered=False)
+        inserted = len(result.inserted_ids)
+    except BulkWriteError as e:
+        failed = {err["index"]: err["errmsg"] for err in e.details.get("writeErrors", [])}
+        for index, message in failed.items():
+            errors.append({"row": numbers[index], "error": f"Insert failed: {message}"})
+        inserted = e.details.get("nInserted", len(docs) - len(failed))
+        docs[:] = [doc for i, doc in enumerate(docs) if i not in failed]
+    # One counter update per stored image for the whole chunk
+    for image_id, count in Counter(image_id_from_url(doc["image_url"]) for doc in docs).items():
+        if image_id:
+            await db.images.update_one({"id": image_id}, {"$inc": {"ref_count": count}})
+    return inserted
+
+
+async def import_polls(lines, fmt: str, created_by: str, fetch_images: bool = False, dry_run: bool = False,
+                       chunk_size: int = IMPORT_CHUNK_SIZE, transport: httpx.AsyncBaseTransport = None) -> dict:
+    """Validate, resolve images for and insert polls from CSV/NDJSON lines, chunk by chunk"""
+    errors = []
+    received = 0
+    imported = 0
+    valid = 0
+    async with httpx.AsyncClient(timeout=IMAGE_FETCH_TIMEOUT, transport=transport) as http:
+        resolver = ImageResolver(http, fetch=fetch_images and not dry_run)
+        rows = parse_rows(lines, fmt)
+        while True:
+            chunk = []
+            for number, row in rows:
+                chunk.append((number, row))
+                if len(chunk) == chunk_size:
+                    break
+            if not chunk:
+                break
+            received += len(chunk)
+            # Images of a chunk are fetched concurrently (bounded by the resolver), rows stay in order
+            results = await asyncio.gather(
+                *(prepare_row(number, row, resolver, created_by) for number, row in chunk), return_exceptions=True
+            )
+            docs, numbers = [], []
+            for (number, _), result in zip(chunk, results):
+                if isinstance(result, RowError):
+                    errors.append({"row": number, "error": str(result)})
+                elif isinstance(result, Exception):
+                    logger.error(f"Poll import row {number} failed: {str(result)}")
+                    errors.append({"row": number, "error": "Unexpected error"})
+                else:
+                    docs.append(result)
+                    numbers.append(number)
+            valid += len(docs)
+            if not dry_run:
+                imported += await insert_chunk(docs, numbers, errors)
+
+    logger.info(f"Poll import by {created_by}: {received} rows, {imported} imported, {len(errors)} errors")
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "received": received,
+        "valid": valid,
+        "imported": imported,
+        "failed": len(errors),
+        "dry_run": dry_run,
+        "images": dict(resolver.stats),
+        "errors": errors[:MAX_REPORTED_ERRORS]
+    }
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from core.config import RECONCILE_CHUNK_SIZE, RECONCILE_PAUSE_SECONDS
+from core.database import db, run_in_transaction
+from core.payouts import to_cents
+from core.vote_counters import vote_counters, merge_counts
+
+logger = logging.getLogger(__name__)
+
+# Keep run documents bounded however broken the data is
+MAX_REPORTED_DISCREPANCIES = 1000
+
+# Polls whose counters feed (or fed) a payout are reported but never rewritten
+FROZEN_STATUSES = {"settling", "result_declared"}
+
+_running = {}
+
+
+def _group_by_option(value_field: str) -> dict:
+    return {"$group": {"_id": "$option_index", "votes": {"$sum": "$num_votes"}, "amount": {"$sum": value_field}}}
+
+
+def vote_totals_pipeline(poll_id: str) -> list:
+    return [{"$match": {"poll_id": poll_id}}, _group_by_option("$amount_paid")]
+
+
+def pending_event_totals_pipeline(poll_id: str) -> list:
+    return [{"$match": {"poll_id": poll_id, "compacted": False}}, _group_by_option("$amount")]
+
+
+def order_totals_pipeline(poll_id: str) -> list:
+    """Per-option totals of credited orders; basket orders are unwound into their lines"""
+    return [
+        {"$match": {
+            "poll_id": poll_id,
+            "refunded_to_wallet": {"$ne": True},
+            "$or": [{"votes_credited": True}, {"payment_status": {"$in": ["finished", "success"]}}]
+        }},
+        # Single-option orders have no lines and pass through the unwind with their own fields
+        {"$unwind": {"path": "$lines", "preserveNullAndEmptyArrays": True}},
+        {"$project": {field: {"$ifNull": [f"$lines.{field}", f"${field}"]}
+                      for field in ("option_index", "num_votes", "base_amount")}},
+        _group_by_option("$base_amount")
+    ]
+
+
+def _totals(rows: list) -> dict:
+    return {row["_id"]: (row["votes"], row["amount"]) for row in rows}
+
+
+def _add(a: dict, b: dict) -> dict:
+    return {k: (a.get(k, (0, 0))[0] + b.get(k, (0, 0))[0], a.get(k, (0, 0))[1] + b.get(k, (0, 0))[1]) for k in set(a) | set(b)}
+
+
+def compare_totals(poll_id: str, options: list, from_votes: dict, from_orders: dict) -> list:
+    """Discrepancies between the poll's counters, user_votes and credited orders, per option"""
+    discrepancies = []
+    for index, option in enumerate(options):
+        counter = (option.get("votes_count", 0), option.get("total_amount", 0))
+        votes = from_votes.get(index, (0, 0))
+        orders = from_orders.get(index, (0, 0))
+        counter_ok = counter[0] == votes[0] and to_cents(counter[1]) == to_cents(votes[1])
+        orders_ok = orders[0] == votes[0] and to_cents(orders[1]) == to_cents(votes[1])
+        if counter_ok and orders_ok:
+            continue
+        discrepancies.append({
+            "poll_id": poll_id,
+            "option_index": index,
+            "counter": {"votes": counter[0], "amount": round(counter[1], 2)},
+            "user_votes": {"votes": votes[0], "amount": round(votes[1], 2)},
+            "orders": {"votes": orders[0], "amount": round(orders[1], 2)},
+            "counter_mismatch": not counter_ok,
+            "orders_mismatch": not orders_ok
+        })
+    return discrepancies
+
+
+async def check_poll(poll: dict, session=None) -> list:
+    """Recompute a poll's per-option totals and compare them with its live counters"""
+    poll_id = poll["id"]
+    vote_rows = await db.user_votes.aggregate(vote_totals_pipeline(poll_id), session=session).to_list(None)
+    event_rows = await db.vote_events.aggregate(pending_event_totals_pipeline(poll_id), session=session).to_list(None)
+    order_rows = await db.orders.aggregate(order_totals_pipeline(poll_id), session=session).to_list(None)
+    # Events not yet compacted are in neither user_votes nor the counters; count them on the user_votes side
+    from_votes = _add(_totals(vote_rows), _totals(event_rows))
+    shards = (await vote_counters.rollup([poll_id], max_age=0, session=session))[poll_id]
+    options = merge_counts(poll.get("options", []), shards)
+    # Pending events are equally missing from the counters, so they must not count as drift
+    options = merge_counts(options, _totals(event_rows))
+    return compare_totals(poll_id, options, from_votes, _totals(order_rows))
+
+
+async def repair_poll(poll_id: str) -> list:
+    """Reset a poll's counters to its user_votes totals.
+
+    Runs in a transaction, so the totals and the poll document are read from one snapshot and a vote
+    landing meanwhile conflicts with the repair instead of being overwritten; the repair is then retried
+    on a fresh snapshot. Voting itself is never blocked.
+    """
+    await vote_counters.fold(poll_id)
+
+    async def reset_counters(session):
+        poll = await db.polls.find_one({"id": poll_id}, {"_id": 0}, session=session)
+        if not poll or poll.get("status") in FROZEN_STATUSES:
+            return []
+        discrepancies = [d for d in await check_poll(poll, session=session) if d["counter_mismatch"]]
+        if not discrepancies:
+            return []
+        poll_inc = {}
+        for d in discrepancies:
+            poll_inc[f"options.{d['option_index']}.votes_count"] = d["user_votes"]["votes"] - d["counter"]["votes"]
+            poll_inc[f"options.{d['option_index']}.total_amount"] = round(d["user_votes"]["amount"] - d["counter"]["amount"], 2)
+        await db.polls.update_one({"id": poll_id}, {"$inc": poll_inc}, session=session)
+        return discrepancies
+
+    discrepancies = await run_in_transaction(reset_counters)
+    if not discrepancies:
+        return []
+    logger.warning(f"Repaired vote counters of poll {poll_id}: {len(discrepancies)} option(s)")
+    return discrepancies
+
+
+async def run_reconciliation(run_id: str):
+    """Check every poll in throttled chunks, recording discrepancies (and repairs) on the run document"""
+    run = await db.reconciliation_runs.find_one({"id": run_id}, {"_id": 0})
+    last_poll_id = None
+    checked = 0
+    found = 0
+    repaired = 0
+    try:
+        while True:
+            query = {"id": {"$gt": last_poll_id}} if last_poll_id else {}
+            polls = await db.polls.find(query, {"_id": 0, "id": 1, "status": 1, "options": 1}).sort("id", 1).limit(run["chunk_size"]).to_list(run["chunk_size"])
+            if not polls:
+                break
+            reported = []
+            for poll in polls:
+                discrepancies = await check_poll(poll)
+                if discrepancies and run["repair"] and poll.get("status") not in FROZEN_STATUSES and any(d["counter_mismatch"] for d in discrepancies):
+                    try:
+                        if await repair_poll(poll["id"]):
+                            repaired += 1
+                            for d in discrepancies:
+                                d["repaired"] = d["counter_mismatch"]
+                    except Exception as e:
+                        logger.warning(f"Could not repair poll {poll['id']}, will retry on the next run: {str(e)}")
+                reported.extend(discrepancies)
+            checked += len(polls)
+            found += len(reported)
+            last_poll_id = polls[-1]["id"]
+            await db.reconciliation_runs.update_one(
+                {"id": run_id},
+                {
+                    "$set": {"polls_checked": checked, "discrepancy_count": found, "polls_repaired": repaired,
+                             "updated_at": datetime.now(timezone.utc).isoformat()},
+                    "$push": {"discrepancies": {"$each": reported, "$slice": MAX_REPORTED_DISCREPANCIES}}
+                }
+            )
+            # Throttle so a full pass never competes with live voting for the database
+            await asyncio.sleep(run["pause_seconds"])
+    except Exception as e:
+        logger.error(f"Reconciliation run {run_id} failed: {str(e)}")
+        await db.reconciliation_runs.update_one({"id": run_id}, {"$set": {"status": "failed", "error": str(e)}})
+        return
+
+    await db.reconciliation_runs.update_one(
+        {"id": run_id},
+        {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    logger.info(f"Reconciliation run {run_id}: {checked} polls checked, {found} discrepancies, {repaired} polls repaired")
+
+
+async def start_reconciliation(repair: bool = False, chunk_size: int = RECONCILE_CHUNK_SIZE,
+                               pause_seconds: float = RECONCILE_PAUSE_SECONDS, started_by: str = None) -> dict:
+    """Create a reconciliation run and execute it in the background"""
+    run = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "repair": repair,
+        "chunk_size": chunk_size,
+        "pause_seconds": pause_seconds,
+        "total_polls": await db.polls.count_documents({}),
+        "polls_checked": 0,
+        "discrepancy_count": 0,
+        "polls_repaired": 0,
+        "discrepancies": [],
+        "started_by": started_by,
+        "started_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.reconciliation_runs.insert_one(dict(run))
+    task = asyncio.create_task(run_reconciliation(run["id"]))
+    _running[run["id"]] = task
+    task.add_done_callback(lambda t: _running.pop(run["id"], None))
+    return run
@@ -0,0 +1,416 @@
+import asyncio
+import logging
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from pymongo import UpdateOne, ReturnDocument
+
+from core.database import db, run_in_transaction
+from core.config import SETTLEMENT_CHUNK_SIZE
+from core.vote_counters import vote_counters
+from core.vote_events import vote_event_log
+from core.payouts import plan_payouts, allocate, to_cents, cents_to_amount, per_vote_amount
+
+logger = logging.getLogger(__name__)
+
+VOTE_SETTLEMENT_FIELDS = {"_id": 1, "id": 1, "user_id": 1, "option_index": 1, "num_votes": 1}
+
+# Each process gets its own lease identity; a lease not renewed for this long can be taken over
+WORKER_ID = uuid.uuid4().hex
+SETTLEMENT_LEASE_SECONDS = 60
+
+_settlement_tasks = {}
+
+
+class StaleSettlement(Exception):
+    """The winning votes grew after the payout plan was fixed, so paying on would exceed the pot"""
+
+
+class LostLease(Exception):
+    """Another worker took the job over (this one stalled past its lease); its checkpoint is not ours to move"""
+
+
+def winning_weight(votes: list, winning_option_index: int) -> int:
+    return sum(vote["num_votes"] for vote in votes if vote["option_index"] == winning_option_index)
+
+
+def build_chunk_writes(votes: list, poll_id: str, winning_option_index: int, plan: dict, winner_offset: int, now: str):
+    """Turn one chunk of user_votes into bulk operations: vote results, wallet credits and ledger rows.
+
+    winner_offset is the number of winning votes in earlier chunks, i.e. this chunk's position in the payout plan.
+    """
+    winning = [vote for vote in votes if vote["option_index"] == winning_option_index]
+    payouts = allocate(plan, [vote["num_votes"] for vote in winning], start_index=winner_offset)
+    winning_cents = {vote["_id"]: int(cents) for vote, cents in zip(winning, payouts)}
+
+    vote_ops = []
+    wallet_credits = {}
+    transactions = []
+    for vote in votes:
+        if vote["_id"] in winning_cents:
+            winning_amount = cents_to_amount(winning_cents[vote["_id"]])
+            vote_ops.append(UpdateOne({"_id": vote["_id"]}, {"$set": {"result": "win", "winning_amount": winning_amount}}))
+            wallet_credits[vote["user_id"]] = wallet_credits.get(vote["user_id"], 0) + winning_cents[vote["_id"]]
+            transactions.append({
+                "id": str(uuid.uuid4()),
+                "user_id": vote["user_id"],
+                "type": "winning",
+                "amount": winning_amount,
+                "status": "completed",
+                "poll_id": poll_id,
+                "created_at": now
+            })
+        else:
+            vote_ops.append(UpdateOne({"_id": vote["_id"]}, {"$set": {"result": "loss"}}))
+
+    # One $inc per user per chunk, however many winning vote docs they have in it
+    user_ops = [UpdateOne({"id": user_id}, {"$inc": {"cash_wallet": cents_to_amount(cents)}}) for user_id, cents in wallet_credits.items()]
+    return vote_ops, user_ops, transactions
+
+
+async def iter_vote_chunks(poll_id: str, chunk_size: int, after_id=None, collection=None):
+    """Yield a poll's votes in _id order, chunk_size at a time, never holding more than one chunk"""
+    collection = collection if collection is not None else db.user_votes
+    while True:
+        # Keyset pagination on _id keeps every chunk an index range scan and makes checkpoints exact
+        query = {"poll_id": poll_id}
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        votes = await collection.find(query, VOTE_SETTLEMENT_FIELDS).sort("_id", 1).limit(chunk_size).to_list(chunk_size)
+        if not votes:
+            return
+        yield votes
+        after_id = votes[-1]["_id"]
+
+
+async def load_winning_weights(poll_id: str, winning_option_index: int) -> np.ndarray:
+    """Vote counts of the winning option's vote docs, in the _id order settlement processes them"""
+    weights = array("q")
+    cursor = db.user_votes.find(
+        {"poll_id": poll_id, "option_index": winning_option_index},
+        {"_id": 0, "num_votes": 1}
+    ).sort("_id", 1).batch_size(SETTLEMENT_CHUNK_SIZE)
+    async for vote in cursor:
+        weights.append(vote["num_votes"])
+    return np.frombuffer(weights, dtype=np.int64) if weights else np.zeros(0, dtype=np.int64)
+
+
+async def start_settlement(poll: dict, winning_option_index: int, chunk_size: int = SETTLEMENT_CHUNK_SIZE) -> dict:
+    """Mark the poll as settling, fix the payout for the poll and persist the settlement job.
+
+    The poll stops taking votes first, so the folds and weights below see every vote it will ever get.
+    If any of them fails there is no job to resume, so the poll goes back to its previous status.
+    """
+    await db.polls.update_one(
+        {"id": poll["id"]},
+        {"$set": {"status": "settling", "winning_option": winning_option_index}}
+    )
+    try:
+        # Pending vote events and sharded counters are folded into the poll document once no new votes can start
+        await vote_event_log.compact(poll["id"])
+        await vote_counters.fold(poll["id"])
+        settling_poll = await db.polls.find_one({"id": poll["id"]}, {"_id": 0})
+
+        pot_cents = to_cents(sum(option["total_amount"] for option in settling_poll["options"]))
+        # Whole-cent payouts are fixed up front so chunks (and resumed runs) pay exactly the pot between them
+        plan = plan_payouts(pot_cents, await load_winning_weights(poll["id"], winning_option_index))
+    except Exception:
+        await db.polls.update_one(
+            {"id": poll["id"], "status": "settling"},
+            {"$set": {"status": poll["status"], "winning_option": poll.get("winning_option")}}
+        )
+        raise
+
+    settlement = {
+        "poll_id": poll["id"],
+        "winning_option": winning_option_index,
+        "per_vote_winning": per_vote_amount(pot_cents, plan["total_weight"]),
+        "payout_plan": plan,
+        "chunk_size": chunk_size,
+        "total_votes": await db.user_votes.count_documents({"poll_id": poll["id"]}),
+        "last_vote_id": None,
+        "processed_votes": 0,
+        "winners": 0,
+        "winning_weight": 0,
+        "distributed_cents": 0,
+        "total_distributed": 0,
+        "status": "running",
+        "error": None,
+        "lease_owner": None,
+        "lease_until": None,
+        "started_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.poll_settlements.replace_one({"poll_id": poll["id"]}, settlement, upsert=True)
+    return settlement
+
+
+async def _claim_settlement(poll_id: str):
+    """Take the job lease so only one worker process settles a poll at a time"""
+    now = datetime.now(timezone.utc)
+    return await db.poll_settlements.find_one_and_update(
+        {
+            "poll_id": poll_id,
+            "status": "running",
+            "$or": [
+                {"lease_owner": WORKER_ID},
+                {"lease_until": None},
+                {"lease_until": {"$lt": now.isoformat()}}
+            ]
+        },
+        {"$set": {
+            "lease_owner": WORKER_ID,
+            "lease_until": (now + timedelta(seconds=SETTLEMENT_LEASE_SECONDS)).isoformat(),
+            "run_started_at": now.isoformat()
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def run_settlement(poll_id: str):
+    """Process a running settlement job from its last checkpoint to completion"""
+    while True:
+        settlement = await _claim_settlement(poll_id)
+        if settlement:
+            break
+        current = await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 0, "status": 1, "lease_until": 1})
+        if not current or current["status"] != "running":
+            return current
+        # Another worker holds the lease; take over only if it stops renewing it
+        await asyncio.sleep(SETTLEMENT_LEASE_SECONDS / 4)
+
+    if settlement["processed_votes"]:
+        logger.info(f"Resuming settlement of poll {poll_id} after {settlement['processed_votes']} votes")
+
+    winning_option_index = settlement["winning_option"]
+    plan = settlement["payout_plan"]
+    last_vote_id = settlement["last_vote_id"]
+    processed = settlement["processed_votes"]
+    winners = settlement["winners"]
+    distributed_cents = settlement["distributed_cents"]
+    # None for jobs started before the weight was tracked
+    paid_weight = settlement.get("winning_weight")
+
+    try:
+        async for votes in iter_vote_chunks(poll_id, settlement["chunk_size"], after_id=last_vote_id):
+            # Vote credits refuse polls that are no longer active; this guards the plan against any vote
+            # that still slipped in. Weights only grow, so a late vote always shows up as an excess here,
+            # and the job stops before paying the chunk
+            if paid_weight is not None:
+                paid_weight += winning_weight(votes, winning_option_index)
+                if paid_weight > plan["total_weight"]:
+                    raise StaleSettlement(
+                        f"Winning votes exceed the {plan['total_weight']} planned when settlement started; "
+                        "votes were added after the poll closed"
+                    )
+            now = datetime.now(timezone.utc)
+            vote_ops, user_ops, transactions = build_chunk_writes(votes, poll_id, winning_option_index, plan, winners, now.isoformat())
+            previous_vote_id = last_vote_id
+            last_vote_id = votes[-1]["_id"]
+            processed += len(votes)
+            winners += len(transactions)
+            distributed_cents += sum(to_cents(txn["amount"]) for txn in transactions)
+
+            checkpoint = {
+                "last_vote_id": last_vote_id,
+                "processed_votes": processed,
+                "winners": winners,
+                "winning_weight": paid_weight,
+                "distributed_cents": distributed_cents,
+                "total_distributed": cents_to_amount(distributed_cents),
+                "updated_at": now.isoformat(),
+                "lease_until": (now + timedelta(seconds=SETTLEMENT_LEASE_SECONDS)).isoformat()
+            }
+
+            # Results, wallet credits, ledger rows and the checkpoint commit together, so a crash never
+            # leaves a chunk half-applied and a resumed run never pays the same vote twice. A write
+            # conflict (e.g. a winner's wallet being debited meanwhile) retries the chunk, not the job
+            async def commit_chunk(session):
+                # The checkpoint moves only from the one this worker read, under its own lease; a worker
+                # that stalled and was taken over aborts here instead of paying the chunk a second time
+                moved = await db.poll_settlements.update_one(
+                    {"poll_id": poll_id, "status": "running", "lease_owner": WORKER_ID, "last_vote_id": previous_vote_id},
+                    {"$set": checkpoint},
+                    session=session
+                )
+                if moved.matched_count == 0:
+                    raise LostLease(f"Settlement of poll {poll_id} was taken over by another worker")
+                await db.user_votes.bulk_write(vote_ops, ordered=True, session=session)
+                if user_ops:
+                    await db.users.bulk_write(user_ops, ordered=True, session=session)
+                if transactions:
+                    await db.transactions.insert_many(transactions, ordered=True, session=session)
+
+            await run_in_transaction(commit_chunk)
+        completed_at = datetime.now(timezone.utc).isoformat()
+
+        # The job and the poll finish together, so a crash can't leave a completed job behind a
+        # poll that is still settling
+        async def complete(session):
+            finished = await db.poll_settlements.update_one(
+                {"poll_id": poll_id, "status": "running", "lease_owner": WORKER_ID, "last_vote_id": last_vote_id},
+                {"$set": {"status": "completed", "completed_at": completed_at, "lease_owner": None, "lease_until": None}},
+                session=session
+            )
+            if finished.matched_count == 0:
+                raise LostLease(f"Settlement of poll {poll_id} was taken over by another worker")
+            await declare_result(poll_id, winning_option_index, completed_at, session=session)
+
+        await run_in_transaction(complete)
+    except LostLease as e:
+        # The worker that holds the lease now carries on from the checkpoint; nothing of ours was committed
+        logger.warning(str(e))
+        return await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 0})
+    except Exception as e:
+        logger.error(f"Settlement of poll {poll_id} failed after {processed} votes: {str(e)}")
+        await db.poll_settlements.update_one(
+            {"poll_id": poll_id, "status": "running", "lease_owner": WORKER_ID},
+            {"$set": {"status": "failed", "error": str(e), "lease_owner": None, "lease_until": None}}
+        )
+        raise
+
+    logger.info(f"Settled poll {poll_id}: {processed} votes, {winners} winners")
+    return await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 0})
+
+
+async def declare_result(poll_id: str, winning_option_index: int, declared_at: str, session=None):
+    await db.polls.update_one(
+        {"id": poll_id},
+        {"$set": {
+            "status": "result_declared",
+            "winning_option": winning_option_index,
+            "result_declared_at": declared_at
+        }},
+        session=session
+    )
+
+
+async def prepare_settlement(poll: dict, winning_option_index: int, chunk_size: int = SETTLEMENT_CHUNK_SIZE) -> dict:
+    """Create the settlement job, or re-arm an interrupted/failed one so it resumes from its checkpoint"""
+    settlement = None
+    if poll["status"] == "settling":
+        settlement = await db.poll_settlements.find_one({"poll_id": poll["id"]}, {"_id": 0})
+    if not settlement:
+        return await start_settlement(poll, winning_option_index, chunk_size)
+    if settlement["status"] == "completed":
+        # Paid out, but the poll never got its result (a crash before completion was one transaction)
+        await declare_result(poll["id"], settlement["winning_option"], settlement.get("completed_at"))
+        return settlement
+    if settlement["status"] == "failed":
+        await db.poll_settlements.update_one(
+            {"poll_id": poll["id"]},
+            {"$set": {"status": "running", "error": None, "chunk_size": chunk_size}}
+        )
+        settlement.update({"status": "running", "error": None, "chunk_size": chunk_size})
+    return settlement
+
+
+async def settle_poll(poll: dict, winning_option_index: int, chunk_size: int = SETTLEMENT_CHUNK_SIZE) -> dict:
+    """Settle a poll inline (used by scripts); the API schedules run_settlement in the background instead"""
+    await prepare_settlement(poll, winning_option_index, chunk_size)
+    return await run_settlement(poll["id"])
+
+
+def schedule_settlement(poll_id: str):
+    """Run the settlement job in the background unless this process is already running it"""
+    task = _settlement_tasks.get(poll_id)
+    if task and not task.done():
+        return task
+    task = asyncio.create_task(run_settlement(poll_id))
+    _settlement_tasks[poll_id] = task
+    task.add_done_callback(lambda t: _settlement_tasks.pop(poll_id, None) if _settlement_tasks.get(poll_id) is t else None)
+    return task
+
+
+async def resume_settlement_jobs():
+    """Restart settlements that were running when the previous process stopped"""
+    async for job in db.poll_settlements.find({"status": "running"}, {"_id": 0, "poll_id": 1}):
+        logger.info(f"Scheduling interrupted settlement of poll {job['poll_id']}")
+        schedule_settlement(job["poll_id"])
+    async for poll in db.polls.find({"status": "settling"}, {"_id": 0, "id": 1}):
+        job = await db.poll_settlements.find_one({"poll_id": poll["id"], "status": "completed"}, {"_id": 0})
+        if job:
+            logger.info(f"Declaring the result of poll {poll['id']}, whose settlement completed")
+            await declare_result(poll["id"], job["winning_option"], job.get("completed_at"))
+
+
+def settlement_progress(settlement: dict) -> dict:
+    """Public view of a settlement job: counts, percentage and ETA"""
+    total = settlement.get("total_votes") or 0
+    processed = settlement.get("processed_votes", 0)
+    eta_seconds = None
+    votes_per_second = None
+    if settlement.get("status") == "running" and settlement.get("run_started_at") and settlement.get("updated_at"):
+        elapsed = (datetime.fromisoformat(settlement["updated_at"]) - datetime.fromisoformat(settlement["run_started_at"])).total_seconds()
+        if elapsed > 0 and processed:
+            votes_per_second = processed / elapsed
+            eta_seconds = round(max(total - processed, 0) / votes_per_second, 1)
+    return {
+        "poll_id": settlement["poll_id"],
+        "status": settlement.get("status"),
+        "winning_option": settlement.get("winning_option"),
+        "processed": processed,
+        "total": total,
+        "percent": round(processed * 100 / total, 1) if total else 100.0,
+        "winners": settlement.get("winners", 0),
+        "total_distributed": settlement.get("total_distributed", 0),
+        "votes_per_second": round(votes_per_second, 1) if votes_per_second else None,
+        "eta_seconds": eta_seconds,
+        "error": settlement.get("error"),
+        "started_at": settlement.get("started_at"),
+        "completed_at": settlement.get("completed_at")
+    }
+
+
+def settlement_preview_pipeline(poll_id: str, top: int) -> list:
+    """Per-option winners, vote totals and biggest voters for every candidate winning option in one pass"""
+    return [
+        {"$match": {"poll_id": poll_id}},
+        {"$group": {
+            "_id": {"option_index": "$option_index", "user_id": "$user_id"},
+            "num_votes": {"$sum": "$num_votes"}
+        }},
+        {"$group": {
+            "_id": "$_id.option_index",
+            "winners": {"$sum": 1},
+            "winning_votes": {"$sum": "$num_votes"},
+            "top": {"$topN": {
+                "n": top,
+                "sortBy": {"num_votes": -1, "_id.user_id": 1},
+                "output": {"user_id": "$_id.user_id", "num_votes": "$num_votes"}
+            }}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+def summarize_preview(poll: dict, groups: list) -> dict:
+    """Turn the preview aggregation into payouts, using the same pot and whole-cent rules as settlement"""
+    pot_cents = to_cents(sum(option["total_amount"] for option in poll["options"]))
+    by_option = {group["_id"]: group for group in groups}
+    options = []
+    for index, option in enumerate(poll["options"]):
+        group = by_option.get(index, {"winners": 0, "winning_votes": 0, "top": []})
+        winning_votes = group["winning_votes"]
+        options.append({
+            "option_index": index,
+            "option_name": option["name"],
+            "winners": group["winners"],
+            "winning_votes": winning_votes,
+            "per_vote_payout": per_vote_amount(pot_cents, winning_votes),
+            "total_distributed": cents_to_amount(pot_cents) if winning_votes > 0 else 0,
+            # Floor of the exact share; largest-remainder allocation may add up to a cent per vote doc
+            "top_payouts": [
+                {"user_id": entry["user_id"], "num_votes": entry["num_votes"],
+                 "payout": cents_to_amount(pot_cents * entry["num_votes"] // winning_votes)}
+                for entry in group["top"]
+            ]
+        })
+    return {"poll_id": poll["id"], "total_amount_collected": cents_to_amount(pot_cents), "options": options}
+
+
+async def preview_settlement(poll: dict, top: int = 10) -> dict:
+    """Payout preview for every option without writing anything"""
+    groups = await db.user_votes.aggregate(settlement_preview_pipeline(poll["id"], top), allowDiskUse=True).to_list(None)
+    return summarize_preview(poll, groups)
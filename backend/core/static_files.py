@@ -0,0 +1,134 @@
+import os
+import re
+import stat
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+# Files written by upload_image / the variant cache: named after the upload's id and never rewritten
+IMMUTABLE_NAME_PATTERN = re.compile(r"^[0-9a-f-]{1,36}_\w+\.(webp|jpeg|avif)$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def strong_etag(path: str, stat_result: os.stat_result) -> str:
+    """Strong validator for a served file.
+
+    Content-named files get an ETag from their name and size, identical on every replica; anything
+    else falls back to size and mtime in nanoseconds.
+    """
+    name = os.path.basename(path)
+    if IMMUTABLE_NAME_PATTERN.match(name):
+        return f'"{name}-{stat_result.st_size:x}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int):
+    """(start, end) inclusive for a single "bytes=" range, None to serve the whole file, or "invalid".
+
+    Multiple ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+class UploadFileResponse(FileResponse):
+    """FileResponse with strong ETags, conditional requests, single byte ranges and zero-copy sends.
+
+    Body transfer prefers the ASGI zero-copy extension (sendfile on an open descriptor), then
+    pathsend, then plain chunked reads, depending on what the server advertises in scope["extensions"].
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path, stat_result: os.stat_result = None, cache_control: str = None, **kwargs):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        if cache_control is None and IMMUTABLE_NAME_PATTERN.match(os.path.basename(str(path))):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        if cache_control:
+            self.headers["cache-control"] = cache_control
+        self.headers["accept-ranges"] = "bytes"
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        super().set_stat_headers(stat_result)
+        self.headers["etag"] = strong_etag(str(self.path), stat_result)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self.stat_result is None:
+            try:
+                self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            if not stat.S_ISREG(self.stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.set_stat_headers(self.stat_result)
+
+        request_headers = Headers(scope=scope)
+        etag = self.headers["etag"]
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+            headers = {k: v for k, v in self.headers.items() if k in ("etag", "cache-control", "last-modified", "accept-ranges", "vary")}
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+
+        size = self.stat_result.st_size
+        start, end = 0, size - 1
+        byte_range = None
+        range_header = request_headers.get("range")
+        # If-Range: only honour the range if the client's copy is still this exact file
+        if range_header and request_headers.get("if-range", etag) == etag:
+            byte_range = parse_range(range_header, size)
+        if byte_range == "invalid":
+            await Response(status_code=416, headers={"content-range": f"bytes */{size}"})(scope, receive, send)
+            return
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        extensions = scope.get("extensions") or {}
+        if scope["method"].upper() == "HEAD" or size == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopy" in extensions:
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopy", "file": file, "offset": start,
+                            "count": end - start + 1, "more_body": False})
+        elif "http.response.pathsend" in extensions and byte_range is None:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0 and bool(chunk)})
+                    if not chunk:
+                        break
+        if self.background is not None:
+            await self.background()
+
+
+class UploadFiles(StaticFiles):
+    """StaticFiles serving uploads through UploadFileResponse"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        # Conditional and range handling happen in the response itself
+        return UploadFileResponse(full_path, stat_result=stat_result, status_code=status_code)
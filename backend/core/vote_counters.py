@@ -0,0 +1,131 @@
+import logging
+import random
+import time
+
+from core.config import VOTE_COUNTER_SHARDS, VOTE_COUNTER_CACHE_SECONDS
+from core.database import db, run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+
+def shard_id(poll_id: str, option_index: int, shard: int) -> str:
+    return f"{poll_id}:{option_index}:{shard}"
+
+
+def merge_counts(options: list, totals: dict) -> list:
+    """Options with the sharded {option_index: (votes, amount)} totals added to the poll document's own counts"""
+    merged = []
+    for index, option in enumerate(options):
+        votes, amount = totals.get(index, (0, 0))
+        merged.append({
+            **option,
+            "votes_count": option.get("votes_count", 0) + votes,
+            "total_amount": round(option.get("total_amount", 0) + amount, 2)
+        })
+    return merged
+
+
+class VoteCounters:
+    """Poll option counters, optionally spread over K shard documents per option.
+
+    With shards=0 every increment is an $inc on the poll document itself. With shards=K an increment
+    lands on one of K poll_vote_counters documents picked at random, so concurrent votes on a hot
+    poll stop conflicting on a single document; reads add a cached rollup of the shards to the poll's
+    own counts, and fold() moves the shard totals back into the poll document (done before settlement).
+    """
+
+    def __init__(self, shards: int = VOTE_COUNTER_SHARDS, cache_seconds: float = VOTE_COUNTER_CACHE_SECONDS,
+                 clock=time.monotonic):
+        self.shards = shards
+        self.cache_seconds = cache_seconds
+        self.clock = clock
+        self._rollups = {}
+
+    @property
+    def sharded(self) -> bool:
+        return self.shards > 0
+
+    async def increment(self, poll_id: str, lines: list, session=None):
+        """Add each line's num_votes / base_amount to its option's counters"""
+        if not self.sharded:
+            poll_inc = {}
+            for line in lines:
+                poll_inc[f"options.{line['option_index']}.votes_count"] = line["num_votes"]
+                poll_inc[f"options.{line['option_index']}.total_amount"] = line["base_amount"]
+            await db.polls.update_one({"id": poll_id}, {"$inc": poll_inc}, session=session)
+            return
+
+        shard = random.randrange(self.shards)
+        for line in lines:
+            await db.poll_vote_counters.update_one(
+                {"_id": shard_id(poll_id, line["option_index"], shard)},
+                {
+                    "$inc": {"votes_count": line["num_votes"], "total_amount": line["base_amount"]},
+                    "$setOnInsert": {"poll_id": poll_id, "option_index": line["option_index"], "shard": shard}
+                },
+                upsert=True,
+                session=session
+            )
+
+    async def rollup(self, poll_ids: list, max_age: float = None, session=None) -> dict:
+        """{poll_id: {option_index: (votes, amount)}} summed over shards, served from cache when fresh enough"""
+        max_age = self.cache_seconds if max_age is None else max_age
+        now = self.clock()
+        result = {}
+        missing = []
+        for poll_id in poll_ids:
+            cached = self._rollups.get(poll_id)
+            if cached and now - cached[0] <= max_age:
+                result[poll_id] = cached[1]
+            else:
+                missing.append(poll_id)
+        if not missing:
+            return result
+
+        fresh = {poll_id: {} for poll_id in missing}
+        pipeline = [
+            {"$match": {"poll_id": {"$in": missing}}},
+            {"$group": {
+                "_id": {"poll_id": "$poll_id", "option_index": "$option_index"},
+                "votes_count": {"$sum": "$votes_count"},
+                "total_amount": {"$sum": "$total_amount"}
+            }}
+        ]
+        async for row in db.poll_vote_counters.aggregate(pipeline, session=session):
+            fresh[row["_id"]["poll_id"]][row["_id"]["option_index"]] = (row["votes_count"], row["total_amount"])
+        for poll_id, totals in fresh.items():
+            self._rollups[poll_id] = (now, totals)
+        result.update(fresh)
+        return result
+
+    async def apply(self, polls: list, max_age: float = None) -> list:
+        """Fill in live option counts on poll documents (in place) with one rollup query for all of them"""
+        if not self.sharded or not polls:
+            return polls
+        rollups = await self.rollup([poll["id"] for poll in polls], max_age=max_age)
+        for poll in polls:
+            if rollups.get(poll["id"]):
+                poll["options"] = merge_counts(poll.get("options", []), rollups[poll["id"]])
+        return polls
+
+    async def fold(self, poll_id: str):
+        """Move a poll's shard totals into the poll document, atomically"""
+        async def move_totals(session):
+            totals = (await self.rollup([poll_id], max_age=0, session=session))[poll_id]
+            if not totals:
+                return False
+            poll_inc = {}
+            for option_index, (votes, amount) in totals.items():
+                poll_inc[f"options.{option_index}.votes_count"] = votes
+                poll_inc[f"options.{option_index}.total_amount"] = amount
+            await db.polls.update_one({"id": poll_id}, {"$inc": poll_inc}, session=session)
+            await db.poll_vote_counters.delete_many({"poll_id": poll_id}, session=session)
+            return True
+
+        if not await run_in_transaction(move_totals):
+            return
+        self._rollups.pop(poll_id, None)
+        logger.info(f"Folded sharded vote counters of poll {poll_id}")
+
+
+vote_counters = VoteCounters()
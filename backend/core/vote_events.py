@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+
+from core.config import VOTE_EVENTS_DEFERRED, VOTE_EVENT_COMPACTION_BATCH, VOTE_EVENT_COMPACTION_INTERVAL
+from core.database import db, run_in_transaction
+from core.vote_counters import vote_counters
+
+logger = logging.getLogger(__name__)
+
+
+class PollClosed(Exception):
+    """The poll stopped taking votes (settling, result declared, archived or deleted)"""
+
+
+class ConcurrentCompaction(Exception):
+    """Another compactor claimed some of the batch's events first; they are its to apply"""
+
+
+async def claim_active_poll(poll_id: str, session=None):
+    """Raise PollClosed unless the poll is active, with a write to the poll document.
+
+    A plain read would not conflict with settlement's status change, and with sharded counters or
+    deferred events nothing else in a vote transaction writes the poll document, so a vote that read
+    "active" could still commit after the weights were fixed. The conditional $inc makes the two
+    transactions conflict: whichever commits second is retried and sees the new status.
+    """
+    taken = await db.polls.update_one({"id": poll_id, "status": "active"}, {"$inc": {"vote_seq": 1}}, session=session)
+    if taken.matched_count == 0:
+        raise PollClosed(poll_id)
+
+
+async def record_user_vote(user_id: str, poll_id: str, line: dict, payment_id: str, session=None):
+    """Add a vote line to the user's per-option summary in user_votes, creating it on the first vote.
+
+    One upsert round trip; the unique (user_id, poll_id, option_index) index makes concurrent first
+    votes converge on a single document instead of inserting duplicates.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    update = {
+        "$inc": {"num_votes": line["num_votes"], "amount_paid": line["base_amount"]},
+        "$set": {"updated_at": now},
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "payment_id": payment_id,
+            "payment_status": "success",
+            "result": "pending",
+            "winning_amount": 0,
+            "voted_at": now
+        }
+    }
+    query = {"user_id": user_id, "poll_id": poll_id, "option_index": line["option_index"]}
+    try:
+        await db.user_votes.update_one(query, update, upsert=True, session=session)
+    except DuplicateKeyError:
+        # Two upserts raced to insert; the loser's retry now matches the winner's document.
+        # Inside a transaction the error aborts it instead and the whole finalization is retried
+        # (IPN redelivery, the next /verify poll).
+        if session is not None:
+            raise
+        await db.user_votes.update_one(query, update, upsert=True)
+
+
+def fold_events(events: list):
+    """Sum a batch of events into per-poll option lines and per-(user, poll, option) summary lines"""
+    poll_lines = {}
+    user_lines = {}
+    for event in events:
+        option = poll_lines.setdefault(event["poll_id"], {}).setdefault(
+            event["option_index"], {"option_index": event["option_index"], "num_votes": 0, "base_amount": 0}
+        )
+        option["num_votes"] += event["num_votes"]
+        option["base_amount"] += event["amount"]
+
+        key = (event["user_id"], event["poll_id"], event["option_index"])
+        if key not in user_lines:
+            user_lines[key] = {"option_index": event["option_index"], "num_votes": 0, "base_amount": 0, "payment_id": event["order_id"]}
+        user_lines[key]["num_votes"] += event["num_votes"]
+        user_lines[key]["base_amount"] += event["amount"]
+    return {poll_id: list(options.values()) for poll_id, options in poll_lines.items()}, user_lines
+
+
+class VoteEventLog:
+    """Append-only log of finalized votes, with a compaction worker for deferred counter updates.
+
+    Every finalized order appends one vote_events document per option line. By default the event is
+    written already compacted and the caller updates user_votes and the poll counters itself, so the
+    log is pure history. With deferred=True finalization only appends the event; the worker folds
+    pending events into poll counters and user_votes summaries in batches, one transaction per batch.
+    """
+
+    def __init__(self, deferred: bool = VOTE_EVENTS_DEFERRED, batch_size: int = VOTE_EVENT_COMPACTION_BATCH,
+                 interval: float = VOTE_EVENT_COMPACTION_INTERVAL):
+        self.deferred = deferred
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task = None
+
+    async def append(self, order: dict, lines: list, payment_method: str, session=None):
+        now = datetime.now(timezone.utc).isoformat()
+        events = [{
+            "id": str(uuid.uuid4()),
+            "order_id": order["id"],
+            "user_id": order["user_id"],
+            "poll_id": order["poll_id"],
+            "option_index": line["option_index"],
+            "num_votes": line["num_votes"],
+            "amount": line["base_amount"],
+            "payment_method": payment_method,
+            "created_at": now,
+            "compacted": not self.deferred
+        } for line in lines]
+        await db.vote_events.insert_many(events, ordered=True, session=session)
+
+    async def compact_batch(self, poll_id: str = None) -> int:
+        """Apply one batch of pending events; returns how many were compacted.
+
+        Without a poll_id (the background worker) only polls still taking votes are folded; the events
+        left on a poll that closed are folded by its settlement, which passes the poll_id.
+        """
+        query = {"compacted": False}
+        if poll_id is not None:
+            query["poll_id"] = poll_id
+        else:
+            pending = await db.vote_events.distinct("poll_id", {"compacted": False})
+            if not pending:
+                return 0
+            query["poll_id"] = {"$in": await db.polls.distinct("id", {"id": {"$in": pending}, "status": "active"})}
+        events = await db.vote_events.find(query).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+        if not events:
+            return 0
+
+        poll_lines, user_lines = fold_events(events)
+
+        async def apply_batch(session):
+            if poll_id is None:
+                for event_poll_id in poll_lines:
+                    await claim_active_poll(event_poll_id, session=session)
+            # Claim the batch first: a concurrent compactor that got some of these events aborts us here
+            claimed = await db.vote_events.update_many(
+                {"_id": {"$in": [event["_id"] for event in events]}, "compacted": False},
+                {"$set": {"compacted": True, "compacted_at": datetime.now(timezone.utc).isoformat()}},
+                session=session
+            )
+            if claimed.modified_count != len(events):
+                raise ConcurrentCompaction("Vote events were compacted concurrently")
+            for (user_id, event_poll_id, _), line in user_lines.items():
+                await record_user_vote(user_id, event_poll_id, line, line["payment_id"], session=session)
+            for event_poll_id, lines in poll_lines.items():
+                await vote_counters.increment(event_poll_id, lines, session=session)
+
+        await run_in_transaction(apply_batch)
+        return len(events)
+
+    async def compact(self, poll_id: str = None) -> int:
+        """Compact until no pending events remain (for one poll, or all of them)"""
+        total = 0
+        while True:
+            try:
+                count = await self.compact_batch(poll_id)
+            except PollClosed as e:
+                # Closed after the batch was picked; the next batch leaves it to its settlement
+                logger.info(f"Poll {e} stopped taking votes; leaving its events to settlement")
+                continue
+            except ConcurrentCompaction:
+                # Nothing of ours was applied; the next batch skips what the other compactor took
+                continue
+            total += count
+            if count < self.batch_size:
+                return total
+
+    async def _run(self):
+        while True:
+            try:
+                count = await self.compact()
+                if count:
+                    logger.info(f"Compacted {count} vote events")
+            except Exception as e:
+                logger.error(f"Vote event compaction failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        # Events are written already compacted unless deferred, so there is nothing to poll for
+        if self._task is None and self.deferred:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def poll_totals(self, poll_id: str) -> dict:
+        """{option_index: (votes, amount)} rebuilt from the log alone, for checking or repairing counters"""
+        pipeline = [
+            {"$match": {"poll_id": poll_id}},
+            {"$group": {"_id": "$option_index", "votes": {"$sum": "$num_votes"}, "amount": {"$sum": "$amount"}}}
+        ]
+        return {row["_id"]: (row["votes"], row["amount"]) async for row in db.vote_events.aggregate(pipeline)}
+
+
+vote_event_log = VoteEventLog()
@@ -32,6 +32,18 @@ class VoteRequest(BaseModel):
     poll_id: str
     option_index: int
     num_votes: int
+    pay_currency: Optional[str] = None
+
+
+class BasketLine(BaseModel):
+    option_index: int
+    num_votes: int
+
+
+class BasketOrderRequest(BaseModel):
+    poll_id: str
+    lines: List[BasketLine]
+    pay_currency: Optional[str] = None
 
 
 class KYCSubmit(BaseModel):
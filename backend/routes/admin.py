@@ -1,19 +1,36 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
+import asyncio
+import csv
+import json
 import uuid
 from datetime import datetime, timezone
 import logging
-import os
-import aiofiles
-from PIL import Image
-import io
+from PIL import UnidentifiedImageError
 
 from core.database import db
+from core.config import SETTLEMENT_CHUNK_SIZE, RECONCILE_CHUNK_SIZE, RECONCILE_PAUSE_SECONDS, IMAGE_MAX_UPLOAD_BYTES, IMPORT_MAX_BYTES
+from core.gateway import gateway
+from core.settlement import prepare_settlement, schedule_settlement, settlement_progress, preview_settlement
 from core.security import get_admin_user, verify_password, create_access_token, get_password_hash
+from core.vote_counters import vote_counters
+from core.reconciliation import start_reconciliation
+from core.archive import archiver, find_poll, votes_collection
+from core.poll_import import build_poll_doc, import_polls
+from core.exports import (
+    EXPORT_FORMATS, stream_export, export_filename,
+    users_query, USERS_SORT, transactions_query, orders_query, withdrawals_query,
+    enrich_transactions, enrich_orders
+)
+from core.poll_cleanup import DeletionBlocked, deletion_blocker, start_poll_deletion, retry_poll_deletion, orphan_report
+from core.images import IMAGE_VARIANTS, DEFAULT_VARIANT, ImageTooLarge, variant_path
+from core.image_store import variant_cache, spool, spool_path, remove_spool, ingest, acquire, release, UploadTooLarge
+from routes.payments import process_successful_payment
 from models.schemas import UserLogin, Poll, SettingsUpdate, UserUpdate, OrderUpdate, WithdrawalUpdate
 
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -31,6 +48,24 @@ async def admin_login(user: UserLogin):
     return {"access_token": access_token, "token_type": "bearer", "role": "admin"}
 
 
+def image_upload_response(file_id: str, filenames: dict, timings: dict, deduplicated: bool = False) -> dict:
+    urls = {name: variant_path(file_id, name) for name in IMAGE_VARIANTS if name != "original"}
+    urls["original"] = f"/api/uploads/{filenames['original']}"
+    return {
+        "success": True,
+        "file_id": file_id,
+        "urls": urls,
+        "default_url": urls[DEFAULT_VARIANT],
+        "deduplicated": deduplicated,
+        "timings": timings
+    }
+
+
+async def upload_chunks(file: UploadFile):
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
 @router.post("/upload-image")
 async def upload_image(file: UploadFile = File(...), admin_user: dict = Depends(get_admin_user)):
     """Upload and optimize poll image"""
@@ -39,83 +74,69 @@ async def upload_image(file: UploadFile = File(...), admin_user: dict = Depends(
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid file type. Allowed: JPEG, PNG, WebP, GIF")
     
-    # Generate unique filename
-    file_ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    file_id = str(uuid.uuid4())[:12]
-    
+    # Spool the upload to a temp file in chunks; the content hash computed on the way is the
+    # image id, so a repeated upload is stored once
+    path = spool_path()
     try:
-        # Read the uploaded file
-        contents = await file.read()
-        
-        # Open with PIL for processing
-        img = Image.open(io.BytesIO(contents))
-        
-        # Convert to RGB if necessary (for JPEG)
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        
-        # Create multiple sizes for responsive images
-        sizes = {
-            "large": (1200, 800),
-            "medium": (800, 533),
-            "small": (400, 267),
-            "thumb": (200, 133)
-        }
-        
-        urls = {}
-        for size_name, dimensions in sizes.items():
-            # Resize maintaining aspect ratio
-            img_copy = img.copy()
-            img_copy.thumbnail(dimensions, Image.Resampling.LANCZOS)
-            
-            # Save optimized image
-            filename = f"{file_id}_{size_name}.webp"
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            
-            # Save as WebP for better compression
-            img_copy.save(filepath, "WebP", quality=85, optimize=True)
-            
-            urls[size_name] = f"/api/uploads/{filename}"
-        
-        # Also save original (optimized)
-        original_filename = f"{file_id}_original.webp"
-        original_path = os.path.join(UPLOAD_DIR, original_filename)
-        img.save(original_path, "WebP", quality=90, optimize=True)
-        urls["original"] = f"/api/uploads/{original_filename}"
+        size, file_id = await spool(upload_chunks(file), path, IMAGE_MAX_UPLOAD_BYTES)
+        filenames, timings, deduplicated = await ingest(path, file_id, size)
+        if deduplicated:
+            logger.info(f"Image {file_id} already stored, reusing it")
+        else:
+            logger.info(f"Processed image {file_id} in {timings['total_ms']}ms (queued {timings['queue_ms']}ms)")
         
-        return {
-            "success": True,
-            "file_id": file_id,
-            "urls": urls,
-            "default_url": urls["large"]
-        }
+        return image_upload_response(file_id, filenames, timings, deduplicated)
         
+    except (UploadTooLarge, ImageTooLarge) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="File is not a valid image")
     except Exception as e:
         logger.error(f"Error uploading image: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to process image")
+    finally:
+        remove_spool(path)
+
+
+@router.get("/image-cache")
+async def get_image_cache_stats(admin_user: dict = Depends(get_admin_user)):
+    return variant_cache.stats()
 
 
 @router.post("/polls")
 async def create_poll(poll: Poll, admin_user: dict = Depends(get_admin_user)):
-    poll_id = str(uuid.uuid4())
-    options_list = [{"name": opt, "votes_count": 0, "total_amount": 0} for opt in poll.options]
-    
-    poll_doc = {
-        "id": poll_id,
-        "title": poll.title,
-        "description": poll.description,
-        "image_url": poll.image_url,
-        "options": options_list,
-        "vote_price": poll.vote_price,
-        "end_datetime": poll.end_datetime,
-        "status": "active",
-        "winning_option": None,
-        "created_by": admin_user["id"],
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    
+    poll_doc = build_poll_doc(poll, admin_user["id"])
     await db.polls.insert_one(poll_doc)
-    return {"message": "Poll created successfully", "poll_id": poll_id}
+    await acquire(poll.image_url)
+    return {"message": "Poll created successfully", "poll_id": poll_doc["id"]}
+
+
+@router.post("/polls/import")
+async def import_polls_file(
+    file: UploadFile = File(...),
+    format: str = Query(None, pattern="^(csv|ndjson)$"),
+    fetch_images: bool = False,
+    dry_run: bool = False,
+    admin_user: dict = Depends(get_admin_user)
+):
+    """Create polls in bulk from CSV or NDJSON, reporting rows that fail validation.
+
+    CSV needs a header row (title, description, image_url, options, vote_price, end_datetime) with
+    options separated by "|". image_url may be a stored image id; with fetch_images external URLs
+    are downloaded into the image store.
+    """
+    fmt = format or ("csv" if file.filename.lower().endswith(".csv") else "ndjson")
+    path = spool_path()
+    try:
+        await spool(upload_chunks(file), path, IMPORT_MAX_BYTES)
+        with open(path, encoding="utf-8-sig", newline="") as lines:
+            return await import_polls(lines, fmt, admin_user["id"], fetch_images=fetch_images, dry_run=dry_run)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {IMPORT_MAX_BYTES // (1024 * 1024)} MB")
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {str(e)}")
+    finally:
+        remove_spool(path)
 
 
 @router.put("/polls/{poll_id}")
@@ -145,117 +166,214 @@ async def update_poll(poll_id: str, poll: Poll, admin_user: dict = Depends(get_a
             "end_datetime": poll.end_datetime
         }}
     )
+    if poll.image_url != existing_poll.get("image_url"):
+        await acquire(poll.image_url)
+        await release(existing_poll.get("image_url"))
     
     return {"message": "Poll updated successfully"}
 
 
 @router.delete("/polls/{poll_id}")
 async def delete_poll(poll_id: str, admin_user: dict = Depends(get_admin_user)):
-    await db.polls.delete_one({"id": poll_id})
-    return {"message": "Poll deleted successfully"}
+    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    
+    blocker = await deletion_blocker(poll)
+    if blocker:
+        raise HTTPException(status_code=400, detail=blocker)
+    
+    # Votes, counters, events and orders are removed (paid orders archived) in the background
+    try:
+        job = await start_poll_deletion(poll, started_by=admin_user["id"])
+    except DeletionBlocked as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Poll deleted successfully", "cleanup": job["status"]}
+
+
+@router.get("/polls/{poll_id}/deletion")
+async def get_poll_deletion(poll_id: str, admin_user: dict = Depends(get_admin_user)):
+    job = await db.poll_deletions.find_one({"poll_id": poll_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="No deletion found for this poll")
+    return job
+
+
+@router.post("/archive")
+async def run_archive(admin_user: dict = Depends(get_admin_user)):
+    """Archive settled polls and old ledger rows now instead of waiting for the next scheduled run.
+
+    The run goes on in the background; its progress is the last_run of GET /archive.
+    """
+    run = await archiver.start_run(started_by=admin_user["id"])
+    return {"message": "Archival started", **run}
+
+
+@router.get("/archive")
+async def get_archive_status(admin_user: dict = Depends(get_admin_user)):
+    return {
+        "last_run": await archiver.latest_run(),
+        "archived_polls": await db.archived_polls.count_documents({}),
+        "archived_user_votes": await db.archived_user_votes.estimated_document_count(),
+        "archived_transactions": await db.archived_transactions.estimated_document_count()
+    }
+
+
+@router.get("/orphans")
+async def get_orphan_report(admin_user: dict = Depends(get_admin_user)):
+    return await orphan_report()
+
+
+@router.post("/orphans/{poll_id}/cleanup")
+async def cleanup_orphans(poll_id: str, admin_user: dict = Depends(get_admin_user)):
+    """Run (or retry) the cascade for a deleted poll's leftovers"""
+    job = await retry_poll_deletion(poll_id)
+    if job is None:
+        raise HTTPException(status_code=400, detail="Poll still exists; delete it instead")
+    return job
+
+
+@router.get("/polls/{poll_id}/settlement-preview")
+async def get_settlement_preview(
+    poll_id: str,
+    top: int = Query(10, ge=1, le=100),
+    admin_user: dict = Depends(get_admin_user)
+):
+    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    await vote_counters.apply([poll], max_age=0)
+    
+    return await preview_settlement(poll, top)
 
 
 @router.post("/polls/{poll_id}/set-result")
-async def set_poll_result(poll_id: str, winning_option_index: int, admin_user: dict = Depends(get_admin_user)):
-    poll = await db.polls.find_one({"id": poll_id})
+async def set_poll_result(
+    poll_id: str,
+    winning_option_index: int,
+    batch_size: int = Query(SETTLEMENT_CHUNK_SIZE, ge=100, le=10000),
+    admin_user: dict = Depends(get_admin_user)
+):
+    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
     
     if poll["status"] == "result_declared":
         raise HTTPException(status_code=400, detail="Result already declared")
     
-    total_amount_collected = sum(
-        option["total_amount"]
-        for option in poll["options"]
-    )
+    if not 0 <= winning_option_index < len(poll["options"]):
+        raise HTTPException(status_code=400, detail="Invalid winning option")
     
-    winning_votes = poll["options"][winning_option_index]["votes_count"]
+    # A settlement interrupted part-way can only be resumed with the same winning option
+    if poll["status"] == "settling" and poll.get("winning_option") != winning_option_index:
+        raise HTTPException(status_code=409, detail="Settlement already in progress for a different option")
     
-    if winning_votes > 0:
-        per_vote_winning = total_amount_collected / winning_votes
-    else:
-        per_vote_winning = 0
+    # Settlement runs as a background job; progress is at /settlement and /settlement/stream
+    settlement = await prepare_settlement(poll, winning_option_index, chunk_size=batch_size)
+    schedule_settlement(poll_id)
     
-    await db.polls.update_one(
-        {"id": poll_id},
-        {"$set": {
-            "status": "result_declared",
-            "winning_option": winning_option_index,
-            "result_declared_at": datetime.now(timezone.utc).isoformat()
+    return {"message": "Result declaration started", **settlement_progress(settlement)}
+
+
+@router.get("/polls/{poll_id}/settlement")
+async def get_settlement_progress(poll_id: str, admin_user: dict = Depends(get_admin_user)):
+    settlement = await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 0})
+    if not settlement:
+        raise HTTPException(status_code=404, detail="No settlement for this poll")
+    return settlement_progress(settlement)
+
+
+@router.get("/polls/{poll_id}/settlement/stream")
+async def stream_settlement_progress(
+    poll_id: str,
+    interval: float = Query(1.0, ge=0.2, le=30),
+    admin_user: dict = Depends(get_admin_user)
+):
+    if not await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="No settlement for this poll")
+
+    async def events():
+        # Server-sent events until the job stops running
+        while True:
+            settlement = await db.poll_settlements.find_one({"poll_id": poll_id}, {"_id": 0})
+            progress = settlement_progress(settlement)
+            yield f"data: {json.dumps(progress)}\n\n"
+            if progress["status"] != "running":
+                return
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def result_page_pipeline(poll_id: str, winners: bool, sort: str, page: int, limit: int) -> list:
+    """One sorted page of winning or losing votes joined with their users"""
+    # Winners are ranked by payout, losers by the amount they lost. Settlement marks every vote "win" or
+    # "loss", so both pages match one result value and the (poll_id, result, field, _id) index covers the sort
+    sort_field = "winning_amount" if winners else "amount_paid"
+    direction = -1 if sort == "desc" else 1
+    return [
+        {"$match": {"poll_id": poll_id, "result": "win" if winners else "loss"}},
+        {"$sort": {sort_field: direction, "_id": direction}},
+        {"$skip": (page - 1) * limit},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "email": 1, "name": 1}}],
+            "as": "user"
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": 1,
+            "user_email": {"$ifNull": [{"$first": "$user.email"}, "Unknown"]},
+            "user_name": {"$ifNull": [{"$first": "$user.name"}, "Unknown"]},
+            "option_index": 1,
+            "num_votes": 1,
+            "amount_paid": 1,
+            "winning_amount": {"$ifNull": ["$winning_amount", 0]},
+            "result": {"$ifNull": ["$result", "pending"]}
         }}
-    )
-    
-    all_votes = await db.user_votes.find({"poll_id": poll_id}).to_list(1000)
-    
-    for vote in all_votes:
-        if vote["option_index"] == winning_option_index:
-            winning_amount = vote["num_votes"] * per_vote_winning
-            
-            await db.user_votes.update_one(
-                {"id": vote["id"]},
-                {"$set": {"result": "win", "winning_amount": winning_amount}}
-            )
-            
-            await db.users.update_one(
-                {"id": vote["user_id"]},
-                {"$inc": {"cash_wallet": winning_amount}}
-            )
-            
-            transaction_doc = {
-                "id": str(uuid.uuid4()),
-                "user_id": vote["user_id"],
-                "type": "winning",
-                "amount": winning_amount,
-                "status": "completed",
-                "poll_id": poll_id,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.transactions.insert_one(transaction_doc)
-        else:
-            await db.user_votes.update_one(
-                {"id": vote["id"]},
-                {"$set": {"result": "loss"}}
-            )
-    
-    return {"message": "Poll result set successfully"}
+    ]
 
 
 @router.get("/polls/{poll_id}/result-stats")
-async def get_poll_result_stats(poll_id: str, admin_user: dict = Depends(get_admin_user)):
-    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
+async def get_poll_result_stats(
+    poll_id: str,
+    winners_page: int = Query(1, ge=1),
+    losers_page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    sort: str = Query("desc", pattern="^(asc|desc)$"),
+    admin_user: dict = Depends(get_admin_user)
+):
+    poll = await find_poll(poll_id)
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
     
     if poll["status"] != "result_declared":
         raise HTTPException(status_code=400, detail="Result not declared yet")
+    votes = votes_collection(poll)
+    
+    summary_pipeline = [
+        {"$match": {"poll_id": poll_id}},
+        {"$group": {
+            "_id": {"$eq": ["$result", "win"]},
+            "count": {"$sum": 1},
+            "winning_amount": {"$sum": {"$ifNull": ["$winning_amount", 0]}},
+            "amount_paid": {"$sum": "$amount_paid"}
+        }}
+    ]
+    summary_groups, winners, losers = await asyncio.gather(
+        votes.aggregate(summary_pipeline).to_list(None),
+        votes.aggregate(result_page_pipeline(poll_id, True, sort, winners_page, limit)).to_list(limit),
+        votes.aggregate(result_page_pipeline(poll_id, False, sort, losers_page, limit)).to_list(limit)
+    )
+    groups = {group["_id"]: group for group in summary_groups}
+    won = groups.get(True, {"count": 0, "winning_amount": 0})
+    lost = groups.get(False, {"count": 0, "amount_paid": 0})
     
-    all_votes = await db.user_votes.find({"poll_id": poll_id}, {"_id": 0}).to_list(1000)
-    
-    winners = []
-    losers = []
-    total_winning_amount = 0
-    total_losing_amount = 0
-    
-    for vote in all_votes:
-        user = await db.users.find_one({"id": vote["user_id"]}, {"_id": 0, "email": 1, "name": 1})
-        vote_info = {
-            "user_id": vote["user_id"],
-            "user_email": user.get("email", "Unknown") if user else "Unknown",
-            "user_name": user.get("name", "Unknown") if user else "Unknown",
-            "option_index": vote["option_index"],
-            "option_name": poll["options"][vote["option_index"]]["name"] if vote["option_index"] < len(poll["options"]) else "Unknown",
-            "num_votes": vote["num_votes"],
-            "amount_paid": vote["amount_paid"],
-            "winning_amount": vote.get("winning_amount", 0),
-            "result": vote.get("result", "pending")
-        }
-        
-        if vote.get("result") == "win":
-            winners.append(vote_info)
-            total_winning_amount += vote.get("winning_amount", 0)
-        else:
-            losers.append(vote_info)
-            total_losing_amount += vote["amount_paid"]
+    for vote in winners + losers:
+        vote["option_name"] = poll["options"][vote["option_index"]]["name"] if vote["option_index"] < len(poll["options"]) else "Unknown"
     
     option_stats = []
     for i, option in enumerate(poll["options"]):
@@ -274,15 +392,53 @@ async def get_poll_result_stats(poll_id: str, admin_user: dict = Depends(get_adm
         "winning_option_name": poll["options"][poll.get("winning_option", 0)]["name"] if poll.get("winning_option") is not None else None,
         "result_declared_at": poll.get("result_declared_at"),
         "option_stats": option_stats,
-        "total_winners": len(winners),
-        "total_losers": len(losers),
-        "total_winning_amount_distributed": total_winning_amount,
-        "total_losing_amount_collected": total_losing_amount,
-        "winners": winners,
-        "losers": losers
+        "summary": {
+            "total_winners": won["count"],
+            "total_losers": lost["count"],
+            "total_winning_amount_distributed": round(won["winning_amount"], 2),
+            "total_losing_amount_collected": round(lost["amount_paid"], 2)
+        },
+        "winners": {
+            "items": winners,
+            "total": won["count"],
+            "page": winners_page,
+            "limit": limit,
+            "pages": (won["count"] + limit - 1) // limit
+        },
+        "losers": {
+            "items": losers,
+            "total": lost["count"],
+            "page": losers_page,
+            "limit": limit,
+            "pages": (lost["count"] + limit - 1) // limit
+        }
     }
 
 
+@router.post("/reconciliation")
+async def start_counter_reconciliation(
+    repair: bool = False,
+    chunk_size: int = Query(RECONCILE_CHUNK_SIZE, ge=1, le=500),
+    pause_seconds: float = Query(RECONCILE_PAUSE_SECONDS, ge=0, le=60),
+    admin_user: dict = Depends(get_admin_user)
+):
+    run = await start_reconciliation(repair=repair, chunk_size=chunk_size, pause_seconds=pause_seconds, started_by=admin_user["id"])
+    return {"message": "Reconciliation started", "run_id": run["id"], "total_polls": run["total_polls"]}
+
+
+@router.get("/reconciliation")
+async def list_counter_reconciliations(limit: int = Query(20, ge=1, le=100), admin_user: dict = Depends(get_admin_user)):
+    return await db.reconciliation_runs.find({}, {"_id": 0, "discrepancies": 0}).sort("started_at", -1).limit(limit).to_list(limit)
+
+
+@router.get("/reconciliation/{run_id}")
+async def get_counter_reconciliation(run_id: str, admin_user: dict = Depends(get_admin_user)):
+    run = await db.reconciliation_runs.find_one({"id": run_id}, {"_id": 0})
+    if not run:
+        raise HTTPException(status_code=404, detail="Reconciliation run not found")
+    return run
+
+
 @router.get("/kyc-requests")
 async def get_kyc_requests(
     status: str = Query(None, description="Filter by status: pending, approved, rejected, or all"),
@@ -357,8 +513,8 @@ async def get_users(
     admin_user: dict = Depends(get_admin_user)
 ):
     skip = (page - 1) * limit
-    total = await db.users.count_documents({"role": "user"})
-    users = await db.users.find({"role": "user"}, {"_id": 0, "password_hash": 0}).skip(skip).limit(limit).to_list(limit)
+    total = await db.users.count_documents(users_query())
+    users = await db.users.find(users_query(), {"_id": 0, "password_hash": 0}).sort(USERS_SORT).skip(skip).limit(limit).to_list(limit)
     
     return {
         "items": users,
@@ -411,16 +567,11 @@ async def get_all_transactions(
     admin_user: dict = Depends(get_admin_user)
 ):
     skip = (page - 1) * limit
-    total = await db.transactions.count_documents({})
-    transactions = await db.transactions.find({}, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    total = await db.transactions.count_documents(transactions_query())
+    transactions = await db.transactions.find(transactions_query(), {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
-    # Enrich transactions with user info
-    for txn in transactions:
-        user = await db.users.find_one({"id": txn.get("user_id")}, {"_id": 0, "name": 1, "email": 1})
-        txn["user"] = user
-        if txn.get("poll_id"):
-            poll = await db.polls.find_one({"id": txn["poll_id"]}, {"_id": 0, "title": 1})
-            txn["poll"] = poll
+    # Enrich transactions with user and poll info; archived polls keep their titles
+    await enrich_transactions(transactions)
     
     # Stats from all orders (not paginated)
     orders = await db.orders.find({"payment_status": "success"}, {"_id": 0}).to_list(1000)
@@ -451,15 +602,11 @@ async def get_all_orders(
 ):
     """Get all payment orders with user and poll details"""
     skip = (page - 1) * limit
-    total = await db.orders.count_documents({})
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    total = await db.orders.count_documents(orders_query())
+    orders = await db.orders.find(orders_query(), {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
-    # Enrich orders with user and poll info
-    for order in orders:
-        user = await db.users.find_one({"id": order.get("user_id")}, {"_id": 0, "name": 1, "email": 1, "phone": 1})
-        order["user"] = user
-        poll = await db.polls.find_one({"id": order.get("poll_id")}, {"_id": 0, "title": 1})
-        order["poll"] = poll
+    # Enrich orders with user and poll info; archived polls keep their titles
+    await enrich_orders(orders)
     
     return {
         "items": orders,
@@ -487,61 +634,9 @@ async def update_order(order_id: str, order_update: OrderUpdate, admin_user: dic
         
         # If marking as success and was previously not success, process the vote
         if order_update.payment_status == "success" and existing_order.get("payment_status") != "success":
-            # Check if vote already exists
-            existing_vote = await db.user_votes.find_one({
-                "user_id": existing_order["user_id"],
-                "poll_id": existing_order["poll_id"],
-                "option_index": existing_order["option_index"]
-            })
-            
-            if existing_vote:
-                await db.user_votes.update_one(
-                    {"user_id": existing_order["user_id"], "poll_id": existing_order["poll_id"], "option_index": existing_order["option_index"]},
-                    {
-                        "$inc": {"num_votes": existing_order["num_votes"], "amount_paid": existing_order["base_amount"]},
-                        "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-                    }
-                )
-            else:
-                vote_doc = {
-                    "id": str(uuid.uuid4()),
-                    "user_id": existing_order["user_id"],
-                    "poll_id": existing_order["poll_id"],
-                    "option_index": existing_order["option_index"],
-                    "num_votes": existing_order["num_votes"],
-                    "amount_paid": existing_order["base_amount"],
-                    "payment_id": existing_order["id"],
-                    "payment_status": "success",
-                    "result": "pending",
-                    "winning_amount": 0,
-                    "voted_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.user_votes.insert_one(vote_doc)
-            
-            # Update poll vote count
-            await db.polls.update_one(
-                {"id": existing_order["poll_id"]},
-                {
-                    "$inc": {
-                        f"options.{existing_order['option_index']}.votes_count": existing_order["num_votes"],
-                        f"options.{existing_order['option_index']}.total_amount": existing_order["base_amount"]
-                    }
-                }
-            )
-            
-            # Create transaction record
-            transaction_doc = {
-                "id": str(uuid.uuid4()),
-                "user_id": existing_order["user_id"],
-                "type": "vote",
-                "amount": existing_order["base_amount"],
-                "gateway_charge": existing_order.get("gateway_charge", 0),
-                "status": "completed",
-                "payment_id": existing_order["id"],
-                "poll_id": existing_order["poll_id"],
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.transactions.insert_one(transaction_doc)
+            # Same claim and recording path as gateway payments, so an order the gateway already credited
+            # is not credited twice
+            await process_successful_payment(existing_order, payment_status="success", payment_method="admin")
     
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
@@ -597,6 +692,12 @@ async def get_dashboard_stats(admin_user: dict = Depends(get_admin_user)):
     }
 
 
+@router.get("/gateway-status")
+async def get_gateway_status(admin_user: dict = Depends(get_admin_user)):
+    """NOWPayments circuit breaker state, retry budget and call counters"""
+    return gateway.metrics()
+
+
 @router.get("/withdrawals")
 async def get_all_withdrawals(
     status: str = Query(None, description="Filter by status: pending, completed, rejected, or all"),
@@ -608,10 +709,7 @@ async def get_all_withdrawals(
     skip = (page - 1) * limit
     
     # Build query based on status filter
-    if status and status != "all":
-        query = {"status": status}
-    else:
-        query = {}
+    query = withdrawals_query(status)
     
     total = await db.withdrawal_requests.count_documents(query)
     withdrawals = await db.withdrawal_requests.find(query, {"_id": 0}).sort("requested_at", -1).skip(skip).limit(limit).to_list(limit)
@@ -687,6 +785,42 @@ async def update_withdrawal(withdrawal_id: str, withdrawal_update: WithdrawalUpd
     return updated
 
 
+def export_response(name: str, query: dict, format: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_export(name, query, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(name, format)}"', "Cache-Control": "no-store"}
+    )
+
+
+@router.get("/export/users")
+async def export_users(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), admin_user: dict = Depends(get_admin_user)):
+    """Stream every user (same filter as /users) as NDJSON or CSV"""
+    return export_response("users", users_query(), format)
+
+
+@router.get("/export/transactions")
+async def export_transactions(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), admin_user: dict = Depends(get_admin_user)):
+    """Stream every transaction, newest first, with user and poll details"""
+    return export_response("transactions", transactions_query(), format)
+
+
+@router.get("/export/orders")
+async def export_orders(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), admin_user: dict = Depends(get_admin_user)):
+    """Stream every payment order, newest first, with user and poll details"""
+    return export_response("orders", orders_query(), format)
+
+
+@router.get("/export/withdrawals")
+async def export_withdrawals(
+    status: str = Query(None, description="Filter by status: pending, completed, rejected, or all"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    admin_user: dict = Depends(get_admin_user)
+):
+    """Stream withdrawal requests, newest first, with user details"""
+    return export_response("withdrawals", withdrawals_query(status), format)
+
+
 async def create_default_admin():
     """Create default admin user on startup if not exists"""
     admin_exists = await db.users.find_one({"role": "admin"})
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, HTTPException, Query, Header
+import asyncio
+import logging
+import os
+import re
+
+from core.config import IMAGE_VARIANT_WIDTHS
+from core.image_store import UPLOAD_DIR, variant_cache
+from core.images import image_processor
+from core.static_files import UploadFileResponse, IMMUTABLE_CACHE_CONTROL
+
+logger = logging.getLogger(__name__)
+
+# format -> (Pillow encoder, media type, quality), in negotiation preference order. AVIF at 60 looks
+# like WebP/JPEG at 85 and is several times smaller; JPEG is the fallback every client decodes.
+IMAGE_FORMATS = {
+    "avif": ("AVIF", "image/avif", 60),
+    "webp": ("WebP", "image/webp", 85),
+    "jpeg": ("JPEG", "image/jpeg", 85)
+}
+FALLBACK_FORMAT = "jpeg"
+FILE_ID_PATTERN = re.compile(r"^[0-9a-f-]{1,36}$")
+
+_in_flight = {}
+
+router = APIRouter(prefix="/api/images", tags=["images"])
+
+
+def negotiate_format(accept: str) -> str:
+    """Best format the client lists explicitly in its Accept header (q > 0), JPEG otherwise.
+
+    Wildcards like image/* do not count: browsers send them without being able to decode AVIF.
+    """
+    accepted = set()
+    for item in (accept or "").split(","):
+        media_type, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+    for fmt, (_, media_type, _) in IMAGE_FORMATS.items():
+        if media_type in accepted:
+            return fmt
+    return FALLBACK_FORMAT
+
+
+async def generate_variant(file_id: str, width: int, fmt: str, name: str) -> str:
+    """Render a variant from the stored original and add it to the cache"""
+    source = os.path.join(UPLOAD_DIR, f"{file_id}_original.webp")
+    if not os.path.exists(source):
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Same 3:2 boxes as the eager variants upload_image used to write (1200x800, 800x533, ...)
+    encoder, _, quality = IMAGE_FORMATS[fmt]
+    data, timings = await image_processor.render(source, (width, width * 2 // 3), quality, encoder)
+    path = await asyncio.to_thread(variant_cache.put, name, data)
+    logger.info(f"Generated image variant {name} ({len(data)} bytes, encode {timings['encode_ms']:.0f}ms)")
+    return path
+
+
+@router.get("/{file_id}")
+async def get_image(
+    file_id: str,
+    w: int = Query(IMAGE_VARIANT_WIDTHS[-1]),
+    format: str = Query(None),
+    accept: str = Header(None)
+):
+    """Serve an uploaded image at a whitelisted width, generating it on first request.
+
+    Without ?format= the format is negotiated from the Accept header, and each format is cached
+    as its own variant.
+    """
+    if not FILE_ID_PATTERN.match(file_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if w not in IMAGE_VARIANT_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"Unsupported width. Allowed: {', '.join(map(str, IMAGE_VARIANT_WIDTHS))}")
+    negotiated = format is None
+    if negotiated:
+        format = negotiate_format(accept)
+    elif format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Allowed: {', '.join(IMAGE_FORMATS)}")
+    
+    name = f"{file_id}_{w}.{format}"
+    path = variant_cache.get(name)
+    if path is None:
+        # Concurrent first requests for the same variant share one render
+        task = _in_flight.get(name)
+        if task is None:
+            task = asyncio.ensure_future(generate_variant(file_id, w, format, name))
+            _in_flight[name] = task
+            task.add_done_callback(lambda _: _in_flight.pop(name, None))
+        path = await asyncio.shield(task)
+    
+    # A variant of a given upload never changes, so clients and CDNs may keep it indefinitely;
+    # a negotiated response must be cached per Accept header, though
+    response = UploadFileResponse(path, media_type=IMAGE_FORMATS[format][1], cache_control=IMMUTABLE_CACHE_CONTROL)
+    if negotiated:
+        response.headers["vary"] = "Accept"
+    return response
+
@@ -1,47 +1,79 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from typing import Optional
 import uuid
 from datetime import datetime, timezone
 import logging
 import httpx
 import hmac
-import hashlib
 import json
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
 
-from core.database import db
+from core.database import db, run_in_transaction
 from core.security import get_current_user
-from core.config import NOWPAYMENTS_API_KEY, NOWPAYMENTS_IPN_SECRET
-from models.schemas import VoteRequest
+from core.config import NOWPAYMENTS_IPN_SECRET, PUBLIC_BASE_URL
+from core.gateway import gateway, GatewayUnavailable, sign_ipn_payload
+from core.currency_quotes import currency_quotes
+from core.vote_counters import vote_counters
+from core.vote_events import vote_event_log, record_user_vote, claim_active_poll, PollClosed
+from models.schemas import VoteRequest, BasketOrderRequest
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
-NOWPAYMENTS_API_URL = "https://api.nowpayments.io/v1"
+DEFAULT_MIN_PAYMENT_USD = 3.0
+
+# Gateway statuses that mean the invoice is paid, and order statuses recorded once it is
+CONFIRMED_STATUSES = ["finished", "confirmed"]
+PAID_STATUSES = ["finished", "success"]
+
+# Orders whose payment has not been applied yet (votes credited, or refunded to the wallet when the
+# poll had closed). votes_credited is False on every new invoice order; orders from before the flag
+# existed count as applied once they were marked paid.
+UNCREDITED_ORDER = {
+    "votes_credited": {"$ne": True},
+    "refunded_to_wallet": {"$ne": True},
+    "$or": [{"votes_credited": False}, {"payment_status": {"$nin": PAID_STATUSES}}]
+}
+
+
+def votes_applied(order: dict) -> bool:
+    """Whether the order's payment was already applied (the same test as UNCREDITED_ORDER, negated)"""
+    if order.get("refunded_to_wallet"):
+        return True
+    if "votes_credited" in order:
+        return order["votes_credited"] is True
+    return order.get("payment_status") in PAID_STATUSES
 
 
 @router.get("/currencies")
 async def get_available_currencies():
     """Get list of available cryptocurrencies from NOWPayments"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{NOWPAYMENTS_API_URL}/currencies",
-                headers={"x-api-key": NOWPAYMENTS_API_KEY},
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                # Return popular currencies first
-                popular = ["btc", "eth", "usdt", "usdc", "bnb", "ltc", "trx", "doge", "sol", "matic"]
-                currencies = data.get("currencies", [])
-                sorted_currencies = [c for c in popular if c in currencies] + [c for c in currencies if c not in popular]
-                return {"currencies": sorted_currencies[:50]}  # Limit to 50 for UI
-            return {"currencies": ["btc", "eth", "usdt", "usdc", "bnb", "ltc"]}
+        response = await gateway.get("/currencies")
+        if response.status_code == 200:
+            data = response.json()
+            # Return popular currencies first
+            popular = ["btc", "eth", "usdt", "usdc", "bnb", "ltc", "trx", "doge", "sol", "matic"]
+            currencies = data.get("currencies", [])
+            sorted_currencies = [c for c in popular if c in currencies] + [c for c in currencies if c not in popular]
+            return {"currencies": sorted_currencies[:50]}  # Limit to 50 for UI
+        return {"currencies": ["btc", "eth", "usdt", "usdc", "bnb", "ltc"]}
     except Exception as e:
         logger.error(f"Error fetching currencies: {str(e)}")
         return {"currencies": ["btc", "eth", "usdt", "usdc", "bnb", "ltc"]}
 
 
+@router.get("/quotes")
+async def get_currency_quotes(amount: Optional[float] = Query(None, gt=0)):
+    """Cached per-currency minimums and USD estimates; pass amount (USD) to get exact crypto amounts"""
+    return {
+        "default_min_usd": DEFAULT_MIN_PAYMENT_USD,
+        "quotes": currency_quotes.snapshot(amount)
+    }
+
+
 @router.post("/create-order")
 async def create_order(vote_request: VoteRequest, current_user: dict = Depends(get_current_user)):
     """Create a NOWPayments invoice for voting"""
@@ -52,76 +84,127 @@ async def create_order(vote_request: VoteRequest, current_user: dict = Depends(g
     if poll["status"] != "active":
         raise HTTPException(status_code=400, detail="Poll is not active")
     
+    return await create_invoice_order(
+        poll,
+        current_user,
+        {"option_index": vote_request.option_index, "num_votes": vote_request.num_votes},
+        f"Vote for {poll['options'][vote_request.option_index]['name']} - {vote_request.num_votes} vote(s)",
+        vote_request.pay_currency
+    )
+
+
+@router.post("/create-basket-order")
+async def create_basket_order(basket: BasketOrderRequest, current_user: dict = Depends(get_current_user)):
+    """Create one NOWPayments invoice covering votes on several options of a poll"""
+    poll = await db.polls.find_one({"id": basket.poll_id})
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    
+    if poll["status"] != "active":
+        raise HTTPException(status_code=400, detail="Poll is not active")
+    
+    if not basket.lines:
+        raise HTTPException(status_code=400, detail="Basket is empty")
+    
+    # Merge repeated options so each option appears once in the order
+    votes_by_option = {}
+    for line in basket.lines:
+        if not 0 <= line.option_index < len(poll["options"]):
+            raise HTTPException(status_code=400, detail=f"Invalid option {line.option_index}")
+        if line.num_votes < 1:
+            raise HTTPException(status_code=400, detail="Number of votes must be at least 1")
+        votes_by_option[line.option_index] = votes_by_option.get(line.option_index, 0) + line.num_votes
+    
+    lines = [
+        {"option_index": idx, "num_votes": num_votes, "base_amount": poll["vote_price"] * num_votes}
+        for idx, num_votes in sorted(votes_by_option.items())
+    ]
+    description = ", ".join(f"{poll['options'][line['option_index']]['name']} x{line['num_votes']}" for line in lines)
+    
+    return await create_invoice_order(
+        poll,
+        current_user,
+        {"lines": lines, "num_votes": sum(line["num_votes"] for line in lines)},
+        f"Votes for {description}"[:250],
+        basket.pay_currency
+    )
+
+
+async def create_invoice_order(poll: dict, current_user: dict, vote_fields: dict, description: str, pay_currency: Optional[str]):
+    """Price the votes, create the NOWPayments invoice and store the order"""
     settings = await db.settings.find_one({}, {"_id": 0})
     if not settings:
         settings = {"payment_gateway_charge_percent": 2, "withdrawal_charge_percent": 10}
         await db.settings.insert_one(settings)
     
-    base_amount = poll["vote_price"] * vote_request.num_votes
+    base_amount = poll["vote_price"] * vote_fields["num_votes"]
     gateway_charge = base_amount * (settings["payment_gateway_charge_percent"] / 100)
     total_amount = round(base_amount + gateway_charge, 2)
     
-    # NOWPayments has dynamic minimums (~$2-5 depending on cryptocurrency)
-    # Setting minimum to $3 to ensure compatibility with most coins
-    if total_amount < 3:
+    # Get preferred currency from request or default to BTC
+    pay_currency = (pay_currency or 'btc').lower()
+    
+    # NOWPayments has dynamic per-currency minimums; use the cached quote when we have a fresh one,
+    # otherwise fall back to a $3 floor that is safe for most coins
+    minimum_amount = currency_quotes.min_usd(pay_currency) or DEFAULT_MIN_PAYMENT_USD
+    if total_amount < minimum_amount:
         raise HTTPException(
             status_code=400,
-            detail=f"Minimum payment is $3.00 USD (crypto gateway requirement). Your amount ${total_amount:.2f} is below minimum. Please increase the number of votes."
+            detail=f"Minimum payment for {pay_currency.upper()} is ${minimum_amount:.2f} USD (crypto gateway requirement). Your amount ${total_amount:.2f} is below minimum. Please increase the number of votes."
         )
     
     order_id = f"order_{uuid.uuid4().hex[:12]}"
     
-    # Get preferred currency from request or default to BTC
-    pay_currency = getattr(vote_request, 'pay_currency', 'btc') or 'btc'
-    
     # Create NOWPayments invoice
     invoice_payload = {
         "price_amount": total_amount,
         "price_currency": "usd",
         "pay_currency": pay_currency,
         "order_id": order_id,
-        "order_description": f"Vote for {poll['options'][vote_request.option_index]['name']} - {vote_request.num_votes} vote(s)",
-        "ipn_callback_url": "https://votevault.preview.emergentagent.com/api/payments/webhook",
-        "success_url": f"https://votevault.preview.emergentagent.com/payment-success?order_id={order_id}",
-        "cancel_url": f"https://votevault.preview.emergentagent.com/poll/{vote_request.poll_id}",
+        "order_description": description,
+        "ipn_callback_url": f"{PUBLIC_BASE_URL}/api/payments/webhook",
+        "success_url": f"{PUBLIC_BASE_URL}/payment-success?order_id={order_id}",
+        "cancel_url": f"{PUBLIC_BASE_URL}/poll/{poll['id']}",
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{NOWPAYMENTS_API_URL}/invoice",
-                json=invoice_payload,
-                headers={
-                    "x-api-key": NOWPAYMENTS_API_KEY,
-                    "Content-Type": "application/json"
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code not in [200, 201]:
-                logger.error(f"NOWPayments API error: {response.status_code} - {response.text}")
-                raise HTTPException(status_code=500, detail="Failed to create payment invoice")
-            
-            invoice_data = response.json()
+        # Invoice creation is not idempotent, so the gateway wrapper never retries it
+        response = await gateway.post("/invoice", json=invoice_payload)
+        
+        if response.status_code not in [200, 201]:
+            logger.error(f"NOWPayments API error: {response.status_code} - {response.text}")
+            raise HTTPException(status_code=500, detail="Failed to create payment invoice")
+        
+        invoice_data = response.json()
         
         # Store order in database
         order_doc = {
             "id": order_id,
             "invoice_id": invoice_data.get("id"),
             "user_id": current_user["id"],
-            "poll_id": vote_request.poll_id,
-            "option_index": vote_request.option_index,
-            "num_votes": vote_request.num_votes,
+            "poll_id": poll["id"],
+            **vote_fields,
             "base_amount": base_amount,
             "gateway_charge": gateway_charge,
             "total_amount": total_amount,
             "pay_currency": pay_currency,
             "payment_status": "waiting",
+            "votes_credited": False,
             "invoice_url": invoice_data.get("invoice_url"),
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         
-        await db.orders.insert_one(order_doc)
+        # Stored only while the poll still takes votes; the claim conflicts with a concurrent delete or
+        # settlement closing the poll, so the order can't land after their check for pending payments
+        async def store_order(session):
+            await claim_active_poll(poll["id"], session=session)
+            await db.orders.insert_one(order_doc, session=session)
+        
+        try:
+            await run_in_transaction(store_order)
+        except PollClosed:
+            logger.warning(f"Dropping invoice {invoice_data.get('id')} for order {order_id}: poll {poll['id']} closed meanwhile")
+            raise HTTPException(status_code=400, detail="Poll is not active")
         
         return {
             "order_id": order_id,
@@ -130,16 +213,91 @@ async def create_order(vote_request: VoteRequest, current_user: dict = Depends(g
             "amount": total_amount,
             "base_amount": base_amount,
             "gateway_charge": gateway_charge,
-            "pay_currency": pay_currency
+            "pay_currency": pay_currency,
+            "estimated_pay_amount": currency_quotes.estimate(pay_currency, total_amount),
+            **({"lines": vote_fields["lines"]} if "lines" in vote_fields else {})
         }
+    except GatewayUnavailable:
+        logger.warning(f"Rejecting order {order_id}: NOWPayments circuit breaker is open")
+        raise HTTPException(status_code=503, detail="Payment gateway is temporarily unavailable. Please try again shortly.")
     except httpx.HTTPError as e:
         logger.error(f"HTTP error creating NOWPayments invoice: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create payment order")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating order: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create payment order")
 
 
+@router.post("/pay-from-wallet")
+async def pay_from_wallet(vote_request: VoteRequest, current_user: dict = Depends(get_current_user)):
+    """Place votes funded by the cash wallet - no gateway invoice, no gateway charge"""
+    poll = await db.polls.find_one({"id": vote_request.poll_id}, {"_id": 0, "status": 1, "vote_price": 1, "options": 1})
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    
+    if poll["status"] != "active":
+        raise HTTPException(status_code=400, detail="Poll is not active")
+    
+    if not 0 <= vote_request.option_index < len(poll["options"]):
+        raise HTTPException(status_code=400, detail="Invalid option")
+    
+    if vote_request.num_votes < 1:
+        raise HTTPException(status_code=400, detail="Number of votes must be at least 1")
+    
+    amount = round(poll["vote_price"] * vote_request.num_votes, 2)
+    now = datetime.now(timezone.utc).isoformat()
+    order_doc = {
+        "id": f"order_{uuid.uuid4().hex[:12]}",
+        "user_id": current_user["id"],
+        "poll_id": vote_request.poll_id,
+        "option_index": vote_request.option_index,
+        "num_votes": vote_request.num_votes,
+        "base_amount": amount,
+        "gateway_charge": 0,
+        "total_amount": amount,
+        "payment_method": "wallet",
+        "payment_status": "finished",
+        "votes_credited": True,
+        "created_at": now,
+        "verified_at": now
+    }
+    
+    async def debit_and_credit(session):
+        debited = await db.users.find_one_and_update(
+            {"id": current_user["id"], "cash_wallet": {"$gte": amount}},
+            {"$inc": {"cash_wallet": -amount}},
+            projection={"cash_wallet": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not debited:
+            raise HTTPException(status_code=400, detail="Insufficient wallet balance")
+        
+        # A copy, so a retried attempt does not reuse the _id insert_one adds
+        await db.orders.insert_one(dict(order_doc), session=session)
+        await credit_votes(order_doc, payment_method="wallet", session=session)
+        return debited
+    
+    # Debit, order, vote, poll counters and ledger commit together or not at all
+    try:
+        debited = await run_in_transaction(debit_and_credit)
+    except PollClosed:
+        raise HTTPException(status_code=400, detail="Poll is not active")
+    except OperationFailure as e:
+        logger.warning(f"Wallet vote for user {current_user['id']} failed after retries: {str(e)}")
+        raise HTTPException(status_code=409, detail="Your wallet is busy with another payment. Please try again.")
+    
+    return {
+        "status": "success",
+        "order_id": order_doc["id"],
+        "amount": amount,
+        "num_votes": vote_request.num_votes,
+        "wallet_balance": debited["cash_wallet"]
+    }
+
+
 @router.post("/verify")
 async def verify_payment(order_id: str, current_user: dict = Depends(get_current_user)):
     """Verify payment status by checking NOWPayments API"""
@@ -151,105 +309,144 @@ async def verify_payment(order_id: str, current_user: dict = Depends(get_current
         raise HTTPException(status_code=403, detail="Access denied")
     
     # If already verified as success, return immediately
-    if order["payment_status"] in ["finished", "success"]:
+    if order.get("refunded_to_wallet"):
+        return refunded_response(order)
+    if votes_applied(order):
         return {"status": "success", "message": "Payment already verified"}
     
     try:
         # Check payment status from NOWPayments API using invoice_id
         if order.get("invoice_id"):
-            async with httpx.AsyncClient() as client:
-                # Get payments for this invoice
-                response = await client.get(
-                    f"{NOWPAYMENTS_API_URL}/payment/?invoiceId={order['invoice_id']}",
-                    headers={"x-api-key": NOWPAYMENTS_API_KEY},
-                    timeout=30.0
-                )
+            # Get payments for this invoice (idempotent read, retried with backoff by the gateway wrapper)
+            response = await gateway.get("/payment/", params={"invoiceId": order["invoice_id"]})
+            
+            if response.status_code == 200:
+                payments_data = response.json()
+                payments = payments_data.get("data", [])
                 
-                if response.status_code == 200:
-                    payments_data = response.json()
-                    payments = payments_data.get("data", [])
+                if payments:
+                    # Check the latest payment status
+                    latest_payment = payments[0]
+                    payment_status = latest_payment.get("payment_status", "waiting")
                     
-                    if payments:
-                        # Check the latest payment status
-                        latest_payment = payments[0]
-                        payment_status = latest_payment.get("payment_status", "waiting")
-                        
-                        logger.info(f"NOWPayments status for order {order_id}: {payment_status}")
-                        
-                        if payment_status in ["finished", "confirmed"]:
-                            if order["payment_status"] not in ["finished", "success"]:
-                                await process_successful_payment(order)
-                            return {"status": "success", "message": "Payment verified successfully"}
-                        elif payment_status in ["waiting", "confirming", "sending"]:
-                            return {"status": "pending", "message": f"Payment is {payment_status}"}
-                        elif payment_status in ["failed", "expired", "refunded"]:
-                            await db.orders.update_one(
-                                {"id": order_id},
-                                {"$set": {"payment_status": "failed"}}
-                            )
-                            return {"status": "failed", "message": f"Payment {payment_status}"}
+                    logger.info(f"NOWPayments status for order {order_id}: {payment_status}")
                     
-                    return {"status": "pending", "message": "Waiting for payment"}
-                else:
-                    logger.error(f"NOWPayments API error: {response.status_code}")
+                    if payment_status in CONFIRMED_STATUSES:
+                        if await process_successful_payment(order) == "refunded":
+                            return refunded_response(order)
+                        return {"status": "success", "message": "Payment verified successfully"}
+                    elif payment_status in ["waiting", "confirming", "sending"]:
+                        return {"status": "pending", "message": f"Payment is {payment_status}"}
+                    elif payment_status in ["failed", "expired", "refunded"]:
+                        await db.orders.update_one(
+                            {"id": order_id, **UNCREDITED_ORDER},
+                            {"$set": {"payment_status": "failed"}}
+                        )
+                        return {"status": "failed", "message": f"Payment {payment_status}"}
+                
+                return {"status": "pending", "message": "Waiting for payment"}
+            else:
+                logger.error(f"NOWPayments API error: {response.status_code}")
         
         return {"status": "pending", "message": "Payment verification in progress"}
             
+    except GatewayUnavailable:
+        # Fail fast while the breaker is open; the client keeps polling and the IPN webhook still lands
+        return {"status": "pending", "message": "Payment gateway is temporarily unavailable"}
     except Exception as e:
         logger.error(f"Error verifying payment for order {order_id}: {str(e)}")
         return {"status": "pending", "message": "Payment verification in progress"}
 
 
-async def process_successful_payment(order: dict):
-    """Process a successful payment - update vote counts and wallet"""
+def refunded_response(order: dict) -> dict:
+    return {
+        "status": "refunded",
+        "message": f"The poll closed before your payment was confirmed, so ${order['base_amount']:.2f} was added to your wallet instead."
+    }
+
+
+async def process_successful_payment(order: dict, payment_status: str = "finished", payment_method: str = "nowpayments"):
+    """Mark a paid order with its final status and credit its votes, in one transaction.
+
+    The webhook, /verify and the admin API can race on the same order; the conditional claim makes
+    sure only one of them applies it, and because the status is written in the same transaction a
+    failed attempt leaves the order unapplied for the next IPN delivery or /verify poll to retry.
+    If the poll stopped taking votes meanwhile, the vote amount goes to the user's wallet instead.
+    Returns "credited", "refunded", or None when the order had already been applied.
+    """
     order_id = order["id"]
     
+    async def claim_and_credit(session):
+        claimed = await db.orders.update_one(
+            {"id": order_id, **UNCREDITED_ORDER},
+            {"$set": {
+                "payment_status": payment_status,
+                "votes_credited": True,
+                "verified_at": datetime.now(timezone.utc).isoformat()
+            }},
+            session=session
+        )
+        if claimed.modified_count == 0:
+            return None
+        
+        # Every line of a basket order is credited or none of them
+        try:
+            await credit_votes(order, payment_method=payment_method, session=session)
+        except PollClosed:
+            await refund_to_wallet(order, session=session)
+            return "refunded"
+        return "credited"
+    
+    return await run_in_transaction(claim_and_credit)
+
+
+async def refund_to_wallet(order: dict, session=None):
+    """Credit the vote amount of an order that arrived after its poll closed to the user's cash wallet"""
+    now = datetime.now(timezone.utc).isoformat()
+    await db.users.update_one({"id": order["user_id"]}, {"$inc": {"cash_wallet": order["base_amount"]}}, session=session)
     await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"payment_status": "finished", "verified_at": datetime.now(timezone.utc).isoformat()}}
+        {"id": order["id"]},
+        {"$set": {"votes_credited": False, "refunded_to_wallet": True, "refunded_at": now}},
+        session=session
     )
-    
-    # Check if vote already exists for this user+poll+option
-    existing_vote = await db.user_votes.find_one({
-        "user_id": order["user_id"], 
+    await db.transactions.insert_one({
+        "id": str(uuid.uuid4()),
+        "user_id": order["user_id"],
+        "type": "refund",
+        "amount": order["base_amount"],
+        "status": "completed",
+        "payment_id": order["id"],
         "poll_id": order["poll_id"],
-        "option_index": order["option_index"]
-    })
+        "created_at": now
+    }, session=session)
+    logger.warning(f"Poll {order['poll_id']} closed before order {order['id']} was paid; refunded {order['base_amount']} to the wallet")
+
+
+def order_lines(order: dict) -> list:
+    """Per-option vote lines of an order (basket orders carry several, regular orders one)"""
+    if order.get("lines"):
+        return order["lines"]
+    return [{"option_index": order["option_index"], "num_votes": order["num_votes"], "base_amount": order["base_amount"]}]
+
+
+async def credit_votes(order: dict, payment_method: str, session=None):
+    """Record the order's votes against the user, the poll counters and the ledger.
+
+    Raises PollClosed, before writing anything else, when the poll no longer takes votes: settlement
+    fixes its payout plan from the votes present when it starts, so none may be added afterwards.
+    """
+    await claim_active_poll(order["poll_id"], session=session)
     
-    if existing_vote:
-        await db.user_votes.update_one(
-            {"user_id": order["user_id"], "poll_id": order["poll_id"], "option_index": order["option_index"]},
-            {
-                "$inc": {"num_votes": order["num_votes"], "amount_paid": order["base_amount"]},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-            }
-        )
-    else:
-        vote_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": order["user_id"],
-            "poll_id": order["poll_id"],
-            "option_index": order["option_index"],
-            "num_votes": order["num_votes"],
-            "amount_paid": order["base_amount"],
-            "payment_id": order["id"],
-            "payment_status": "success",
-            "result": "pending",
-            "winning_amount": 0,
-            "voted_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.user_votes.insert_one(vote_doc)
+    lines = order_lines(order)
+    await vote_event_log.append(order, lines, payment_method, session=session)
     
-    # Update poll vote counts
-    await db.polls.update_one(
-        {"id": order["poll_id"]},
-        {
-            "$inc": {
-                f"options.{order['option_index']}.votes_count": order["num_votes"],
-                f"options.{order['option_index']}.total_amount": order["base_amount"]
-            }
-        }
-    )
+    # In deferred mode the compaction worker folds the events into user_votes and the poll counters
+    if not vote_event_log.deferred:
+        for line in lines:
+            await record_user_vote(order["user_id"], order["poll_id"], line, order["id"], session=session)
+        
+        # Update poll vote counts for every line (one poll write, or one shard write per line when sharded)
+        await vote_counters.increment(order["poll_id"], lines, session=session)
     
     # Record transaction
     transaction_doc = {
@@ -257,28 +454,21 @@ async def process_successful_payment(order: dict):
         "user_id": order["user_id"],
         "type": "vote",
         "amount": order["base_amount"],
-        "gateway_charge": order["gateway_charge"],
+        "gateway_charge": order.get("gateway_charge", 0),
         "status": "completed",
         "payment_id": order["id"],
-        "payment_method": "nowpayments",
+        "poll_id": order["poll_id"],
+        "payment_method": payment_method,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.transactions.insert_one(transaction_doc)
+    await db.transactions.insert_one(transaction_doc, session=session)
 
 
 def verify_ipn_signature(request_body: bytes, signature: str) -> bool:
     """Verify NOWPayments IPN signature using HMAC-SHA512"""
     try:
-        # Parse and sort the JSON
         data = json.loads(request_body.decode('utf-8'))
-        sorted_json = json.dumps(data, separators=(',', ':'), sort_keys=True)
-        
-        # Compute HMAC-SHA512
-        computed_signature = hmac.new(
-            NOWPAYMENTS_IPN_SECRET.encode(),
-            sorted_json.encode(),
-            hashlib.sha512
-        ).hexdigest()
+        computed_signature = sign_ipn_payload(data, NOWPAYMENTS_IPN_SECRET)
         
         return hmac.compare_digest(computed_signature.lower(), signature.lower())
     except Exception as e:
@@ -320,12 +510,11 @@ async def nowpayments_webhook(request: Request):
             logger.warning(f"Order not found for order_id: {order_id}")
             return {"status": "ignored", "reason": "Order not found"}
         
-        # Update order with payment details
+        # Update order with payment details; the paid status itself is only written by the crediting transaction
         await db.orders.update_one(
             {"id": order_id},
             {
                 "$set": {
-                    "payment_status": payment_status,
                     "payment_id": payment_id,
                     "actually_paid": actually_paid,
                     "updated_at": datetime.now(timezone.utc).isoformat()
@@ -333,15 +522,16 @@ async def nowpayments_webhook(request: Request):
             }
         )
         
-        if payment_status in ["finished", "confirmed"]:
-            if order["payment_status"] not in ["finished", "success"]:
-                await process_successful_payment(order)
+        if payment_status in CONFIRMED_STATUSES:
+            if not votes_applied(order) and await process_successful_payment(order) == "credited":
                 logger.info(f"Payment confirmed via IPN for order {order_id}")
             return {"status": "success", "event": "payment_confirmed"}
         
-        elif payment_status == "failed":
-            return {"status": "success", "event": "payment_failed"}
+        # A late or out-of-order IPN never moves a credited order back to an unpaid status
+        await db.orders.update_one({"id": order_id, **UNCREDITED_ORDER}, {"$set": {"payment_status": payment_status}})
         
+        if payment_status == "failed":
+            return {"status": "success", "event": "payment_failed"}
         elif payment_status in ["waiting", "confirming", "sending"]:
             return {"status": "success", "event": f"payment_{payment_status}"}
         
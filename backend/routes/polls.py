@@ -2,6 +2,9 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 
 from core.database import db
 from core.security import get_current_user
+from core.vote_counters import vote_counters
+from core.payouts import to_cents, cents_to_amount, per_vote_amount
+from core.archive import find_poll, find_user_votes, is_archived, votes_collection
 
 router = APIRouter(prefix="/api", tags=["polls"])
 
@@ -14,6 +17,7 @@ async def get_polls(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=
     total = await db.polls.count_documents({})
     
     polls = await db.polls.find({}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
+    await vote_counters.apply(polls)
     for poll in polls:
         total_votes = sum(option.get("votes_count", 0) for option in poll.get("options", []))
         poll["total_votes"] = total_votes
@@ -29,9 +33,11 @@ async def get_polls(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=
 
 @router.get("/polls/{poll_id}")
 async def get_poll(poll_id: str, current_user: dict = Depends(get_current_user)):
-    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
+    # Settled polls move to cold storage after a while; they stay readable by id
+    poll = await find_poll(poll_id)
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
+    await vote_counters.apply([poll])
     
     total_votes = sum(option.get("votes_count", 0) for option in poll.get("options", []))
     poll["total_votes"] = total_votes
@@ -44,10 +50,7 @@ async def get_poll(poll_id: str, current_user: dict = Depends(get_current_user))
         winning_option = poll["options"][winning_option_idx]
         
         winning_votes = winning_option.get("votes_count", 0)
-        if winning_votes > 0:
-            winning_amount_per_vote = total_amount_collected / winning_votes
-        else:
-            winning_amount_per_vote = 0
+        winning_amount_per_vote = per_vote_amount(to_cents(total_amount_collected), winning_votes)
         
         poll["result_details"] = {
             "winning_option_index": winning_option_idx,
@@ -58,7 +61,7 @@ async def get_poll(poll_id: str, current_user: dict = Depends(get_current_user))
             "winning_amount_per_vote": winning_amount_per_vote
         }
     
-    raw_votes = await db.user_votes.find({"user_id": current_user["id"], "poll_id": poll_id}, {"_id": 0}).to_list(100)
+    raw_votes = await votes_collection(poll).find({"user_id": current_user["id"], "poll_id": poll_id}, {"_id": 0}).to_list(100)
     
     options_map = {}
     for vote in raw_votes:
@@ -73,7 +76,9 @@ async def get_poll(poll_id: str, current_user: dict = Depends(get_current_user))
             }
         options_map[opt_idx]["num_votes"] += vote["num_votes"]
         options_map[opt_idx]["amount_paid"] += vote["amount_paid"]
-        options_map[opt_idx]["winning_amount"] += vote.get("winning_amount", 0)
+        options_map[opt_idx]["winning_amount"] = cents_to_amount(
+            to_cents(options_map[opt_idx]["winning_amount"]) + to_cents(vote.get("winning_amount", 0))
+        )
         if vote.get("result") == "win":
             options_map[opt_idx]["result"] = "win"
         elif vote.get("result") == "loss" and options_map[opt_idx]["result"] != "win":
@@ -85,14 +90,14 @@ async def get_poll(poll_id: str, current_user: dict = Depends(get_current_user))
     
     poll["user_total_votes"] = sum(v.get("num_votes", 0) for v in user_votes)
     poll["user_total_paid"] = sum(v.get("amount_paid", 0) for v in user_votes)
-    poll["user_total_winnings"] = sum(v.get("winning_amount", 0) for v in user_votes)
+    poll["user_total_winnings"] = cents_to_amount(sum(to_cents(v.get("winning_amount", 0)) for v in user_votes))
     
     return poll
 
 
 @router.get("/my-polls")
 async def get_my_polls(current_user: dict = Depends(get_current_user)):
-    votes = await db.user_votes.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
+    votes = await find_user_votes({"user_id": current_user["id"]}, 100)
     
     polls_map = {}
     for vote in votes:
@@ -100,15 +105,10 @@ async def get_my_polls(current_user: dict = Depends(get_current_user)):
         option_index = vote["option_index"]
         
         if poll_id not in polls_map:
-            poll = await db.polls.find_one({"id": poll_id}, {"_id": 0})
+            poll = await find_poll(poll_id)
             if poll:
-                winning_amount_per_vote = 0
-                if poll.get("status") == "result_declared" and poll.get("winning_option") is not None:
-                    total_amount = sum(opt.get("total_amount", 0) for opt in poll.get("options", []))
-                    winning_votes = poll["options"][poll["winning_option"]].get("votes_count", 0)
-                    if winning_votes > 0:
-                        winning_amount_per_vote = total_amount / winning_votes
-                
+                if not is_archived(poll):
+                    await vote_counters.apply([poll])
                 polls_map[poll_id] = {
                     "poll_id": poll_id,
                     "poll": poll,
@@ -117,8 +117,7 @@ async def get_my_polls(current_user: dict = Depends(get_current_user)):
                     "total_amount_paid": 0,
                     "total_winning_amount": 0,
                     "first_voted_at": vote["voted_at"],
-                    "overall_result": "pending",
-                    "winning_amount_per_vote": winning_amount_per_vote
+                    "overall_result": "pending"
                 }
         
         if poll_id in polls_map:
@@ -136,6 +135,8 @@ async def get_my_polls(current_user: dict = Depends(get_current_user)):
             opt = polls_map[poll_id]["options_voted"][option_index]
             opt["num_votes"] += vote["num_votes"]
             opt["amount_paid"] += vote["amount_paid"]
+            # Settlement stores each vote's exact whole-cent payout (core.payouts); sum it in cents
+            opt["winning_amount"] += to_cents(vote.get("winning_amount", 0)) if vote.get("result") == "win" else 0
             
             if vote.get("result") == "win":
                 opt["result"] = "win"
@@ -160,17 +161,14 @@ async def get_my_polls(current_user: dict = Depends(get_current_user)):
         options_list = list(polls_map[poll_id]["options_voted"].values())
         options_list.sort(key=lambda x: x["option_index"])
         
-        winning_amount_per_vote = polls_map[poll_id].get("winning_amount_per_vote", 0)
-        total_winning_amount = 0
+        total_winning_cents = 0
         for opt in options_list:
-            if opt["result"] == "win":
-                opt["winning_amount"] = opt["num_votes"] * winning_amount_per_vote
-                total_winning_amount += opt["winning_amount"]
+            total_winning_cents += opt["winning_amount"]
+            opt["winning_amount"] = cents_to_amount(opt["winning_amount"])
         
         polls_map[poll_id]["votes"] = options_list
-        polls_map[poll_id]["total_winning_amount"] = total_winning_amount
+        polls_map[poll_id]["total_winning_amount"] = cents_to_amount(total_winning_cents)
         del polls_map[poll_id]["options_voted"]
-        del polls_map[poll_id]["winning_amount_per_vote"]
     
     result = list(polls_map.values())
     result.sort(key=lambda x: x["first_voted_at"], reverse=True)
@@ -4,6 +4,7 @@ import uuid
 from datetime import datetime, timezone
 
 from core.database import db
+from core.archive import recent_transactions
 from core.security import get_current_user
 from models.schemas import KYCSubmit, WithdrawalRequest
 
@@ -92,7 +93,8 @@ async def request_withdrawal(withdrawal: WithdrawalRequest, current_user: dict =
 @router.get("/wallet")
 async def get_wallet(current_user: dict = Depends(get_current_user)):
     withdrawals = await db.withdrawal_requests.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
-    transactions = await db.transactions.find({"user_id": current_user["id"]}, {"_id": 0}).sort("created_at", -1).to_list(100)
+    # Old ledger rows are archived; they fill in when the user has fewer than 100 recent ones
+    transactions = await recent_transactions(current_user["id"], 100)
     
     return {
         "balance": current_user["cash_wallet"],
@@ -1,11 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import logging
 import os
 
 from core.config import CORS_ORIGINS
-from routes import auth, polls, payments, users, admin
+from core.database import ensure_indexes, ensure_transactions_supported
+from core.gateway import gateway
+from core.currency_quotes import currency_quotes
+from core.settlement import resume_settlement_jobs
+from core.poll_cleanup import resume_poll_deletions
+from core.archive import archiver, ensure_archive_collections
+from core.vote_events import vote_event_log
+from core.images import image_processor
+from core.static_files import UploadFiles
+from routes import auth, polls, payments, users, admin, images
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,10 +28,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Serve uploaded images
+# Serve uploaded images: immutable caching for content-named files, strong ETags, byte ranges
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/api/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+app.mount("/api/uploads", UploadFiles(directory=UPLOAD_DIR), name="uploads")
 
 # Include routers
 app.include_router(auth.router)
@@ -31,13 +39,26 @@ app.include_router(polls.router)
 app.include_router(payments.router)
 app.include_router(users.router)
 app.include_router(admin.router)
+app.include_router(images.router)
 
 
 @app.on_event("startup")
 async def startup_event():
+    await ensure_transactions_supported()
+    await ensure_indexes()
+    await ensure_archive_collections()
     await admin.create_default_admin()
+    currency_quotes.start()
+    vote_event_log.start()
+    await resume_settlement_jobs()
+    await resume_poll_deletions()
+    archiver.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    pass
+    await currency_quotes.stop()
+    await vote_event_log.stop()
+    await archiver.stop()
+    await gateway.aclose()
+    image_processor.shutdown()
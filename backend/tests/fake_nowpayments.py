@@ -0,0 +1,219 @@
+"""
+Local NOWPayments stand-in for load and fault testing.
+
+Implements the subset of the NOWPayments v1 API the payments router uses
+(/currencies, /min-amount, /estimate, /invoice, /payment/) and sends signed
+IPN callbacks with the same HMAC-SHA512 scheme checked by routes.payments.verify_ipn_signature.
+
+Run standalone (from backend/):
+    FAKE_NP_LATENCY_MS=200 FAKE_NP_ERROR_RATE=0.1 uvicorn tests.fake_nowpayments:app --port 8100
+and point the API at it with NOWPAYMENTS_API_URL=http://localhost:8100/v1.
+
+Fault-injection knobs can also be changed at runtime with PUT /_fake/config.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from core.gateway import sign_ipn_payload
+
+# Approximate USD prices and per-currency minimums (in USD) used by /estimate, /min-amount and /invoice
+USD_PRICES = {
+    "btc": 65000.0, "eth": 3200.0, "usdt": 1.0, "usdc": 1.0, "bnb": 580.0, "ltc": 80.0, "trx": 0.12,
+    "doge": 0.15, "sol": 150.0, "matic": 0.7, "xmr": 160.0, "ada": 0.45, "dot": 6.5, "xrp": 0.55,
+}
+MIN_USD = {"btc": 2.5, "eth": 2.0, "usdt": 1.0, "usdc": 1.0, "trx": 0.5, "doge": 1.0, "xmr": 3.0}
+DEFAULT_MIN_USD = 1.5
+CURRENCIES = list(USD_PRICES)
+
+
+class FakeConfig:
+    """Fault-injection and timing knobs (all overridable through FAKE_NP_* env vars)"""
+
+    def __init__(self, **overrides):
+        self.latency_ms = float(os.getenv("FAKE_NP_LATENCY_MS", "0"))
+        self.jitter_ms = float(os.getenv("FAKE_NP_JITTER_MS", "0"))
+        self.error_rate = float(os.getenv("FAKE_NP_ERROR_RATE", "0"))
+        self.timeout_rate = float(os.getenv("FAKE_NP_TIMEOUT_RATE", "0"))
+        self.hang_seconds = float(os.getenv("FAKE_NP_HANG_SECONDS", "60"))
+        self.confirm_after = float(os.getenv("FAKE_NP_CONFIRM_AFTER", "2"))
+        self.payment_fail_rate = float(os.getenv("FAKE_NP_PAYMENT_FAIL_RATE", "0"))
+        self.send_ipn = os.getenv("FAKE_NP_SEND_IPN", "1") == "1"
+        self.ipn_secret = os.getenv("FAKE_NP_IPN_SECRET", os.getenv("NOWPAYMENTS_IPN_SECRET", "fake-ipn-secret"))
+        self.api_key = os.getenv("FAKE_NP_API_KEY")  # None accepts any non-empty key
+        for key, value in overrides.items():
+            if not hasattr(self, key):
+                raise AttributeError(f"Unknown fake gateway setting: {key}")
+            setattr(self, key, value)
+
+    def as_dict(self) -> dict:
+        return {k: v for k, v in vars(self).items() if k != "ipn_secret"}
+
+
+def create_app(config: FakeConfig = None, ipn_transport: httpx.AsyncBaseTransport = None) -> FastAPI:
+    """Build a fake gateway app; ipn_transport lets tests deliver IPNs in-process (e.g. httpx.ASGITransport)"""
+    config = config or FakeConfig()
+    app = FastAPI(title="Fake NOWPayments")
+    app.state.config = config
+    app.state.invoices = {}
+    app.state.stats = {"requests": 0, "injected_errors": 0, "injected_timeouts": 0, "ipn_sent": 0, "ipn_failed": 0}
+    app.state.ipn_tasks = set()
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if not request.url.path.startswith("/v1/"):
+            return await call_next(request)
+        app.state.stats["requests"] += 1
+        if not request.headers.get("x-api-key") or (config.api_key and request.headers["x-api-key"] != config.api_key):
+            return JSONResponse({"statusCode": 403, "message": "Invalid api key"}, status_code=403)
+
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        roll = random.random()
+        if roll < config.timeout_rate:
+            app.state.stats["injected_timeouts"] += 1
+            await asyncio.sleep(config.hang_seconds)
+        elif roll < config.timeout_rate + config.error_rate:
+            app.state.stats["injected_errors"] += 1
+            return JSONResponse({"statusCode": 502, "message": "Injected gateway error"}, status_code=502)
+        return await call_next(request)
+
+    def payment_status(invoice: dict) -> str:
+        elapsed = time.monotonic() - invoice["created_monotonic"]
+        if elapsed < config.confirm_after / 2:
+            return "waiting"
+        if elapsed < config.confirm_after:
+            return "confirming"
+        return invoice["outcome"]
+
+    def payment_doc(invoice: dict) -> dict:
+        return {
+            "payment_id": invoice["payment_id"],
+            "invoice_id": invoice["id"],
+            "order_id": invoice["order_id"],
+            "payment_status": payment_status(invoice),
+            "price_amount": invoice["price_amount"],
+            "price_currency": invoice["price_currency"],
+            "pay_currency": invoice["pay_currency"],
+            "actually_paid": invoice["price_amount"] if payment_status(invoice) == "finished" else 0,
+        }
+
+    async def deliver_ipn(invoice: dict):
+        await asyncio.sleep(config.confirm_after)
+        payload = payment_doc(invoice)
+        signature = sign_ipn_payload(payload, config.ipn_secret)
+        try:
+            async with httpx.AsyncClient(transport=ipn_transport, timeout=10.0) as client:
+                response = await client.post(
+                    invoice["ipn_callback_url"],
+                    json=payload,
+                    headers={"x-nowpayments-sig": signature},
+                )
+            invoice["ipn_status_code"] = response.status_code
+            app.state.stats["ipn_sent"] += 1
+        except httpx.HTTPError:
+            app.state.stats["ipn_failed"] += 1
+
+    @app.get("/v1/currencies")
+    async def currencies():
+        return {"currencies": CURRENCIES}
+
+    @app.get("/v1/min-amount")
+    async def min_amount(currency_from: str, currency_to: str = None, fiat_equivalent: str = None):
+        if currency_from not in USD_PRICES:
+            raise HTTPException(status_code=400, detail="Currency not found")
+        min_usd = MIN_USD.get(currency_from, DEFAULT_MIN_USD)
+        result = {
+            "currency_from": currency_from,
+            "currency_to": currency_to or currency_from,
+            "min_amount": min_usd / USD_PRICES[currency_from],
+        }
+        if fiat_equivalent:
+            result["fiat_equivalent"] = min_usd
+        return result
+
+    @app.get("/v1/estimate")
+    async def estimate(amount: float, currency_from: str, currency_to: str):
+        if currency_from != "usd" or currency_to not in USD_PRICES:
+            raise HTTPException(status_code=400, detail="Unsupported pair")
+        return {
+            "currency_from": currency_from,
+            "amount_from": amount,
+            "currency_to": currency_to,
+            "estimated_amount": amount / USD_PRICES[currency_to],
+        }
+
+    @app.post("/v1/invoice")
+    async def create_invoice(request: Request):
+        body = await request.json()
+        for field in ("price_amount", "price_currency", "order_id"):
+            if field not in body:
+                raise HTTPException(status_code=400, detail=f"{field} is required")
+        pay_currency = body.get("pay_currency", "btc")
+        if body["price_amount"] < MIN_USD.get(pay_currency, DEFAULT_MIN_USD):
+            raise HTTPException(status_code=400, detail="Crypto amount is less than minimal")
+        invoice_id = str(random.randint(10**9, 10**10 - 1))
+        invoice = {
+            "id": invoice_id,
+            "payment_id": str(random.randint(10**9, 10**10 - 1)),
+            "order_id": body["order_id"],
+            "price_amount": body["price_amount"],
+            "price_currency": body["price_currency"],
+            "pay_currency": pay_currency,
+            "ipn_callback_url": body.get("ipn_callback_url"),
+            "outcome": "failed" if random.random() < config.payment_fail_rate else "finished",
+            "created_monotonic": time.monotonic(),
+            "token": uuid.uuid4().hex[:10],
+        }
+        app.state.invoices[invoice_id] = invoice
+        if config.send_ipn and invoice["ipn_callback_url"]:
+            task = asyncio.create_task(deliver_ipn(invoice))
+            app.state.ipn_tasks.add(task)
+            task.add_done_callback(app.state.ipn_tasks.discard)
+        return {
+            "id": invoice_id,
+            "order_id": invoice["order_id"],
+            "price_amount": invoice["price_amount"],
+            "price_currency": invoice["price_currency"],
+            "pay_currency": invoice["pay_currency"],
+            "invoice_url": f"http://fake-nowpayments.local/payment/?iid={invoice_id}&token={invoice['token']}",
+            "success_url": body.get("success_url"),
+            "cancel_url": body.get("cancel_url"),
+        }
+
+    @app.get("/v1/payment/")
+    async def list_payments(invoiceId: str = None):
+        invoices = app.state.invoices.values()
+        if invoiceId is not None:
+            invoices = [inv for inv in invoices if inv["id"] == invoiceId]
+        data = [payment_doc(inv) for inv in invoices]
+        return {"data": data, "limit": len(data), "page": 0, "pagesCount": 1, "total": len(data)}
+
+    @app.get("/_fake/config")
+    async def get_config():
+        return config.as_dict()
+
+    @app.put("/_fake/config")
+    async def update_config(request: Request):
+        updates = await request.json()
+        for key, value in updates.items():
+            if key not in config.as_dict():
+                raise HTTPException(status_code=400, detail=f"Unknown setting: {key}")
+            setattr(config, key, value)
+        return config.as_dict()
+
+    @app.get("/_fake/stats")
+    async def get_stats():
+        return {**app.state.stats, "invoices": len(app.state.invoices)}
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,150 @@
+"""
+Unit Tests for cold-storage archive reads
+Tests: Hot-then-archive fallback for polls, vote summaries and ledger rows, dedupe of documents mid-move,
+background archival runs with progress
+"""
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import core.archive as archive
+import core.database as database
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction == -1)
+        return self
+
+    async def to_list(self, limit):
+        return [dict(doc) for doc in self.docs[:limit]]
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def _match(self, query):
+        return [doc for doc in self.docs if all(doc.get(k) == v for k, v in query.items())]
+
+    def find(self, query, projection=None):
+        return FakeCursor(self._match(query))
+
+    async def find_one(self, query, projection=None):
+        matches = self._match(query)
+        return dict(matches[0]) if matches else None
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    names = ["polls", "archived_polls", "user_votes", "archived_user_votes", "transactions", "archived_transactions"]
+    fakes = {name: FakeCollection() for name in names}
+    for name, fake in fakes.items():
+        monkeypatch.setattr(archive.db, name, fake, raising=False)
+    return fakes
+
+
+class TestArchiveFallback:
+    """Reads fall back to the archive transparently"""
+
+    def test_poll_is_found_in_the_archive(self, collections):
+        collections["archived_polls"].docs.append({"id": "p1", "archived_at": "2026-01-01T00:00:00+00:00"})
+        poll = asyncio.run(archive.find_poll("p1"))
+        assert archive.is_archived(poll)
+        assert archive.votes_collection(poll) is collections["archived_user_votes"]
+        assert asyncio.run(archive.find_poll("missing")) is None
+
+    def test_hot_poll_wins_and_reads_hot_votes(self, collections):
+        collections["polls"].docs.append({"id": "p1", "status": "result_declared"})
+        collections["archived_polls"].docs.append({"id": "p1", "archived_at": "2026-01-01T00:00:00+00:00"})
+        poll = asyncio.run(archive.find_poll("p1"))
+        assert not archive.is_archived(poll)
+        assert archive.votes_collection(poll) is collections["user_votes"]
+
+    def test_vote_summaries_mid_move_are_not_double_counted(self, collections):
+        collections["user_votes"].docs += [{"id": "v1", "user_id": "u1"}, {"id": "v2", "user_id": "u1"}]
+        collections["archived_user_votes"].docs += [{"id": "v2", "user_id": "u1"}, {"id": "v3", "user_id": "u1"}]
+        votes = asyncio.run(archive.find_user_votes({"user_id": "u1"}, 100))
+        assert sorted(vote["id"] for vote in votes) == ["v1", "v2", "v3"]
+
+    def test_archived_transactions_fill_the_tail(self, collections):
+        collections["transactions"].docs += [
+            {"id": "t3", "user_id": "u1", "created_at": "2026-03-01"},
+            {"id": "t2", "user_id": "u1", "created_at": "2026-02-01"},
+        ]
+        collections["archived_transactions"].docs += [
+            {"id": "t2", "user_id": "u1", "created_at": "2026-02-01"},
+            {"id": "t1", "user_id": "u1", "created_at": "2025-01-01"},
+            {"id": "t0", "user_id": "u1", "created_at": "2024-01-01"},
+        ]
+        assert [t["id"] for t in asyncio.run(archive.recent_transactions("u1", 3))] == ["t3", "t2", "t1"]
+        assert [t["id"] for t in asyncio.run(archive.recent_transactions("u1", 2))] == ["t3", "t2"]
+
+
+class FakeSession:
+    """Motor session stand-in: mongomock has no sessions, so the callback runs with session=None"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        return await callback(None)
+
+
+class FakeClient:
+    async def start_session(self):
+        return FakeSession()
+
+
+class TestArchivalRun:
+    """On-demand archival runs in the background and records its progress"""
+
+    @pytest.fixture
+    def db(self, monkeypatch):
+        db = AsyncMongoMockClient()["archive_test"]
+        monkeypatch.setattr(archive, "db", db)
+        monkeypatch.setattr(database, "client", FakeClient())
+        return db
+
+    async def seed(self, db):
+        await db.polls.insert_many([
+            {"id": "p1", "status": "result_declared", "result_declared_at": "2020-01-01T00:00:00"},
+            {"id": "p2", "status": "active"}
+        ])
+        await db.user_votes.insert_many([{"id": f"v{i}", "poll_id": "p1"} for i in range(3)])
+        await db.transactions.insert_many([
+            {"id": "t1", "created_at": "2020-01-01T00:00:00"},
+            {"id": "t2", "created_at": "2999-01-01T00:00:00"}
+        ])
+
+    def test_run_completes_in_the_background(self, db):
+        async def scenario():
+            await self.seed(db)
+            archiver = archive.Archiver(interval_hours=0)
+            started = await archiver.start_run(started_by="admin")
+            # A second request while the first is running reports it instead of starting another
+            again = await archiver.start_run(started_by="admin")
+            await archiver._current
+            return started, again, await archiver.latest_run(), await db.archive_runs.count_documents({})
+
+        started, again, finished, runs = asyncio.run(scenario())
+        assert started["status"] == "running" and again["id"] == started["id"] and runs == 1
+        assert finished["id"] == started["id"]
+        assert (finished["status"], finished["total_polls"], finished["polls"]) == ("completed", 1, 1)
+        assert (finished["user_votes"], finished["transactions"]) == (3, 1)
+        assert finished["started_by"] == "admin" and finished["completed_at"]
+
+    def test_failed_run_is_recorded(self, db, monkeypatch):
+        async def broken(**kwargs):
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr(archive, "run_archival", broken)
+        run = asyncio.run(archive.Archiver(interval_hours=0).run())
+        assert (run["status"], run["error"]) == ("failed", "disk full")
@@ -0,0 +1,70 @@
+"""
+Tests for the per-currency minimum amount / USD estimate cache
+Tests: Refresh against the fake gateway, minimum lookups, staleness fallback
+"""
+import asyncio
+import httpx
+
+from core.gateway import NOWPaymentsGateway
+from core.currency_quotes import CurrencyQuoteCache, MIN_AMOUNT_SAFETY_MARGIN
+from fake_nowpayments import create_app, FakeConfig, MIN_USD, USD_PRICES
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 500.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(clock, fake_config=None):
+    fake = create_app(fake_config or FakeConfig())
+    gw = NOWPaymentsGateway("http://fake-nowpayments/v1", "test-key", transport=httpx.ASGITransport(app=fake))
+    return CurrencyQuoteCache(gateway=gw, currencies=["btc", "usdt", "nope"], refresh_seconds=60, clock=clock)
+
+
+class TestCurrencyQuoteCache:
+    """Quote refresh and lookups"""
+
+    def test_refresh_populates_minimums_and_estimates(self):
+        clock = FakeClock()
+        cache = make_cache(clock)
+        asyncio.run(cache.refresh_all())
+
+        assert cache.min_usd("btc") == round(MIN_USD["btc"] * MIN_AMOUNT_SAFETY_MARGIN, 2)
+        assert cache.min_usd("BTC") == cache.min_usd("btc")
+        assert abs(cache.estimate("btc", 13.0) - 13.0 / USD_PRICES["btc"]) < 1e-12
+        assert cache.get("nope") is None, "Unsupported currencies must not be cached"
+
+        snapshot = cache.snapshot(10.0)
+        assert [q["currency"] for q in snapshot] == ["btc", "usdt"]
+        assert snapshot[1]["estimated_amount"] == 10.0
+
+    def test_stale_quotes_are_ignored(self):
+        clock = FakeClock()
+        cache = make_cache(clock)
+        asyncio.run(cache.refresh_all())
+        clock.now += cache.max_age + 1
+        assert cache.min_usd("btc") is None
+        assert cache.estimate("btc", 5) is None
+
+    def test_gateway_errors_keep_previous_quotes(self):
+        clock = FakeClock()
+        config = FakeConfig()
+        cache = make_cache(clock, config)
+        asyncio.run(cache.refresh_all())
+        before = cache.get("btc")
+
+        config.error_rate = 1.0
+        clock.now += 10
+        asyncio.run(cache.refresh_all())
+        assert cache.get("btc") == before
+
+    def test_failed_refreshes_never_open_the_payment_breaker(self):
+        from core.currency_quotes import currency_quotes
+        from core.gateway import gateway
+
+        assert currency_quotes.gateway is not gateway
+        assert currency_quotes.gateway.breaker is not gateway.breaker
+        assert currency_quotes.gateway.retry_budget is not gateway.retry_budget
@@ -0,0 +1,197 @@
+"""
+Unit Tests for admin streaming exports
+Tests: batched cursor reads, per-batch user/poll enrichment, NDJSON and CSV encoding, list endpoint filters and sort,
+CSV formula escaping, archived poll titles on the paged admin lists
+"""
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import core.archive as archive
+import core.exports as exports
+import routes.admin as admin
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.sort_spec = None
+        self.batch = None
+
+    def sort(self, spec):
+        self.sort_spec = spec
+        key, direction = spec[0]
+        self.docs = sorted(self.docs, key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        self.batch = size
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.finds = []
+        self.cursors = []
+
+    def find(self, query, projection=None):
+        self.finds.append(query)
+        ids = query.get("id", {}).get("$in")
+        matched = [doc for doc in self.docs
+                   if (ids is None or doc["id"] in ids)
+                   and all(doc.get(key) == value for key, value in query.items() if key != "id")]
+        cursor = FakeCursor(matched)
+        self.cursors.append(cursor)
+        return cursor
+
+
+class FakeDb(dict):
+    """db.name and db["name"] access"""
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+@pytest.fixture
+def data(monkeypatch):
+    users = FakeCollection([
+        {"id": "u1", "name": "Asha", "email": "asha@example.com", "phone": "1", "upi_id": "asha@upi", "role": "user",
+         "created_at": "2026-01-01T00:00:00"},
+        {"id": "u2", "name": "Ravi", "email": "ravi@example.com", "phone": "2", "upi_id": None, "role": "user",
+         "created_at": "2026-01-02T00:00:00"}
+    ])
+    transactions = FakeCollection([
+        {"id": f"t{i}", "user_id": "u1" if i % 2 else "u2", "type": "vote", "amount": i, "poll_id": "p1",
+         "created_at": f"2026-01-{i + 1:02d}T00:00:00"}
+        for i in range(5)
+    ])
+    withdrawals = FakeCollection([
+        {"id": "w1", "user_id": "u1", "status": "pending", "amount": 10, "requested_at": "2026-02-01"},
+        {"id": "w2", "user_id": "u2", "status": "completed", "amount": 20, "requested_at": "2026-02-02"}
+    ])
+    collections = FakeDb(users=users, transactions=transactions, withdrawal_requests=withdrawals)
+    monkeypatch.setattr(exports, "db", collections)
+    poll_lookups = []
+
+    async def find_polls(poll_ids):
+        poll_lookups.append(poll_ids)
+        return {"p1": {"id": "p1", "title": "Best pizza"}}
+
+    monkeypatch.setattr(exports, "find_polls", find_polls)
+    return {"collections": collections, "poll_lookups": poll_lookups}
+
+
+def collect(name, query, fmt, batch_size):
+    async def run():
+        return [chunk async for chunk in exports.stream_export(name, query, fmt, batch_size=batch_size)]
+    return asyncio.run(run())
+
+
+class TestStreamExport:
+    """Rows are read and written one cursor batch at a time"""
+
+    def test_ndjson_batches_newest_first_with_details(self, data):
+        chunks = collect("transactions", exports.transactions_query(), "ndjson", batch_size=2)
+        # 5 rows in batches of 2: one chunk per batch, one user and poll lookup per batch
+        assert len(chunks) == 3
+        assert len(data["poll_lookups"]) == 3
+        assert len(data["collections"]["users"].finds) == 3
+        cursor = data["collections"]["transactions"].cursors[0]
+        assert cursor.batch == 2 and cursor.sort_spec == [("created_at", -1)]
+
+        rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+        assert [row["id"] for row in rows] == ["t4", "t3", "t2", "t1", "t0"]
+        assert rows[0]["user"] == {"name": "Ravi", "email": "ravi@example.com"}
+        assert rows[1]["poll"] == {"title": "Best pizza"}
+
+    def test_csv_header_once_and_nested_columns(self, data):
+        chunks = collect("withdrawals", exports.withdrawals_query("all"), "csv", batch_size=1)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        columns = exports.EXPORTS["withdrawals"]["columns"]
+        assert rows[0] == columns
+        assert len(rows) == 3
+        first = dict(zip(columns, rows[1]))
+        assert first["id"] == "w2" and first["user.name"] == "Ravi" and first["transaction_id"] == ""
+
+    def test_status_filter_matches_list_endpoint(self, data):
+        chunks = collect("withdrawals", exports.withdrawals_query("pending"), "ndjson", batch_size=100)
+        rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+        assert [row["id"] for row in rows] == ["w1"]
+        assert rows[0]["user"]["upi_id"] == "asha@upi"
+        assert exports.withdrawals_query("all") == exports.withdrawals_query(None) == {}
+
+    def test_empty_csv_is_header_only(self, data):
+        chunks = collect("withdrawals", {"status": "rejected"}, "csv", batch_size=10)
+        assert b"".join(chunks).decode().splitlines() == [",".join(exports.EXPORTS["withdrawals"]["columns"])]
+
+    def test_users_export_has_no_enrichment(self, data):
+        chunks = collect("users", exports.users_query(), "csv", batch_size=10)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        # Same order as the paged users list
+        assert [row[0] for row in rows[1:]] == ["u2", "u1"]
+        assert data["collections"]["users"].cursors[0].sort_spec == exports.USERS_SORT
+
+    def test_csv_formulas_are_neutralised(self, data):
+        data["collections"]["users"].docs.append(
+            {"id": "u3", "name": "=HYPERLINK(\"http://evil.example\")", "email": "@SUM(1)", "phone": "-1+2",
+             "cash_wallet": -5, "role": "user", "created_at": "2026-01-03T00:00:00"}
+        )
+        chunks = collect("users", exports.users_query(), "csv", batch_size=10)
+        columns = exports.EXPORTS["users"]["columns"]
+        row = dict(zip(columns, list(csv.reader(io.StringIO(b"".join(chunks).decode())))[1]))
+        assert row["name"] == "'=HYPERLINK(\"http://evil.example\")"
+        assert (row["email"], row["phone"]) == ("'@SUM(1)", "'-1+2")
+        # Numbers are not user text and stay numeric
+        assert row["cash_wallet"] == "-5"
+
+
+class TestColumnValue:
+    """CSV cells from dotted paths"""
+
+    def test_missing_and_structured_values(self):
+        doc = {"user": None, "lines": [{"option_index": 0, "num_votes": 2}]}
+        assert exports.column_value(doc, "user.name") is None
+        assert exports.column_value(doc, "absent") is None
+        assert json.loads(exports.column_value(doc, "lines")) == [{"option_index": 0, "num_votes": 2}]
+
+
+class TestListEnrichment:
+    """The paged admin lists share the export enrichment"""
+
+    def test_archived_poll_titles_are_shown(self, monkeypatch):
+        db = AsyncMongoMockClient()["exports_test"]
+        for module in (admin, archive, exports):
+            monkeypatch.setattr(module, "db", db)
+
+        async def run():
+            await db.users.insert_one({"id": "u1", "name": "Asha", "email": "asha@example.com", "phone": "1"})
+            await db.polls.insert_one({"id": "p1", "title": "Best pizza"})
+            await db.archived_polls.insert_one({"id": "p2", "title": "Best pasta"})
+            await db.orders.insert_many([
+                {"id": f"o{i}", "user_id": "u1", "poll_id": poll_id, "created_at": f"2026-01-0{i}"}
+                for i, poll_id in enumerate(["p1", "p2", "gone"], start=1)
+            ])
+            await db.transactions.insert_many([
+                {"id": "t1", "user_id": "u1", "poll_id": "p2", "type": "vote", "created_at": "2026-01-01"},
+                {"id": "t2", "user_id": "u1", "type": "withdrawal", "created_at": "2026-01-02"}
+            ])
+            orders = await admin.get_all_orders(page=1, limit=20, admin_user={})
+            transactions = await admin.get_all_transactions(page=1, limit=20, admin_user={})
+            return orders["items"], transactions["items"]
+
+        orders, transactions = asyncio.run(run())
+        assert [order["poll"] for order in orders] == [None, {"title": "Best pasta"}, {"title": "Best pizza"}]
+        assert orders[0]["user"] == {"name": "Asha", "email": "asha@example.com", "phone": "1"}
+        assert [txn["poll"] for txn in transactions] == [None, {"title": "Best pasta"}]
@@ -0,0 +1,118 @@
+"""
+Tests for the local NOWPayments stand-in
+Tests: Invoice/payment lifecycle, signed IPN delivery, fault injection through the gateway wrapper
+"""
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from core.gateway import NOWPaymentsGateway, CircuitBreaker, RetryBudget, GatewayUnavailable, sign_ipn_payload
+from fake_nowpayments import create_app, FakeConfig
+
+IPN_SECRET = "test-ipn-secret"
+
+
+def gateway_for(fake_app, failure_threshold=5, max_retries=0):
+    return NOWPaymentsGateway(
+        "http://fake-nowpayments/v1",
+        "test-key",
+        max_retries=max_retries,
+        backoff_base=0,
+        breaker=CircuitBreaker(failure_threshold, reset_timeout=60),
+        retry_budget=RetryBudget(1.0),
+        transport=httpx.ASGITransport(app=fake_app),
+    )
+
+
+def make_ipn_receiver():
+    """Minimal webhook endpoint that checks signatures the same way as routes.payments"""
+    receiver = FastAPI()
+    receiver.state.received = []
+
+    @receiver.post("/api/payments/webhook")
+    async def webhook(request: Request):
+        body = json.loads(await request.body())
+        valid = sign_ipn_payload(body, IPN_SECRET) == request.headers.get("x-nowpayments-sig")
+        receiver.state.received.append((body, valid))
+        return {"status": "success"}
+
+    return receiver
+
+
+class TestFakeGatewayLifecycle:
+    """Invoice creation, status progression and IPN callbacks"""
+
+    def test_invoice_progresses_to_finished_and_sends_signed_ipn(self):
+        receiver = make_ipn_receiver()
+        fake = create_app(
+            FakeConfig(confirm_after=0.2, ipn_secret=IPN_SECRET),
+            ipn_transport=httpx.ASGITransport(app=receiver),
+        )
+        gw = gateway_for(fake)
+
+        async def scenario():
+            response = await gw.post("/invoice", json={
+                "price_amount": 5.1,
+                "price_currency": "usd",
+                "pay_currency": "btc",
+                "order_id": "order_abc",
+                "ipn_callback_url": "http://api.local/api/payments/webhook",
+            })
+            assert response.status_code == 200
+            invoice = response.json()
+            assert invoice["invoice_url"]
+
+            first = await gw.get("/payment/", params={"invoiceId": invoice["id"]})
+            assert first.json()["data"][0]["payment_status"] == "waiting"
+
+            await asyncio.sleep(0.35)
+            later = await gw.get("/payment/", params={"invoiceId": invoice["id"]})
+            assert later.json()["data"][0]["payment_status"] == "finished"
+            await gw.aclose()
+
+        asyncio.run(scenario())
+        assert len(receiver.state.received) == 1
+        body, valid = receiver.state.received[0]
+        assert valid, "IPN signature must verify with the shared HMAC-SHA512 scheme"
+        assert body["order_id"] == "order_abc"
+        assert body["payment_status"] == "finished"
+
+    def test_missing_api_key_is_rejected(self):
+        fake = create_app(FakeConfig())
+
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), base_url="http://fake") as client:
+                return await client.get("/v1/currencies")
+
+        assert asyncio.run(scenario()).status_code == 403
+
+
+class TestFakeGatewayFaults:
+    """Fault-injection knobs drive the breaker"""
+
+    def test_error_rate_trips_breaker(self):
+        fake = create_app(FakeConfig(error_rate=1.0))
+        gw = gateway_for(fake, failure_threshold=3)
+
+        async def scenario():
+            for _ in range(3):
+                response = await gw.get("/currencies")
+                assert response.status_code == 502
+            with pytest.raises(GatewayUnavailable):
+                await gw.get("/currencies")
+
+        asyncio.run(scenario())
+        assert fake.state.stats["injected_errors"] == 3
+
+    def test_config_can_be_changed_at_runtime(self):
+        fake = create_app(FakeConfig(error_rate=1.0))
+
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), base_url="http://fake") as client:
+                updated = await client.put("/_fake/config", json={"error_rate": 0})
+                assert updated.json()["error_rate"] == 0
+                return await client.get("/v1/currencies", headers={"x-api-key": "k"})
+
+        assert asyncio.run(scenario()).status_code == 200
@@ -0,0 +1,102 @@
+"""
+Tests for on-demand image variants
+Tests: Disk LRU cache eviction and recency, /api/images whitelist, first-request generation and cache hits, Accept negotiation
+"""
+import io
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import routes.images as images
+from core.image_cache import DiskLRUCache
+from core.images import image_processor
+
+
+class TestDiskLRUCache:
+    """Size-bounded cache directory"""
+
+    def test_least_recently_used_files_are_evicted_first(self, tmp_path):
+        cache = DiskLRUCache(str(tmp_path), max_bytes=250)
+        cache.put("a", b"x" * 100)
+        time.sleep(0.01)
+        cache.put("b", b"x" * 100)
+        time.sleep(0.01)
+        assert cache.get("a") is not None  # a is now more recent than b
+        cache.put("c", b"x" * 100)
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.stats()["bytes"] == 200
+        assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+
+    def test_index_is_rebuilt_from_disk(self, tmp_path):
+        DiskLRUCache(str(tmp_path), max_bytes=1000).put("a", b"123")
+        reopened = DiskLRUCache(str(tmp_path), max_bytes=1000)
+        assert reopened.stats() == {"files": 1, "bytes": 3, "max_bytes": 1000}
+        assert open(reopened.get("a"), "rb").read() == b"123"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(images, "variant_cache", DiskLRUCache(str(tmp_path / "cache"), 10 * 1024 * 1024))
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1000), (10, 200, 90)).save(buffer, "WebP")
+    (tmp_path / "abc123_original.webp").write_bytes(buffer.getvalue())
+
+    app = FastAPI()
+    app.include_router(images.router)
+    yield TestClient(app)
+    image_processor.shutdown()
+
+
+class TestImageEndpoint:
+    """GET /api/images/{file_id}"""
+
+    def test_variant_is_generated_once_then_served_from_cache(self, client, tmp_path):
+        response = client.get("/api/images/abc123?w=400", headers={"Accept": "image/webp,*/*"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert "immutable" in response.headers["cache-control"]
+        assert Image.open(io.BytesIO(response.content)).size == (400, 250)
+
+        cached = tmp_path / "cache" / "abc123_400.webp"
+        mtime = cached.stat().st_mtime_ns
+        assert client.get("/api/images/abc123?w=400", headers={"Accept": "image/webp,*/*"}).content == response.content
+        assert os.path.exists(cached) and cached.stat().st_mtime_ns >= mtime
+
+    def test_format_is_negotiated_from_accept_and_cached_per_format(self, client, tmp_path):
+        chrome = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+        avif = client.get("/api/images/abc123?w=800", headers={"Accept": chrome})
+        assert avif.headers["content-type"] == "image/avif"
+        assert avif.headers["vary"] == "Accept"
+        assert Image.open(io.BytesIO(avif.content)).format == "AVIF"
+
+        fallback = client.get("/api/images/abc123?w=800", headers={"Accept": "image/*,*/*;q=0.8"})
+        assert Image.open(io.BytesIO(fallback.content)).format == "JPEG"
+        assert len(avif.content) < len(fallback.content)
+        assert sorted(os.listdir(tmp_path / "cache")) == ["abc123_800.avif", "abc123_800.jpeg"]
+
+        # An explicit format is a fixed resource and does not vary
+        assert "vary" not in client.get("/api/images/abc123?w=800&format=avif").headers
+
+    def test_negotiation_ignores_wildcards_and_refused_types(self):
+        assert images.negotiate_format("image/webp,image/avif;q=0") == "webp"
+        assert images.negotiate_format("IMAGE/AVIF; q=0.5") == "avif"
+        assert images.negotiate_format("image/*") == "jpeg"
+        assert images.negotiate_format(None) == "jpeg"
+
+    def test_jpeg_format(self, client):
+        response = client.get("/api/images/abc123?w=200&format=jpeg")
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.content)).format == "JPEG"
+
+    def test_parameters_outside_the_whitelist_are_rejected(self, client):
+        assert client.get("/api/images/abc123?w=333").status_code == 400
+        assert client.get("/api/images/abc123?format=tiff").status_code == 400
+        assert client.get("/api/images/..%2Fsecret").status_code == 404
+        assert client.get("/api/images/ffff0000").status_code == 404
@@ -0,0 +1,145 @@
+"""
+Unit Tests for upload image processing
+Tests: Variant rendering, process-pool pipeline with per-stage timings, upload size and pixel limits, content-addressed deduplication
+"""
+import asyncio
+import io
+import os
+import tempfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import core.image_store as image_store
+import routes.admin as admin
+from core.image_cache import DiskLRUCache
+from core.image_store import content_id, image_id_from_url
+from core.images import ImageProcessor, ImageTooLarge, encode_variant, open_image, render_variant, IMAGE_VARIANTS
+from core.security import get_admin_user
+
+
+def jpeg_bytes(size=(2400, 1600)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class TestRenderVariant:
+    """Single variant in-process"""
+
+    def test_variant_fits_its_box_and_reports_stage_timings(self, tmp_path):
+        path = tmp_path / "x_small.webp"
+        timings = render_variant(jpeg_bytes(), (400, 267), 85, str(path))
+        with Image.open(path) as img:
+            assert img.format == "WEBP"
+            assert img.width <= 400 and img.height <= 267
+        assert set(timings) == {"decode_ms", "resize_ms", "encode_ms", "write_ms"}
+
+    def test_rgba_png_is_flattened(self, tmp_path):
+        buffer = io.BytesIO()
+        Image.new("RGBA", (300, 300), (0, 0, 255, 128)).save(buffer, "PNG")
+        path = tmp_path / "x_thumb.webp"
+        render_variant(buffer.getvalue(), (200, 133), 85, str(path))
+        with Image.open(path) as img:
+            assert img.mode == "RGB"
+
+
+class TestImageProcessor:
+    """Whole upload through the process pool"""
+
+    def test_all_variants_are_written(self, tmp_path):
+        processor = ImageProcessor(workers=2, max_concurrent=1)
+
+        async def run():
+            return await processor.process_upload(jpeg_bytes(), "abc123", str(tmp_path))
+
+        try:
+            filenames, timings = asyncio.run(run())
+        finally:
+            processor.shutdown()
+        assert filenames == {name: f"abc123_{name}.webp" for name in IMAGE_VARIANTS}
+        assert all((tmp_path / filename).exists() for filename in filenames.values())
+        assert set(timings["variants"]) == set(IMAGE_VARIANTS)
+        with Image.open(tmp_path / "abc123_original.webp") as img:
+            assert img.size == (2400, 1600)
+
+
+class TestUploadLimits:
+    """Decompression-bomb guard, reduced decoding and the streamed upload endpoint"""
+
+    def test_oversized_dimensions_are_refused_before_decoding(self):
+        with pytest.raises(ImageTooLarge):
+            open_image(jpeg_bytes((400, 300)), max_pixels=100_000)
+        assert open_image(jpeg_bytes((400, 200)), max_pixels=100_000).size == (400, 200)
+
+    def test_jpeg_from_path_is_decoded_near_target_size(self, tmp_path):
+        source = tmp_path / "big.jpg"
+        source.write_bytes(jpeg_bytes((4000, 3000)))
+        data, _ = encode_variant(str(source), (400, 267), 85)
+        assert Image.open(io.BytesIO(data)).size == (356, 267)
+
+        # The draft decode never materialises the full 12 MP frame
+        img = open_image(str(source))
+        img.draft("RGB", (400, 267))
+        assert img.size == (500, 375)
+
+    def test_upload_endpoint_enforces_size_cap_and_cleans_up(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(image_store, "UPLOAD_DIR", str(tmp_path))
+        monkeypatch.setattr(admin, "IMAGE_MAX_UPLOAD_BYTES", 64 * 1024)
+        stored = {}
+
+        async def find_image(image_id):
+            return stored.get(image_id)
+
+        async def register_image(image_id, filenames, size):
+            stored[image_id] = {"id": image_id, "filenames": filenames, "size": size}
+
+        monkeypatch.setattr(image_store, "find_image", find_image)
+        monkeypatch.setattr(image_store, "register_image", register_image)
+        app = FastAPI()
+        app.include_router(admin.router)
+        app.dependency_overrides[get_admin_user] = lambda: {"id": "admin"}
+        client = TestClient(app)
+        spooled = set(os.listdir(tempfile.gettempdir()))
+
+        try:
+            small = client.post("/api/admin/upload-image", files={"file": ("a.jpg", jpeg_bytes((600, 400)), "image/jpeg")})
+            assert small.status_code == 200
+            assert (tmp_path / f"{small.json()['file_id']}_original.webp").exists()
+
+            # Same bytes again: same content id, nothing re-rendered
+            again = client.post("/api/admin/upload-image", files={"file": ("copy.jpg", jpeg_bytes((600, 400)), "image/jpeg")})
+            assert again.json()["file_id"] == small.json()["file_id"]
+            assert again.json()["deduplicated"] is True and again.json()["timings"] is None
+            assert again.json()["urls"] == small.json()["urls"]
+
+            large = os.urandom(200 * 1024)
+            assert client.post("/api/admin/upload-image", files={"file": ("b.jpg", large, "image/jpeg")}).status_code == 413
+            assert client.post("/api/admin/upload-image", files={"file": ("c.jpg", b"not an image", "image/jpeg")}).status_code == 400
+        finally:
+            image_store.image_processor.shutdown()
+        assert not {name for name in os.listdir(tempfile.gettempdir()) if name.startswith("upload-")} - spooled
+
+
+class TestImageStore:
+    """Content ids and reference cleanup helpers"""
+
+    def test_image_id_is_parsed_from_every_url_shape(self):
+        image_id = content_id("ab" * 32)
+        assert len(image_id) == 32
+        assert image_id_from_url(f"https://example.com/api/images/{image_id}?w=1200") == image_id
+        assert image_id_from_url(f"/api/uploads/{image_id}_original.webp") == image_id
+        assert image_id_from_url("/api/uploads/1a2b3c4d-5e6_large.webp") == "1a2b3c4d-5e6"
+        assert image_id_from_url("https://cdn.example.com/banner.png") is None
+        assert image_id_from_url(None) is None
+
+    def test_removing_an_image_discards_its_cached_variants(self, tmp_path):
+        cache = DiskLRUCache(str(tmp_path), max_bytes=1000)
+        cache.put("abc_400.webp", b"1")
+        cache.put("abc_800.jpeg", b"22")
+        cache.put("abd_400.webp", b"333")
+        cache.discard("abc_")
+        assert os.listdir(tmp_path) == ["abd_400.webp"]
+        assert cache.stats()["bytes"] == 3
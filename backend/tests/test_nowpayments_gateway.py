@@ -0,0 +1,190 @@
+"""
+Unit Tests for the NOWPayments gateway wrapper
+Tests: Circuit breaker transitions, jittered retries for idempotent reads, retry budget
+"""
+import asyncio
+import httpx
+import pytest
+
+from core.gateway import NOWPaymentsGateway, CircuitBreaker, RetryBudget, GatewayUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_gateway(handler, clock=None, failure_threshold=3, max_retries=2, budget_ratio=10.0):
+    clock = clock or FakeClock()
+    gw = NOWPaymentsGateway(
+        "http://fake-nowpayments/v1",
+        "test-key",
+        max_retries=max_retries,
+        backoff_base=0,
+        breaker=CircuitBreaker(failure_threshold, reset_timeout=30, clock=clock),
+        retry_budget=RetryBudget(budget_ratio, min_retries_per_second=0, clock=clock),
+        transport=httpx.MockTransport(handler),
+    )
+    return gw, clock
+
+
+class TestCircuitBreaker:
+    """Breaker state machine"""
+
+    def test_opens_after_threshold_and_half_opens_after_reset(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(2, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+
+        clock.now += 10
+        assert breaker.allow_request(), "One probe should pass once the reset timeout elapsed"
+        assert breaker.state == "half_open"
+        assert not breaker.allow_request(), "Only a single probe is allowed while half-open"
+
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.allow_request()
+
+    def test_failed_probe_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(1, reset_timeout=5, clock=clock)
+        breaker.record_failure()
+        clock.now += 5
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.snapshot()["times_opened"] == 2
+
+
+class TestGatewayRetries:
+    """Retry policy against injected faults"""
+
+    def test_idempotent_get_is_retried_until_success(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) < 3:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"currencies": ["btc"]})
+
+        gw, _ = make_gateway(handler, failure_threshold=10)
+        response = asyncio.run(gw.get("/currencies"))
+        assert response.status_code == 200
+        assert len(calls) == 3
+        assert calls[0].headers["x-api-key"] == "test-key"
+        assert gw.stats["retries"] == 2
+
+    def test_post_is_never_retried(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            raise httpx.ConnectError("boom", request=request)
+
+        gw, _ = make_gateway(handler, failure_threshold=10)
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(gw.post("/invoice", json={"price_amount": 5}))
+        assert len(calls) == 1
+
+    def test_client_errors_are_not_failures(self):
+        gw, _ = make_gateway(lambda request: httpx.Response(400, json={"message": "bad"}), failure_threshold=1)
+        response = asyncio.run(gw.get("/payment/"))
+        assert response.status_code == 400
+        assert gw.breaker.state == "closed"
+
+    def test_retry_budget_limits_amplification(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(502)
+
+        gw, _ = make_gateway(handler, failure_threshold=100, budget_ratio=0.0)
+        response = asyncio.run(gw.get("/currencies"))
+        assert response.status_code == 502
+        assert len(calls) == 1, "An exhausted budget must not allow any retry"
+        assert gw.stats["retries_denied"] == 1
+
+
+class TestGatewayFailFast:
+    """Open breaker short-circuits without network I/O"""
+
+    def test_open_breaker_rejects_without_calling_gateway(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            raise httpx.ReadTimeout("slow", request=request)
+
+        gw, clock = make_gateway(handler, failure_threshold=2, max_retries=0)
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(httpx.ReadTimeout):
+                    await gw.get("/currencies")
+            with pytest.raises(GatewayUnavailable):
+                await gw.get("/currencies")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+        metrics = gw.metrics()
+        assert metrics["breaker"]["state"] == "open"
+        assert metrics["stats"]["short_circuited"] == 1
+
+    def test_unfinished_probe_reopens_instead_of_wedging(self):
+        state = {"fail": "timeout"}
+
+        def handler(request):
+            if state["fail"] == "timeout":
+                raise httpx.ReadTimeout("slow", request=request)
+            if state["fail"] == "unexpected":
+                raise ValueError("bad payload")
+            return httpx.Response(200, json={"currencies": []})
+
+        gw, clock = make_gateway(handler, failure_threshold=1, max_retries=0)
+
+        async def scenario():
+            with pytest.raises(httpx.ReadTimeout):
+                await gw.get("/currencies")
+            # Probe fails with something other than a transport or status error
+            clock.now += 30
+            state["fail"] = "unexpected"
+            with pytest.raises(ValueError):
+                await gw.get("/currencies")
+            assert gw.breaker.state == "open"
+
+            # Probe cancelled mid-flight
+            clock.now += 30
+            started = asyncio.Event()
+
+            async def hang(*args, **kwargs):
+                started.set()
+                await asyncio.sleep(3600)
+
+            client = gw._get_client()
+            original = client.request
+            client.request = hang
+            task = asyncio.create_task(gw.get("/currencies"))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert gw.breaker.state == "open"
+            client.request = original
+
+            # The next probe still gets through and closes the breaker
+            clock.now += 30
+            state["fail"] = None
+            response = await gw.get("/currencies")
+            assert response.status_code == 200
+            assert gw.breaker.state == "closed"
+
+        asyncio.run(scenario())
@@ -0,0 +1,334 @@
+"""
+Unit Tests for vote payments
+Tests: Wallet-funded votes (debit, vote credit, validation), transaction error handling,
+basket orders, idempotent crediting from the IPN webhook, payments landing after the poll closed,
+replica set check
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import OperationFailure
+
+import core.database as database
+import core.vote_counters as vote_counters
+import core.vote_events as vote_events
+import routes.payments as payments
+from core.gateway import sign_ipn_payload
+from models.schemas import VoteRequest, BasketOrderRequest, BasketLine
+
+
+class FakeSession:
+    """Motor session stand-in: mongomock has no sessions, so the callback runs with session=None"""
+
+    def __init__(self, error=None):
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        if self.error:
+            raise self.error
+        return await callback(None)
+
+
+class FakeClient:
+    def __init__(self):
+        self.error = None
+
+    async def start_session(self):
+        return FakeSession(self.error)
+
+
+USER = {"id": "u1", "email": "voter@example.com", "name": "Voter"}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    db = AsyncMongoMockClient()["payments_test"]
+    client = FakeClient()
+    for module in (payments, vote_events, vote_counters):
+        monkeypatch.setattr(module, "db", db)
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(vote_events.vote_event_log, "deferred", False)
+    monkeypatch.setattr(vote_counters.vote_counters, "shards", 0)
+
+    async def seed():
+        await db.users.insert_one(dict(USER, cash_wallet=10.0))
+        await db.polls.insert_one({
+            "id": "p1", "title": "Best pizza", "status": "active", "vote_price": 2.0,
+            "options": [{"name": "Margherita", "votes_count": 0, "total_amount": 0},
+                        {"name": "Pepperoni", "votes_count": 0, "total_amount": 0}]
+        })
+    asyncio.run(seed())
+    return {"db": db, "client": client}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestPayFromWallet:
+    """Wallet votes debit and credit in one transaction"""
+
+    def test_debit_and_vote_credit(self, store):
+        db = store["db"]
+        result = run(payments.pay_from_wallet(VoteRequest(poll_id="p1", option_index=1, num_votes=3), current_user=USER))
+        assert result["status"] == "success"
+        assert result["amount"] == 6.0
+        assert result["wallet_balance"] == 4.0
+
+        user = run(db.users.find_one({"id": "u1"}))
+        assert user["cash_wallet"] == 4.0
+        order = run(db.orders.find_one({"id": result["order_id"]}))
+        assert order["payment_method"] == "wallet" and order["votes_credited"] is True
+        vote = run(db.user_votes.find_one({"user_id": "u1", "poll_id": "p1", "option_index": 1}))
+        assert (vote["num_votes"], vote["amount_paid"]) == (3, 6.0)
+        poll = run(db.polls.find_one({"id": "p1"}))
+        assert poll["options"][1]["votes_count"] == 3 and poll["options"][1]["total_amount"] == 6.0
+        [txn] = run(db.transactions.find({"user_id": "u1"}).to_list(None))
+        assert (txn["type"], txn["amount"], txn["payment_method"]) == ("vote", 6.0, "wallet")
+
+    def test_insufficient_balance_changes_nothing(self, store):
+        db = store["db"]
+        with pytest.raises(HTTPException) as error:
+            run(payments.pay_from_wallet(VoteRequest(poll_id="p1", option_index=0, num_votes=6), current_user=USER))
+        assert error.value.status_code == 400
+        assert error.value.detail == "Insufficient wallet balance"
+        assert run(db.users.find_one({"id": "u1"}))["cash_wallet"] == 10.0
+        assert run(db.orders.count_documents({})) == 0
+        assert run(db.user_votes.count_documents({})) == 0
+
+    def test_invalid_option_is_rejected(self, store):
+        with pytest.raises(HTTPException) as error:
+            run(payments.pay_from_wallet(VoteRequest(poll_id="p1", option_index=2, num_votes=1), current_user=USER))
+        assert error.value.status_code == 400
+        assert error.value.detail == "Invalid option"
+        assert run(store["db"].users.find_one({"id": "u1"}))["cash_wallet"] == 10.0
+
+    def test_persistent_write_conflict_is_a_clean_error(self, store):
+        store["client"].error = OperationFailure("WriteConflict", code=112)
+        with pytest.raises(HTTPException) as error:
+            run(payments.pay_from_wallet(VoteRequest(poll_id="p1", option_index=0, num_votes=1), current_user=USER))
+        assert error.value.status_code == 409
+
+
+class FakeGateway:
+    def __init__(self):
+        self.invoices = []
+
+    async def post(self, path, json=None):
+        self.invoices.append(json)
+        return httpx.Response(200, json={"id": f"inv_{len(self.invoices)}", "invoice_url": "https://pay.example/i"})
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    fake = FakeGateway()
+    monkeypatch.setattr(payments, "gateway", fake)
+    return fake
+
+
+def basket_order(store, gateway):
+    basket = BasketOrderRequest(poll_id="p1", pay_currency="usdt", lines=[
+        BasketLine(option_index=0, num_votes=1), BasketLine(option_index=1, num_votes=2), BasketLine(option_index=0, num_votes=1)
+    ])
+    result = run(payments.create_basket_order(basket, current_user=USER))
+    return result, run(store["db"].orders.find_one({"id": result["order_id"]}))
+
+
+class TestBasketOrders:
+    """One invoice for several options, every line credited"""
+
+    def test_lines_are_merged_and_priced(self, store, gateway):
+        result, order = basket_order(store, gateway)
+        assert result["lines"] == [
+            {"option_index": 0, "num_votes": 2, "base_amount": 4.0},
+            {"option_index": 1, "num_votes": 2, "base_amount": 4.0}
+        ]
+        assert result["base_amount"] == 8.0
+        [invoice] = gateway.invoices
+        assert invoice["price_amount"] == result["amount"] and invoice["order_id"] == result["order_id"]
+        assert order["num_votes"] == 4
+        assert order["payment_status"] == "waiting" and order["votes_credited"] is False
+
+    def test_invalid_line_is_rejected(self, store, gateway):
+        basket = BasketOrderRequest(poll_id="p1", lines=[BasketLine(option_index=5, num_votes=1)])
+        with pytest.raises(HTTPException) as error:
+            run(payments.create_basket_order(basket, current_user=USER))
+        assert error.value.status_code == 400
+        assert gateway.invoices == []
+
+    def test_every_line_is_credited_once(self, store, gateway):
+        db = store["db"]
+        _, order = basket_order(store, gateway)
+        assert run(payments.process_successful_payment(order)) == "credited"
+        assert run(payments.process_successful_payment(order)) is None
+
+        votes = {vote["option_index"]: vote for vote in run(db.user_votes.find({"user_id": "u1"}).to_list(None))}
+        assert {index: (vote["num_votes"], vote["amount_paid"]) for index, vote in votes.items()} == {0: (2, 4.0), 1: (2, 4.0)}
+        poll = run(db.polls.find_one({"id": "p1"}))
+        assert [option["votes_count"] for option in poll["options"]] == [2, 2]
+        assert run(db.vote_events.count_documents({"order_id": order["id"]})) == 2
+        [txn] = run(db.transactions.find({"payment_id": order["id"]}).to_list(None))
+        assert txn["amount"] == 8.0
+        order = run(db.orders.find_one({"id": order["id"]}))
+        assert order["payment_status"] == "finished" and order["votes_credited"] is True
+
+
+class TestWebhookCrediting:
+    """IPN handling decides on votes_credited, not on the payment status"""
+
+    @pytest.fixture
+    def ipn(self, store, monkeypatch):
+        monkeypatch.setattr(payments, "NOWPAYMENTS_IPN_SECRET", "ipn-secret")
+        app = FastAPI()
+        app.include_router(payments.router)
+        client = TestClient(app)
+
+        def send(order_id, status):
+            body = {"order_id": order_id, "payment_id": 42, "payment_status": status, "actually_paid": 1}
+            return client.post("/api/payments/webhook", content=json.dumps(body),
+                               headers={"x-nowpayments-sig": sign_ipn_payload(body, "ipn-secret")})
+        return send
+
+    def test_redelivery_credits_an_order_left_uncredited(self, store, gateway, ipn):
+        db = store["db"]
+        _, order = basket_order(store, gateway)
+        # A failed earlier attempt: the order looks paid, but its votes were never credited
+        run(db.orders.update_one({"id": order["id"]}, {"$set": {"payment_status": "finished"}}))
+
+        assert ipn(order["id"], "finished").json()["event"] == "payment_confirmed"
+        assert ipn(order["id"], "finished").status_code == 200
+        assert run(db.vote_events.count_documents({"order_id": order["id"]})) == 2
+        assert run(db.orders.find_one({"id": order["id"]}))["votes_credited"] is True
+
+    def test_late_ipn_does_not_downgrade_a_credited_order(self, store, gateway, ipn):
+        db = store["db"]
+        _, order = basket_order(store, gateway)
+        ipn(order["id"], "confirmed")
+        ipn(order["id"], "sending")
+        order = run(db.orders.find_one({"id": order["id"]}))
+        assert order["payment_status"] == "finished" and order["payment_id"] == 42
+
+    def test_orders_credited_before_the_flag_existed_are_left_alone(self, store, ipn):
+        db = store["db"]
+        run(db.orders.insert_one({"id": "legacy", "user_id": "u1", "poll_id": "p1", "option_index": 0,
+                                  "num_votes": 1, "base_amount": 2.0, "payment_status": "finished"}))
+        ipn("legacy", "finished")
+        assert run(db.vote_events.count_documents({})) == 0
+
+    def test_failed_crediting_is_retried_by_the_next_delivery(self, store, gateway, ipn):
+        db = store["db"]
+        _, order = basket_order(store, gateway)
+        store["client"].error = OperationFailure("WriteConflict", code=112)
+        assert ipn(order["id"], "finished").status_code == 500
+        assert run(db.orders.find_one({"id": order["id"]}))["payment_status"] == "waiting"
+
+        store["client"].error = None
+        ipn(order["id"], "finished")
+        assert run(db.vote_events.count_documents({"order_id": order["id"]})) == 2
+
+
+class TestPollClosedBeforePayment:
+    """Payments confirmed after the poll stopped taking votes go to the wallet, not the poll"""
+
+    def test_late_payment_is_refunded_to_the_wallet(self, store, gateway):
+        db = store["db"]
+        _, order = basket_order(store, gateway)
+        run(db.polls.update_one({"id": "p1"}, {"$set": {"status": "settling"}}))
+
+        assert run(payments.process_successful_payment(order)) == "refunded"
+        assert run(payments.process_successful_payment(order)) is None
+        assert run(db.users.find_one({"id": "u1"}))["cash_wallet"] == 18.0
+        assert run(db.user_votes.count_documents({})) == 0
+        assert run(db.vote_events.count_documents({})) == 0
+        assert [option["votes_count"] for option in run(db.polls.find_one({"id": "p1"}))["options"]] == [0, 0]
+        [txn] = run(db.transactions.find({"payment_id": order["id"]}).to_list(None))
+        assert (txn["type"], txn["amount"]) == ("refund", 8.0)
+
+        order = run(db.orders.find_one({"id": order["id"]}))
+        assert order["refunded_to_wallet"] is True and order["votes_credited"] is False
+        assert payments.votes_applied(order)
+
+    def test_order_is_not_stored_once_the_poll_closed(self, store, gateway, monkeypatch):
+        db = store["db"]
+        original = payments.claim_active_poll
+
+        async def closed_during_invoice(poll_id, session=None):
+            # A delete or settlement closed the poll while the invoice was being created
+            await db.polls.update_one({"id": poll_id}, {"$set": {"status": "deleting"}})
+            return await original(poll_id, session=session)
+
+        monkeypatch.setattr(payments, "claim_active_poll", closed_during_invoice)
+        with pytest.raises(HTTPException) as error:
+            basket_order(store, gateway)
+        assert error.value.status_code == 400
+        assert run(db.orders.count_documents({})) == 0
+
+    def test_verify_reports_the_refund(self, store, gateway):
+        db = store["db"]
+        _, order = basket_order(store, gateway)
+        run(db.polls.update_one({"id": "p1"}, {"$set": {"status": "result_declared"}}))
+        run(payments.process_successful_payment(order))
+        result = run(payments.verify_payment(order["id"], current_user=USER))
+        assert result["status"] == "refunded"
+        assert "$8.00" in result["message"]
+
+    def test_wallet_vote_rechecks_the_poll_inside_the_transaction(self, store, monkeypatch):
+        db = store["db"]
+        original = payments.credit_votes
+
+        async def close_then_credit(order, payment_method, session=None):
+            # The poll closes between the endpoint's status check and the transaction
+            await db.polls.update_one({"id": "p1"}, {"$set": {"status": "settling"}})
+            return await original(order, payment_method, session=session)
+
+        monkeypatch.setattr(payments, "credit_votes", close_then_credit)
+        with pytest.raises(HTTPException) as error:
+            run(payments.pay_from_wallet(VoteRequest(poll_id="p1", option_index=0, num_votes=1), current_user=USER))
+        assert error.value.status_code == 400 and error.value.detail == "Poll is not active"
+        assert run(db.user_votes.count_documents({})) == 0
+
+    def test_every_vote_mode_writes_the_poll_document(self, store, monkeypatch):
+        db = store["db"]
+        # Neither mode touches the poll's counters, so only the status claim conflicts with settlement
+        monkeypatch.setattr(vote_counters.vote_counters, "shards", 4)
+        monkeypatch.setattr(vote_events.vote_event_log, "deferred", True)
+        run(payments.pay_from_wallet(VoteRequest(poll_id="p1", option_index=0, num_votes=1), current_user=USER))
+        poll = run(db.polls.find_one({"id": "p1"}))
+        assert poll["vote_seq"] == 1
+        assert [option["votes_count"] for option in poll["options"]] == [0, 0]
+
+
+class TestTransactionsSupported:
+    """Startup refuses a standalone mongod"""
+
+    class Admin:
+        def __init__(self, hello):
+            self.hello = hello
+
+        async def command(self, name):
+            return self.hello
+
+    class Client:
+        def __init__(self, hello):
+            self.admin = TestTransactionsSupported.Admin(hello)
+
+    def test_standalone_is_refused(self, monkeypatch):
+        monkeypatch.setattr(database, "client", self.Client({"isWritablePrimary": True}))
+        with pytest.raises(RuntimeError):
+            run(database.ensure_transactions_supported())
+
+    def test_replica_set_and_mongos_are_accepted(self, monkeypatch):
+        for hello in ({"setName": "rs0"}, {"msg": "isdbgrid"}):
+            monkeypatch.setattr(database, "client", self.Client(hello))
+            run(database.ensure_transactions_supported())
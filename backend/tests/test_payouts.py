@@ -0,0 +1,51 @@
+"""
+Unit Tests for the whole-cent payout calculator
+Tests: Exact pot allocation, largest-remainder tie breaking, chunked allocation, zero-weight pots
+"""
+import numpy as np
+
+from core.payouts import plan_payouts, allocate, allocate_cents, to_cents, cents_to_amount, per_vote_amount
+
+
+class TestAllocateCents:
+    """Largest-remainder allocation"""
+
+    def test_payouts_sum_exactly_to_the_pot(self):
+        rng = np.random.default_rng(7)
+        weights = rng.integers(1, 50, size=10_000)
+        payouts = allocate_cents(123_456_789, weights)
+        assert payouts.dtype == np.int64
+        assert int(payouts.sum()) == 123_456_789
+        # Nobody is more than a cent away from their exact share
+        exact = 123_456_789 * weights / weights.sum()
+        assert np.all(np.abs(payouts - exact) < 1)
+
+    def test_leftover_cents_go_to_largest_remainders(self):
+        # Exact shares: 100 * [1, 2, 4] / 7 = 14.29, 28.57, 57.14 -> floors leave 1 cent for the 0.57 remainder
+        assert allocate_cents(100, [1, 2, 4]).tolist() == [14, 29, 57]
+
+    def test_ties_are_broken_by_position(self):
+        assert allocate_cents(100, [1, 1, 1]).tolist() == [34, 33, 33]
+        assert allocate_cents(200, [1, 1, 1]).tolist() == [67, 67, 66]
+
+    def test_chunked_allocation_matches_whole_allocation(self):
+        rng = np.random.default_rng(11)
+        weights = rng.integers(1, 20, size=5_003)
+        plan = plan_payouts(9_999_991, weights)
+        chunks = [allocate(plan, weights[start:start + 1000], start_index=start) for start in range(0, weights.size, 1000)]
+        assert np.array_equal(np.concatenate(chunks), allocate(plan, weights))
+
+    def test_no_winners_pays_nothing(self):
+        plan = plan_payouts(5_000, [])
+        assert plan["total_weight"] == 0
+        assert allocate(plan, []).tolist() == []
+        assert per_vote_amount(5_000, 0) == 0
+
+
+class TestCentConversion:
+    """Dollar <-> cent helpers"""
+
+    def test_round_trip(self):
+        assert to_cents(0.1 + 0.2) == 30
+        assert cents_to_amount(to_cents(12.345678)) == 12.35
+        assert per_vote_amount(1000, 3) == 3.33
@@ -0,0 +1,138 @@
+"""
+Unit Tests for poll delete cascades
+Tests: Refusing deletes that would strand winnings or payments, abandoned invoices, closing the poll before the check,
+orphaned upload file detection
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import core.database as database
+import core.poll_cleanup as poll_cleanup
+from core.poll_cleanup import orphan_files
+
+
+class FakeSession:
+    """Motor session stand-in: mongomock has no sessions, so the callback runs with session=None"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        return await callback(None)
+
+
+class FakeClient:
+    async def start_session(self):
+        return FakeSession()
+
+
+@pytest.fixture
+def poll_data(monkeypatch):
+    db = AsyncMongoMockClient()["poll_cleanup_test"]
+    monkeypatch.setattr(poll_cleanup, "db", db)
+    monkeypatch.setattr(database, "client", FakeClient())
+    monkeypatch.setattr(poll_cleanup, "schedule_poll_deletion", lambda poll_id: None)
+    return db
+
+
+def insert(db, name, doc):
+    asyncio.run(db[name].insert_one(doc))
+
+
+def blocker(poll):
+    return asyncio.run(poll_cleanup.deletion_blocker(poll))
+
+
+def hours_ago(hours):
+    return (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+
+
+class TestDeletionBlocker:
+    """Deletes that would strand money owed to voters are refused"""
+
+    def test_empty_poll_can_be_deleted(self, poll_data):
+        assert blocker({"id": "p1", "status": "active"}) is None
+
+    def test_settling_poll_is_refused(self, poll_data):
+        assert "settled" in blocker({"id": "p1", "status": "settling"})
+
+    def test_unfinished_settlement_is_refused(self, poll_data):
+        insert(poll_data, "poll_settlements", {"poll_id": "p1", "status": "failed"})
+        assert "settlement" in blocker({"id": "p1", "status": "result_declared"})
+
+    def test_active_poll_with_paid_votes_is_refused(self, poll_data):
+        insert(poll_data, "user_votes", {"poll_id": "p1"})
+        assert "paid votes" in blocker({"id": "p1", "status": "active"})
+
+    def test_settled_poll_can_be_deleted(self, poll_data):
+        insert(poll_data, "poll_settlements", {"poll_id": "p1", "status": "completed"})
+        insert(poll_data, "user_votes", {"poll_id": "p1"})
+        insert(poll_data, "orders", {"poll_id": "p1", "payment_status": "finished"})
+        assert blocker({"id": "p1", "status": "result_declared"}) is None
+
+    def test_payment_in_progress_is_refused(self, poll_data):
+        insert(poll_data, "orders", {"poll_id": "p1", "payment_status": "waiting", "created_at": hours_ago(1)})
+        assert "payments in progress" in blocker({"id": "p1", "status": "active"})
+
+    def test_abandoned_invoice_does_not_block(self, poll_data):
+        expired = hours_ago(poll_cleanup.INVOICE_EXPIRY_HOURS + 1)
+        insert(poll_data, "orders", {"poll_id": "p1", "payment_status": "waiting", "created_at": expired})
+        assert blocker({"id": "p1", "status": "active"}) is None
+        # Funds already seen by the gateway still block, however old the order
+        insert(poll_data, "orders", {"poll_id": "p1", "payment_status": "confirming", "created_at": expired})
+        assert "payments in progress" in blocker({"id": "p1", "status": "active"})
+
+
+class TestStartPollDeletion:
+    """The poll stops taking orders before the blockers are checked"""
+
+    def test_blocked_delete_restores_the_poll(self, poll_data, monkeypatch):
+        insert(poll_data, "polls", {"id": "p1", "status": "active"})
+        checked = []
+
+        async def order_created_meanwhile(poll):
+            checked.append((await poll_data.polls.find_one({"id": "p1"}))["status"])
+            return "Poll has payments in progress; wait for them to finish before deleting it"
+
+        monkeypatch.setattr(poll_cleanup, "deletion_blocker", order_created_meanwhile)
+        with pytest.raises(poll_cleanup.DeletionBlocked):
+            asyncio.run(poll_cleanup.start_poll_deletion({"id": "p1", "status": "active"}))
+        assert checked == ["deleting"]
+        assert asyncio.run(poll_data.polls.find_one({"id": "p1"}))["status"] == "active"
+        assert asyncio.run(poll_data.poll_deletions.count_documents({})) == 0
+
+    def test_poll_changed_since_it_was_read(self, poll_data):
+        insert(poll_data, "polls", {"id": "p1", "status": "settling"})
+        with pytest.raises(poll_cleanup.DeletionBlocked):
+            asyncio.run(poll_cleanup.start_poll_deletion({"id": "p1", "status": "active"}))
+        assert asyncio.run(poll_data.polls.find_one({"id": "p1"}))["status"] == "settling"
+
+    def test_poll_is_deleted_with_its_job(self, poll_data):
+        insert(poll_data, "polls", {"id": "p1", "status": "active"})
+        job = asyncio.run(poll_cleanup.start_poll_deletion({"id": "p1", "status": "active"}, started_by="admin"))
+        assert job["status"] == "running"
+        assert asyncio.run(poll_data.polls.count_documents({})) == 0
+        assert asyncio.run(poll_data.poll_deletions.find_one({"poll_id": "p1"}))["started_by"] == "admin"
+
+
+class TestOrphanFiles:
+    """Upload files nothing references"""
+
+    def test_only_unknown_image_ids_are_reported(self, tmp_path):
+        live, dead = "a" * 32, "b" * 32
+        (tmp_path / "cache").mkdir()
+        (tmp_path / f"{live}_original.webp").write_bytes(b"1")
+        (tmp_path / f"{dead}_original.webp").write_bytes(b"22")
+        (tmp_path / "cache" / f"{dead}_400.avif").write_bytes(b"333")
+        (tmp_path / "cache" / f".{dead}_400.avif.tmp").write_bytes(b"4444")
+        (tmp_path / "readme.txt").write_bytes(b"55555")
+
+        report = orphan_files(str(tmp_path), {live})
+        assert report["count"] == 2 and report["bytes"] == 5
+        assert sorted(report["sample"]) == sorted([f"cache/{dead}_400.avif", f"{dead}_original.webp"])
@@ -0,0 +1,153 @@
+"""
+Unit Tests for bulk poll import
+Tests: CSV/NDJSON parsing, per-row validation errors, chunked inserts, image attach and fetch with dedupe,
+refusing image URLs (and redirects) that point at loopback, private or link-local addresses
+"""
+import asyncio
+import io
+
+import httpx
+import pytest
+
+import core.poll_import as poll_import
+
+CSV = """title,description,image_url,options,vote_price,end_datetime
+Best pizza,Vote now,https://cdn.example.com/a.png,Margherita|Pepperoni,1.5,2026-12-01T00:00:00
+Broken,No options,https://cdn.example.com/b.png,,abc,2026-12-01T00:00:00
+Best pasta,Vote,https://cdn.example.com/a.png,Carbonara|Amatriciana|Pesto,2,2026-12-01T00:00:00
+"""
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.inserted = []
+        self.updates = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserted.append(list(docs))
+
+        class Result:
+            inserted_ids = [doc["id"] for doc in docs]
+        return Result()
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    polls, images = RecordingCollection(), RecordingCollection()
+    monkeypatch.setattr(poll_import.db, "polls", polls, raising=False)
+    monkeypatch.setattr(poll_import.db, "images", images, raising=False)
+    known = {"c" * 32}
+    ingested = []
+
+    async def find_image(image_id):
+        return {"id": image_id} if image_id in known else None
+
+    async def ingest(path, image_id, size):
+        ingested.append(image_id)
+        duplicate = image_id in known
+        known.add(image_id)
+        return {"original": f"{image_id}_original.webp"}, None, duplicate
+
+    async def host_addresses(host, port):
+        return {"internal.example.com": ["10.0.0.7"]}.get(host, ["93.184.216.34"])
+
+    monkeypatch.setattr(poll_import, "find_image", find_image)
+    monkeypatch.setattr(poll_import, "ingest", ingest)
+    monkeypatch.setattr(poll_import, "host_addresses", host_addresses)
+    return {"polls": polls, "images": images, "ingested": ingested}
+
+
+def run_import(text, fmt, **kwargs):
+    return asyncio.run(poll_import.import_polls(io.StringIO(text), fmt, "admin1", **kwargs))
+
+
+class TestPollImport:
+    """Rows are validated with the Poll schema and inserted in chunks"""
+
+    def test_csv_rows_are_imported_and_bad_rows_reported(self, store):
+        report = run_import(CSV, "csv", chunk_size=2)
+        assert (report["received"], report["imported"], report["failed"]) == (3, 2, 1)
+        assert report["errors"][0]["row"] == 3 and "vote_price" in report["errors"][0]["error"]
+        assert [len(chunk) for chunk in store["polls"].inserted] == [1, 1]
+        first = store["polls"].inserted[0][0]
+        assert first["options"] == [{"name": "Margherita", "votes_count": 0, "total_amount": 0},
+                                    {"name": "Pepperoni", "votes_count": 0, "total_amount": 0}]
+        assert first["status"] == "active" and first["created_by"] == "admin1"
+        # Without fetch_images external URLs are kept as given
+        assert first["image_url"] == "https://cdn.example.com/a.png"
+
+    def test_ndjson_errors_and_dry_run(self, store):
+        text = '{"title": "T", "description": "D", "image_url": "%s", "options": ["a", "b"], "vote_price": 1, "end_datetime": "x"}\n' % ("c" * 32)
+        text += "not json\n\n[1, 2]\n"
+        text += '{"title": "T", "description": "D", "image_url": "%s", "options": ["a"], "vote_price": 1, "end_datetime": "x"}\n' % ("d" * 32)
+        report = run_import(text, "ndjson", dry_run=True)
+        assert (report["received"], report["valid"], report["imported"]) == (4, 1, 0)
+        assert [(error["row"], error["error"].split(":")[0]) for error in report["errors"]] == [
+            (2, "Invalid JSON"), (4, "Each line must be a JSON object"), (5, "Unknown image id dddddddddddddddddddddddddddddddd")
+        ]
+        assert store["polls"].inserted == []
+
+    def test_images_are_fetched_once_per_url_and_attached(self, store):
+        requested = []
+
+        def handler(request):
+            requested.append(str(request.url))
+            if request.url.path == "/missing.png":
+                return httpx.Response(404)
+            return httpx.Response(200, content=request.url.path.encode() * 100)
+
+        text = CSV + "Gone,Vote,https://cdn.example.com/missing.png,A|B,1,2026-12-01T00:00:00\n"
+        report = run_import(text, "csv", fetch_images=True, transport=httpx.MockTransport(handler))
+
+        assert sorted(requested) == ["https://cdn.example.com/a.png", "https://cdn.example.com/missing.png"]
+        assert report["imported"] == 2 and report["images"] == {"fetched": 1}
+        assert {(error["row"], error["error"]) for error in report["errors"]} >= {(5, "Image fetch failed: HTTP 404")}
+        urls = {doc["image_url"] for doc in store["polls"].inserted[0]}
+        [image_id] = store["ingested"]
+        assert urls == {f"{poll_import.PUBLIC_BASE_URL}/api/images/{image_id}?w=1200"}
+        # Both polls reference the image: one counter update for the chunk
+        assert store["images"].updates == [({"id": image_id}, {"$inc": {"ref_count": 2}})]
+
+
+class TestImageFetchAddresses:
+    """Imports never fetch from the server's own network"""
+
+    def fetch(self, url, handler):
+        text = f"Pizza,Vote,{url},A|B,1,2026-12-01T00:00:00\n"
+        return run_import("title,description,image_url,options,vote_price,end_datetime\n" + text, "csv",
+                          fetch_images=True, transport=httpx.MockTransport(handler))
+
+    @pytest.mark.parametrize("url", [
+        "http://127.0.0.1/a.png", "http://[::1]/a.png", "http://10.1.2.3/a.png",
+        "http://169.254.169.254/latest/meta-data", "https://internal.example.com/a.png"
+    ])
+    def test_non_public_hosts_are_refused(self, store, url):
+        requested = []
+        report = self.fetch(url, lambda request: requested.append(request) or httpx.Response(200, content=b"x"))
+        assert requested == [] and report["imported"] == 0
+        assert "is not a public address" in report["errors"][0]["error"]
+
+    def test_redirects_are_checked_at_every_hop(self, store):
+        requested = []
+
+        def handler(request):
+            requested.append(str(request.url))
+            if request.url.host == "cdn.example.com":
+                return httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data"})
+            return httpx.Response(200, content=b"secret")
+
+        report = self.fetch("https://cdn.example.com/a.png", handler)
+        assert requested == ["https://cdn.example.com/a.png"]
+        assert "169.254.169.254 is not a public address" in report["errors"][0]["error"]
+
+    def test_public_redirect_is_followed(self, store):
+        def handler(request):
+            if request.url.path == "/old.png":
+                return httpx.Response(301, headers={"Location": "/new.png"})
+            return httpx.Response(200, content=b"image" * 100)
+
+        report = self.fetch("https://cdn.example.com/old.png", handler)
+        assert report["imported"] == 1 and report["images"] == {"fetched": 1}
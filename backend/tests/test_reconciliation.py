@@ -0,0 +1,59 @@
+"""
+Unit Tests for the vote counter reconciliation job
+Tests: Discrepancy detection between poll counters, user_votes and credited orders, per-option totals of credited orders
+"""
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from core.reconciliation import compare_totals, order_totals_pipeline
+
+
+class TestCompareTotals:
+    """Per-option comparison"""
+
+    def test_consistent_options_are_not_reported(self):
+        options = [{"votes_count": 3, "total_amount": 3.0}, {"votes_count": 0, "total_amount": 0}]
+        assert compare_totals("p1", options, {0: (3, 3.0000001)}, {0: (3, 3.0)}) == []
+
+    def test_counter_drift_is_reported_against_user_votes(self):
+        options = [{"votes_count": 5, "total_amount": 5.0}]
+        [d] = compare_totals("p1", options, {0: (7, 7.0)}, {0: (7, 7.0)})
+        assert d["counter"] == {"votes": 5, "amount": 5.0}
+        assert d["user_votes"] == {"votes": 7, "amount": 7.0}
+        assert (d["counter_mismatch"], d["orders_mismatch"]) == (True, False)
+
+    def test_orders_without_votes_are_reported(self):
+        options = [{"votes_count": 2, "total_amount": 2.0}]
+        [d] = compare_totals("p1", options, {0: (2, 2.0)}, {0: (4, 4.0)})
+        assert (d["counter_mismatch"], d["orders_mismatch"]) == (False, True)
+
+
+class TestOrderTotalsPipeline:
+    """Credited orders, basket lines included"""
+
+    def test_basket_lines_are_unwound(self):
+        async def run():
+            orders = AsyncMongoMockClient()["reconciliation_test"].orders
+            await orders.insert_many([
+                {"id": "o1", "poll_id": "p1", "option_index": 0, "num_votes": 2, "base_amount": 2.0,
+                 "payment_status": "finished", "votes_credited": True},
+                {"id": "o2", "poll_id": "p1", "payment_status": "success", "votes_credited": True, "lines": [
+                    {"option_index": 0, "num_votes": 1, "base_amount": 1.0},
+                    {"option_index": 1, "num_votes": 3, "base_amount": 3.0}
+                ]},
+                # Legacy order without the flag, counted by its paid status
+                {"id": "o3", "poll_id": "p1", "option_index": 1, "num_votes": 1, "base_amount": 1.0,
+                 "payment_status": "finished"},
+                # Not credited: unpaid, refunded to the wallet, or another poll
+                {"id": "o4", "poll_id": "p1", "option_index": 0, "num_votes": 5, "base_amount": 5.0,
+                 "payment_status": "waiting", "votes_credited": False},
+                {"id": "o5", "poll_id": "p1", "option_index": 1, "num_votes": 4, "base_amount": 4.0,
+                 "payment_status": "finished", "votes_credited": False, "refunded_to_wallet": True},
+                {"id": "o6", "poll_id": "p2", "option_index": 0, "num_votes": 9, "base_amount": 9.0,
+                 "payment_status": "finished", "votes_credited": True}
+            ])
+            return {row["_id"]: (row["votes"], row["amount"])
+                    async for row in orders.aggregate(order_totals_pipeline("p1"))}
+
+        assert asyncio.run(run()) == {0: (3, 3.0), 1: (4, 4.0)}
@@ -0,0 +1,25 @@
+"""
+Unit Tests for the paginated result-stats pipelines
+Tests: Winner/loser page matching, payout sort order, user join
+"""
+from routes.admin import result_page_pipeline
+
+
+class TestResultPagePipeline:
+    """Sorted, paginated vote pages joined with users"""
+
+    def test_winners_are_paged_by_payout(self):
+        pipeline = result_page_pipeline("poll-1", True, "desc", 3, 50)
+        assert pipeline[0] == {"$match": {"poll_id": "poll-1", "result": "win"}}
+        assert pipeline[1] == {"$sort": {"winning_amount": -1, "_id": -1}}
+        assert pipeline[2:4] == [{"$skip": 100}, {"$limit": 50}]
+
+    def test_losers_are_paged_by_amount_paid(self):
+        pipeline = result_page_pipeline("poll-1", False, "asc", 1, 20)
+        assert pipeline[0] == {"$match": {"poll_id": "poll-1", "result": "loss"}}
+        assert pipeline[1] == {"$sort": {"amount_paid": 1, "_id": 1}}
+
+    def test_users_are_joined_after_the_page_is_cut(self):
+        stages = [next(iter(stage)) for stage in result_page_pipeline("poll-1", True, "desc", 1, 50)]
+        assert stages.index("$lookup") > stages.index("$limit"), "Only the page's rows should be joined"
+        assert result_page_pipeline("poll-1", True, "desc", 1, 50)[4]["$lookup"]["from"] == "users"
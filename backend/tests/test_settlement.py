@@ -0,0 +1,362 @@
+"""
+Unit Tests for the bulk-write settlement engine
+Tests: Per-chunk vote results, aggregated wallet credits, ledger rows, streamed scans over 250k votes, job progress/ETA, dry-run previews,
+late votes stopping a job, lease-checked checkpoints, finishing job and poll together, reopening a poll whose setup failed
+"""
+import asyncio
+import bisect
+import tracemalloc
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import UpdateOne
+
+import core.database as database
+import core.settlement as settlement
+import core.vote_counters as vote_counters
+import core.vote_events as vote_events
+
+from core.payouts import plan_payouts
+from core.settlement import build_chunk_writes, iter_vote_chunks, settlement_progress, settlement_preview_pipeline, summarize_preview
+
+
+def vote(_id, user_id, option_index, num_votes):
+    return {"_id": _id, "id": f"vote-{_id}", "user_id": user_id, "option_index": option_index, "num_votes": num_votes}
+
+
+class TestBuildChunkWrites:
+    """Chunk -> bulk operations"""
+
+    def test_winners_and_losers_get_one_op_each(self):
+        votes = [vote(1, "u1", 0, 2), vote(2, "u2", 1, 5), vote(3, "u3", 0, 1)]
+        plan = plan_payouts(750, [2, 1])
+        vote_ops, user_ops, transactions = build_chunk_writes(votes, "poll-1", 0, plan, 0, "now")
+
+        assert vote_ops == [
+            UpdateOne({"_id": 1}, {"$set": {"result": "win", "winning_amount": 5.0}}),
+            UpdateOne({"_id": 2}, {"$set": {"result": "loss"}}),
+            UpdateOne({"_id": 3}, {"$set": {"result": "win", "winning_amount": 2.5}}),
+        ]
+        assert user_ops == [
+            UpdateOne({"id": "u1"}, {"$inc": {"cash_wallet": 5.0}}),
+            UpdateOne({"id": "u3"}, {"$inc": {"cash_wallet": 2.5}}),
+        ]
+        assert [(t["user_id"], t["amount"], t["type"], t["poll_id"]) for t in transactions] == [
+            ("u1", 5.0, "winning", "poll-1"),
+            ("u3", 2.5, "winning", "poll-1"),
+        ]
+
+    def test_wallet_credits_are_merged_per_user(self):
+        votes = [vote(1, "u1", 2, 1), vote(2, "u1", 2, 3)]
+        _, user_ops, transactions = build_chunk_writes(votes, "poll-1", 2, plan_payouts(400, [1, 3]), 0, "now")
+        assert user_ops == [UpdateOne({"id": "u1"}, {"$inc": {"cash_wallet": 4.0}})]
+        assert len(transactions) == 2
+
+    def test_all_losers_produce_no_wallet_or_ledger_writes(self):
+        _, user_ops, transactions = build_chunk_writes([vote(1, "u1", 1, 3)], "poll-1", 0, plan_payouts(0, []), 0, "now")
+        assert user_ops == []
+        assert transactions == []
+
+    def test_chunks_pay_exactly_the_pot(self):
+        # $10.00 over 3 equal winners cannot split evenly; the leftover cent goes to the first vote
+        votes = [vote(1, "u1", 0, 1), vote(2, "u2", 0, 1), vote(3, "u3", 0, 1)]
+        plan = plan_payouts(1000, [1, 1, 1])
+        _, _, first = build_chunk_writes(votes[:2], "poll-1", 0, plan, 0, "now")
+        _, _, second = build_chunk_writes(votes[2:], "poll-1", 0, plan, 2, "now")
+        assert [t["amount"] for t in first + second] == [3.34, 3.33, 3.33]
+
+
+class FakeVoteCursor:
+    def __init__(self, docs, projection):
+        self.docs = docs
+        self.projection = projection
+        self._limit = None
+
+    def sort(self, key, direction):
+        assert (key, direction) == ("_id", 1), "Settlement must scan votes in _id order"
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    async def to_list(self, length):
+        docs = self.docs[:min(self._limit, length)]
+        return [{k: doc[k] for k in self.projection if k in doc} for doc in docs]
+
+
+class FakeVoteCollection:
+    """In-memory user_votes supporting the keyset query iter_vote_chunks issues"""
+
+    def __init__(self, docs):
+        self.docs = sorted(docs, key=lambda d: d["_id"])
+        self.ids = [d["_id"] for d in self.docs]
+
+    def find(self, query, projection):
+        start = bisect.bisect_right(self.ids, query["_id"]["$gt"]) if "_id" in query else 0
+        # Only a window is handed to the cursor, like a server-side range scan would
+        window = self.docs[start:start + 20000]
+        return FakeVoteCursor([d for d in window if d["poll_id"] == query["poll_id"]], projection)
+
+
+def many_votes(n, poll_id="big-poll"):
+    return [
+        {"_id": i, "id": f"vote-{i}", "user_id": f"user-{i}", "poll_id": poll_id,
+         "option_index": i % 3, "num_votes": 1 + i % 5, "amount_paid": 1.0 + i % 5, "result": "pending"}
+        for i in range(n)
+    ]
+
+
+class TestStreamedSettlement:
+    """Settlement scans are complete and bounded for 250k vote documents"""
+
+    def test_all_250k_votes_are_visited_once_in_bounded_chunks(self):
+        collection = FakeVoteCollection(many_votes(250_000))
+        plan = plan_payouts(1_000_000, [1 + i % 5 for i in range(0, 250_000, 3)])
+
+        async def scan():
+            seen = 0
+            winners = 0
+            largest_chunk = 0
+            last_id = -1
+            async for chunk in iter_vote_chunks("big-poll", 1000, collection=collection):
+                assert chunk[0]["_id"] > last_id
+                last_id = chunk[-1]["_id"]
+                largest_chunk = max(largest_chunk, len(chunk))
+                seen += len(chunk)
+                _, _, transactions = build_chunk_writes(chunk, "big-poll", 0, plan, winners, "now")
+                winners += len(transactions)
+            return seen, winners, largest_chunk
+
+        seen, winners, largest_chunk = asyncio.run(scan())
+        assert seen == 250_000, "No vote may be dropped (the old code stopped at 1000)"
+        assert winners == len(range(0, 250_000, 3))
+        assert largest_chunk == 1000
+
+    def test_scan_resumes_after_checkpoint(self):
+        collection = FakeVoteCollection(many_votes(250_000))
+
+        async def scan():
+            return sum([len(chunk) async for chunk in iter_vote_chunks("big-poll", 5000, after_id=199_999, collection=collection)])
+
+        assert asyncio.run(scan()) == 50_000
+
+    def test_peak_memory_is_bounded_by_chunk_size(self):
+        collection = FakeVoteCollection(many_votes(250_000))
+
+        async def scan():
+            total = 0
+            async for chunk in iter_vote_chunks("big-poll", 1000, collection=collection):
+                total += sum(vote["num_votes"] for vote in chunk)
+            return total
+
+        tracemalloc.start()
+        total = asyncio.run(scan())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert total == sum(1 + i % 5 for i in range(250_000))
+        # Materialising all 250k projected votes at once would need well over 50 MB
+        assert peak < 4 * 1024 * 1024, f"Peak {peak / 1e6:.1f} MB"
+
+
+class TestSettlementProgress:
+    """Progress view of a settlement job"""
+
+    def test_running_job_reports_rate_and_eta(self):
+        progress = settlement_progress({
+            "poll_id": "poll-1", "status": "running", "winning_option": 0, "last_vote_id": object(),
+            "total_votes": 10_000, "processed_votes": 2_500, "winners": 800, "total_distributed": 1200.0,
+            "run_started_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-01T00:00:05+00:00",
+        })
+        assert progress["percent"] == 25.0
+        assert progress["votes_per_second"] == 500.0
+        assert progress["eta_seconds"] == 15.0
+        assert "last_vote_id" not in progress, "Checkpoint ObjectIds are internal"
+
+    def test_finished_job_has_no_eta(self):
+        progress = settlement_progress({
+            "poll_id": "poll-1", "status": "completed", "total_votes": 0, "processed_votes": 0,
+            "completed_at": "2024-01-01T00:01:00+00:00",
+        })
+        assert progress["percent"] == 100.0
+        assert progress["eta_seconds"] is None
+
+
+class TestSettlementPreview:
+    """Dry-run payouts from the preview aggregation"""
+
+    def test_every_option_is_previewed_with_the_settlement_pot(self):
+        poll = {"id": "poll-1", "options": [
+            {"name": "A", "total_amount": 6.0}, {"name": "B", "total_amount": 4.0}, {"name": "C", "total_amount": 0.0}
+        ]}
+        groups = [
+            {"_id": 0, "winners": 2, "winning_votes": 6, "top": [{"user_id": "u1", "num_votes": 4}, {"user_id": "u2", "num_votes": 2}]},
+            {"_id": 1, "winners": 1, "winning_votes": 4, "top": [{"user_id": "u3", "num_votes": 4}]},
+        ]
+        preview = summarize_preview(poll, groups)
+
+        assert preview["total_amount_collected"] == 10.0
+        a, b, c = preview["options"]
+        assert (a["winners"], a["per_vote_payout"], a["total_distributed"]) == (2, 1.67, 10.0)
+        assert [p["payout"] for p in a["top_payouts"]] == [6.66, 3.33]
+        assert b["top_payouts"] == [{"user_id": "u3", "num_votes": 4, "payout": 10.0}]
+        assert (c["winners"], c["per_vote_payout"], c["total_distributed"], c["top_payouts"]) == (0, 0, 0, [])
+
+    def test_pipeline_only_reads(self):
+        stages = [next(iter(stage)) for stage in settlement_preview_pipeline("poll-1", 5)]
+        assert stages == ["$match", "$group", "$group", "$sort"]
+
+
+class FakeSession:
+    """Motor session stand-in; falsy so mongomock, which has no sessions, accepts session=self"""
+
+    def __bool__(self):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        return await callback(self)
+
+
+class FakeClient:
+    async def start_session(self):
+        return FakeSession()
+
+
+class TestLateVotes:
+    """Votes added after the payout plan was fixed stop the job before they are paid"""
+
+    @pytest.fixture
+    def db(self, monkeypatch):
+        db = AsyncMongoMockClient()["settlement_test"]
+        for module in (settlement, vote_counters, vote_events):
+            monkeypatch.setattr(module, "db", db)
+        monkeypatch.setattr(database, "client", FakeClient())
+        return db
+
+    async def seed(self, db):
+        await db.polls.insert_one({"id": "p1", "status": "active", "options": [
+            {"name": "A", "votes_count": 3, "total_amount": 3.0}, {"name": "B", "votes_count": 1, "total_amount": 1.0}
+        ]})
+        await db.users.insert_many([{"id": "u1", "cash_wallet": 0}, {"id": "u2", "cash_wallet": 0}])
+        await db.user_votes.insert_many([
+            {"id": "v1", "user_id": "u1", "poll_id": "p1", "option_index": 0, "num_votes": 3},
+            {"id": "v2", "user_id": "u2", "poll_id": "p1", "option_index": 1, "num_votes": 1}
+        ])
+        poll = await db.polls.find_one({"id": "p1"}, {"_id": 0})
+        await settlement.start_settlement(poll, 0)
+
+    def test_unchanged_votes_settle(self, db):
+        async def scenario():
+            await self.seed(db)
+            await settlement.run_settlement("p1")
+            return await db.users.find_one({"id": "u1"})
+
+        assert asyncio.run(scenario())["cash_wallet"] == 4.0
+
+    def test_settlement_stops_when_winning_votes_grow(self, db):
+        async def scenario():
+            await self.seed(db)
+            # A vote credited after the plan was fixed
+            await db.user_votes.update_one({"id": "v1"}, {"$inc": {"num_votes": 2}})
+            with pytest.raises(settlement.StaleSettlement):
+                await settlement.run_settlement("p1")
+            job = await db.poll_settlements.find_one({"poll_id": "p1"})
+            user = await db.users.find_one({"id": "u1"})
+            return job, user
+
+        job, user = asyncio.run(scenario())
+        assert job["status"] == "failed" and "planned" in job["error"]
+        assert job["distributed_cents"] == 0
+        assert user["cash_wallet"] == 0
+
+
+class TestSettlementLease:
+    """Only the lease holder moves the checkpoint, and the job and poll finish together"""
+
+    @pytest.fixture
+    def db(self, monkeypatch):
+        db = AsyncMongoMockClient()["settlement_test"]
+        for module in (settlement, vote_counters, vote_events):
+            monkeypatch.setattr(module, "db", db)
+        monkeypatch.setattr(database, "client", FakeClient())
+        return db
+
+    seed = TestLateVotes.seed
+
+    def test_stalled_worker_does_not_commit_after_takeover(self, db, monkeypatch):
+        commit = settlement.run_in_transaction
+
+        async def commit_after_takeover(callback):
+            # The lease ran out while this worker was stalled and another worker claimed the job
+            await db.poll_settlements.update_one({"poll_id": "p1"}, {"$set": {"lease_owner": "other-worker"}})
+            return await commit(callback)
+
+        async def scenario():
+            await self.seed(db)
+            monkeypatch.setattr(settlement, "run_in_transaction", commit_after_takeover)
+            await settlement.run_settlement("p1")
+            return (await db.poll_settlements.find_one({"poll_id": "p1"}),
+                    await db.users.find_one({"id": "u1"}),
+                    await db.polls.find_one({"id": "p1"}))
+
+        job, user, poll = asyncio.run(scenario())
+        assert (job["status"], job["lease_owner"], job["processed_votes"]) == ("running", "other-worker", 0)
+        assert user["cash_wallet"] == 0
+        assert poll["status"] == "settling"
+
+    def test_settled_poll_left_settling_gets_its_result(self, db):
+        async def scenario():
+            await self.seed(db)
+            await settlement.run_settlement("p1")
+            # As if the process died between completing the job and declaring the result
+            await db.polls.update_one({"id": "p1"}, {"$set": {"status": "settling"}, "$unset": {"result_declared_at": ""}})
+            await settlement.resume_settlement_jobs()
+            return await db.polls.find_one({"id": "p1"})
+
+        poll = asyncio.run(scenario())
+        assert (poll["status"], poll["winning_option"]) == ("result_declared", 0)
+        assert poll["result_declared_at"]
+
+    def test_prepare_finishes_a_completed_job(self, db):
+        async def scenario():
+            await self.seed(db)
+            await settlement.run_settlement("p1")
+            await db.polls.update_one({"id": "p1"}, {"$set": {"status": "settling"}})
+            poll = await db.polls.find_one({"id": "p1"}, {"_id": 0})
+            job = await settlement.prepare_settlement(poll, 0)
+            return job, await db.polls.find_one({"id": "p1"}), await db.users.find_one({"id": "u1"})
+
+        job, poll, user = asyncio.run(scenario())
+        assert job["status"] == "completed" and poll["status"] == "result_declared"
+        assert user["cash_wallet"] == 4.0
+
+
+class TestStartSettlement:
+    """A settlement that could not be set up leaves the poll as it was"""
+
+    def test_failed_setup_reopens_the_poll(self, monkeypatch):
+        db = AsyncMongoMockClient()["settlement_test"]
+        for module in (settlement, vote_counters, vote_events):
+            monkeypatch.setattr(module, "db", db)
+        monkeypatch.setattr(database, "client", FakeClient())
+
+        async def failing_compact(poll_id=None):
+            raise vote_events.ConcurrentCompaction("Vote events were compacted concurrently")
+
+        monkeypatch.setattr(settlement.vote_event_log, "compact", failing_compact)
+
+        async def scenario():
+            await db.polls.insert_one({"id": "p1", "status": "active", "options": [{"name": "A", "votes_count": 0, "total_amount": 0}]})
+            poll = await db.polls.find_one({"id": "p1"}, {"_id": 0})
+            with pytest.raises(vote_events.ConcurrentCompaction):
+                await settlement.start_settlement(poll, 0)
+            return await db.polls.find_one({"id": "p1"}), await db.poll_settlements.count_documents({})
+
+        poll, jobs = asyncio.run(scenario())
+        assert (poll["status"], poll["winning_option"], jobs) == ("active", None, 0)
@@ -0,0 +1,94 @@
+"""
+Unit Tests for upload file serving
+Tests: Immutable caching, strong ETags and conditional requests, byte ranges, zero-copy sends
+"""
+import asyncio
+import os
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from core.static_files import UploadFiles, UploadFileResponse, parse_range
+
+NAME = "0123456789abcdef0123456789abcdef_original.webp"
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    (tmp_path / NAME).write_bytes(bytes(range(256)) * 4)
+    (tmp_path / "notes.txt").write_bytes(b"hello")
+    return tmp_path
+
+
+@pytest.fixture
+def client(upload_dir):
+    return TestClient(Starlette(routes=[Mount("/api/uploads", UploadFiles(directory=str(upload_dir)))]))
+
+
+class TestParseRange:
+    """Range header parsing"""
+
+    def test_ranges(self):
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=990-2000", 1000) == (990, 999)
+        assert parse_range("bytes=1000-", 1000) == "invalid"
+        assert parse_range("bytes=0-10,20-30", 1000) is None
+        assert parse_range("items=0-1", 1000) is None
+
+
+class TestUploadFiles:
+    """/api/uploads served through UploadFileResponse"""
+
+    def test_content_named_files_are_immutable_with_a_stable_etag(self, client):
+        response = client.get(f"/api/uploads/{NAME}")
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+        assert response.headers["etag"] == '"0123456789abcdef0123456789abcdef_original.webp-400"'
+        assert response.headers["accept-ranges"] == "bytes"
+        assert len(response.content) == 1024
+
+    def test_other_files_keep_default_caching(self, client):
+        response = client.get("/api/uploads/notes.txt")
+        assert response.status_code == 200 and "cache-control" not in response.headers
+        assert response.headers["etag"].startswith('"5-')
+
+    def test_matching_etag_is_not_modified(self, client):
+        etag = client.get(f"/api/uploads/{NAME}").headers["etag"]
+        response = client.get(f"/api/uploads/{NAME}", headers={"If-None-Match": f'"other", {etag}'})
+        assert response.status_code == 304 and response.content == b""
+        assert response.headers["etag"] == etag
+
+    def test_byte_range(self, client):
+        response = client.get(f"/api/uploads/{NAME}", headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.headers["content-range"] == "bytes 10-19/1024"
+        assert response.content == bytes(range(10, 20))
+
+        stale = client.get(f"/api/uploads/{NAME}", headers={"Range": "bytes=10-19", "If-Range": '"old"'})
+        assert stale.status_code == 200 and len(stale.content) == 1024
+
+        unsatisfiable = client.get(f"/api/uploads/{NAME}", headers={"Range": "bytes=5000-"})
+        assert unsatisfiable.status_code == 416
+        assert unsatisfiable.headers["content-range"] == "bytes */1024"
+
+    def test_zerocopy_extension_is_used_when_offered(self, upload_dir):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request"}
+
+        async def send(message):
+            if message["type"] == "http.response.zerocopy":
+                message = {**message, "data": os.pread(message["file"].fileno(), message["count"], message["offset"])}
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "headers": [(b"range", b"bytes=4-7")],
+                 "extensions": {"http.response.zerocopy": {}}}
+        asyncio.run(UploadFileResponse(str(upload_dir / NAME))(scope, receive, send))
+        assert messages[0]["status"] == 206
+        assert messages[1]["type"] == "http.response.zerocopy"
+        assert messages[1]["data"] == bytes(range(4, 8))
@@ -0,0 +1,51 @@
+"""
+Unit Tests for sharded poll vote counters
+Tests: Shard rollup merging, rollup cache freshness, unsharded mode leaving polls untouched
+"""
+import asyncio
+
+from core.vote_counters import VoteCounters, merge_counts, shard_id
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMergeCounts:
+    """Shard totals on top of the poll document's counts"""
+
+    def test_shard_totals_are_added_per_option(self):
+        options = [{"name": "A", "votes_count": 10, "total_amount": 10.0}, {"name": "B", "votes_count": 1, "total_amount": 1.0}]
+        merged = merge_counts(options, {0: (5, 5.5)})
+        assert merged == [
+            {"name": "A", "votes_count": 15, "total_amount": 15.5},
+            {"name": "B", "votes_count": 1, "total_amount": 1.0},
+        ]
+        assert options[0]["votes_count"] == 10, "The poll document must not be modified"
+
+    def test_shard_ids_are_stable(self):
+        assert shard_id("poll-1", 2, 7) == "poll-1:2:7"
+
+
+class TestRollupCache:
+    """Cached reads of the shard rollup"""
+
+    def test_fresh_rollups_are_served_from_cache(self):
+        clock = FakeClock()
+        counters = VoteCounters(shards=8, cache_seconds=2, clock=clock)
+        counters._rollups["poll-1"] = (clock.now, {1: (3, 3.0)})
+        poll = {"id": "poll-1", "options": [{"votes_count": 0, "total_amount": 0}, {"votes_count": 2, "total_amount": 2.0}]}
+
+        asyncio.run(counters.apply([poll]))
+        assert poll["options"][1] == {"votes_count": 5, "total_amount": 5.0}
+
+    def test_unsharded_mode_does_not_touch_polls(self):
+        counters = VoteCounters(shards=0)
+        counters._rollups["poll-1"] = (0, {0: (99, 99.0)})
+        poll = {"id": "poll-1", "options": [{"votes_count": 1, "total_amount": 1.0}]}
+        asyncio.run(counters.apply([poll]))
+        assert poll["options"][0]["votes_count"] == 1
@@ -0,0 +1,178 @@
+"""
+Unit Tests for the vote event log compaction
+Tests: Folding event batches into poll counter lines and per-user summary lines, upsert-based vote recording, starting the compaction worker only in deferred mode,
+leaving closed polls' events to settlement, overlapping compactors
+"""
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+import core.database as database
+import core.vote_counters as vote_counters
+import core.vote_events as vote_events
+from core.vote_events import fold_events
+
+
+def event(order_id, user_id, poll_id, option_index, num_votes, amount):
+    return {"order_id": order_id, "user_id": user_id, "poll_id": poll_id,
+            "option_index": option_index, "num_votes": num_votes, "amount": amount}
+
+
+class TestFoldEvents:
+    """Event batch -> counter and summary updates"""
+
+    def test_events_are_summed_per_poll_option(self):
+        poll_lines, _ = fold_events([
+            event("o1", "u1", "p1", 0, 2, 2.0),
+            event("o2", "u2", "p1", 0, 3, 3.0),
+            event("o3", "u2", "p1", 1, 1, 1.0),
+            event("o4", "u3", "p2", 0, 5, 5.0),
+        ])
+        assert poll_lines == {
+            "p1": [{"option_index": 0, "num_votes": 5, "base_amount": 5.0}, {"option_index": 1, "num_votes": 1, "base_amount": 1.0}],
+            "p2": [{"option_index": 0, "num_votes": 5, "base_amount": 5.0}],
+        }
+
+    def test_repeat_votes_fold_into_one_user_summary(self):
+        _, user_lines = fold_events([event("o1", "u1", "p1", 0, 2, 2.0), event("o2", "u1", "p1", 0, 1, 1.0)])
+        assert user_lines == {("u1", "p1", 0): {"option_index": 0, "num_votes": 3, "base_amount": 3.0, "payment_id": "o1"}}
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.calls = []
+
+    async def update_one(self, query, update, upsert=False, session=None):
+        self.calls.append((query, update, upsert))
+
+
+class TestRecordUserVote:
+    """Vote summaries are written with a single upsert"""
+
+    def test_one_upsert_per_line(self, monkeypatch):
+        collection = RecordingCollection()
+        monkeypatch.setattr(vote_events.db, "user_votes", collection, raising=False)
+        asyncio.run(vote_events.record_user_vote("u1", "p1", {"option_index": 2, "num_votes": 3, "base_amount": 4.5}, "order_1"))
+
+        [(query, update, upsert)] = collection.calls
+        assert upsert is True
+        assert query == {"user_id": "u1", "poll_id": "p1", "option_index": 2}
+        assert update["$inc"] == {"num_votes": 3, "amount_paid": 4.5}
+        assert update["$setOnInsert"]["payment_id"] == "order_1"
+        assert update["$setOnInsert"]["result"] == "pending"
+
+
+class TestCompactionWorker:
+    """The compaction loop only runs when counter updates are deferred"""
+
+    def test_not_started_without_deferred_mode(self):
+        async def run():
+            log = vote_events.VoteEventLog(deferred=False)
+            log.start()
+            assert log._task is None
+            await log.stop()
+        asyncio.run(run())
+
+    def test_started_in_deferred_mode(self, monkeypatch):
+        async def run():
+            log = vote_events.VoteEventLog(deferred=True, interval=3600)
+            monkeypatch.setattr(log, "compact", fake_compact)
+            log.start()
+            assert log._task is not None
+            await asyncio.sleep(0)
+            await log.stop()
+            assert log._task is None
+
+        async def fake_compact(poll_id=None):
+            return 0
+        asyncio.run(run())
+
+
+class FakeSession:
+    """Motor session stand-in; falsy so mongomock, which has no sessions, accepts session=self"""
+
+    def __bool__(self):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        return await callback(self)
+
+
+class FakeClient:
+    async def start_session(self):
+        return FakeSession()
+
+
+class TestCompactionScope:
+    """The background worker folds only polls still taking votes"""
+
+    def test_closed_poll_is_left_to_its_settlement(self, monkeypatch):
+        db = AsyncMongoMockClient()["vote_events_test"]
+        for module in (vote_events, vote_counters):
+            monkeypatch.setattr(module, "db", db)
+        monkeypatch.setattr(database, "client", FakeClient())
+        log = vote_events.VoteEventLog(deferred=True)
+        monkeypatch.setattr(vote_counters.vote_counters, "shards", 0)
+
+        async def run():
+            options = [{"name": "A", "votes_count": 0, "total_amount": 0}]
+            await db.polls.insert_many([{"id": "p1", "status": "active", "options": options},
+                                        {"id": "p2", "status": "settling", "options": options}])
+            for poll_id in ("p1", "p2"):
+                order = {"id": f"order-{poll_id}", "user_id": "u1", "poll_id": poll_id}
+                await log.append(order, [{"option_index": 0, "num_votes": 2, "base_amount": 2.0}], "wallet")
+            background = await log.compact()
+            pending = await db.vote_events.distinct("poll_id", {"compacted": False})
+            by_settlement = await log.compact("p2")
+            polls = {poll["id"]: poll async for poll in db.polls.find({})}
+            return background, pending, by_settlement, polls
+
+        background, pending, by_settlement, polls = asyncio.run(run())
+        assert (background, pending, by_settlement) == (1, ["p2"], 1)
+        assert polls["p1"]["options"][0]["votes_count"] == 2 and polls["p1"]["vote_seq"] == 1
+        assert polls["p2"]["options"][0]["votes_count"] == 2 and "vote_seq" not in polls["p2"]
+
+
+class TestConcurrentCompaction:
+    """Events another compactor claimed first are left to it"""
+
+    def test_overlapping_batch_is_retried_without_the_claimed_events(self, monkeypatch):
+        db = AsyncMongoMockClient()["vote_events_test"]
+        for module in (vote_events, vote_counters):
+            monkeypatch.setattr(module, "db", db)
+        monkeypatch.setattr(database, "client", FakeClient())
+        monkeypatch.setattr(vote_counters.vote_counters, "shards", 0)
+        log = vote_events.VoteEventLog(deferred=True)
+        commit = vote_events.run_in_transaction
+        overlaps = []
+
+        async def other_compactor_first(callback):
+            if not overlaps:
+                # Settlement's inline compaction claims one event between our read and our claim
+                overlaps.append(await db.vote_events.update_one({"order_id": "o1"}, {"$set": {"compacted": True}}))
+            pending = [event["_id"] async for event in db.vote_events.find({"compacted": False})]
+            try:
+                return await commit(callback)
+            except vote_events.ConcurrentCompaction:
+                # mongomock has no transactions; undo the aborted claim as the rollback would
+                await db.vote_events.update_many({"_id": {"$in": pending}}, {"$set": {"compacted": False}})
+                raise
+
+        async def run():
+            await db.polls.insert_one({"id": "p1", "status": "active", "options": [{"name": "A", "votes_count": 0, "total_amount": 0}]})
+            for order_id in ("o1", "o2"):
+                order = {"id": order_id, "user_id": order_id, "poll_id": "p1"}
+                await log.append(order, [{"option_index": 0, "num_votes": 1, "base_amount": 1.0}], "wallet")
+            monkeypatch.setattr(vote_events, "run_in_transaction", other_compactor_first)
+            compacted = await log.compact()
+            return compacted, await db.polls.find_one({"id": "p1"})
+
+        compacted, poll = asyncio.run(run())
+        assert compacted == 1
+        assert poll["options"][0]["votes_count"] == 1
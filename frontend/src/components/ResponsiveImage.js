@@ -39,19 +39,23 @@ export default function ResponsiveImage({
     );
   }
 
-  // Check if it's an uploaded image (has responsive versions)
-  const isUploadedImage = src.includes('/api/uploads/') && src.includes('_large.webp');
+  // Uploaded images are served by /api/images, which renders any whitelisted width on demand and
+  // picks AVIF/WebP/JPEG from the browser's Accept header. Older uploads linked their pre-rendered
+  // _large.webp file; their stored original lets /api/images serve them the same way.
+  const legacyUpload = src.match(/^(.*)\/api\/uploads\/([0-9a-f-]+)_large\.webp$/);
+  const baseUrl = legacyUpload
+    ? `${legacyUpload[1]}/api/images/${legacyUpload[2]}`
+    : src.includes('/api/images/') ? src.split('?')[0] : null;
   
   let srcSet = null;
-  if (isUploadedImage) {
-    // Generate srcSet for uploaded images
-    const baseUrl = src.replace('_large.webp', '');
+  if (baseUrl) {
     srcSet = `
-      ${baseUrl}_small.webp 400w,
-      ${baseUrl}_medium.webp 800w,
-      ${baseUrl}_large.webp 1200w
+      ${baseUrl}?w=400 400w,
+      ${baseUrl}?w=800 800w,
+      ${baseUrl}?w=1200 1200w
     `;
   }
+  const imageSrc = baseUrl ? `${baseUrl}?w=1200` : src;
 
   return (
     <div style={{ position: 'relative', overflow: 'hidden', ...style }} className={className}>
@@ -72,7 +76,7 @@ export default function ResponsiveImage({
       )}
       
       <img
-        src={src}
+        src={imageSrc}
         srcSet={srcSet}
         sizes={sizes}
         alt={alt}
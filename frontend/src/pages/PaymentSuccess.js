@@ -38,8 +38,8 @@ export default function PaymentSuccess() {
         if (retryTimeoutRef.current) {
           clearTimeout(retryTimeoutRef.current);
         }
-      } else if (response.data.status === 'failed') {
-        setStatus('error');
+      } else if (response.data.status === 'failed' || response.data.status === 'refunded') {
+        setStatus(response.data.status === 'refunded' ? 'refunded' : 'error');
         setMessage(response.data.message);
         if (retryTimeoutRef.current) {
           clearTimeout(retryTimeoutRef.current);
@@ -120,6 +120,22 @@ export default function PaymentSuccess() {
             </div>
           )}
 
+          {status === 'refunded' && (
+            <div data-testid="payment-refunded">
+              <Wallet size={64} color="#10b981" style={{ margin: '0 auto 24px' }} />
+              <h2 style={{ fontSize: '28px', fontWeight: '800', color: '#1f2937', marginBottom: '12px' }}>Poll Closed</h2>
+              <p style={{ fontSize: '16px', color: '#6b7280', marginBottom: '32px' }}>{message}</p>
+              <button
+                onClick={() => navigate('/wallet')}
+                className="gradient-button"
+                data-testid="go-to-wallet"
+                style={{ color: 'white', padding: '14px 32px', borderRadius: '12px', border: 'none', fontSize: '16px', fontWeight: '600', cursor: 'pointer' }}
+              >
+                View Wallet
+              </button>
+            </div>
+          )}
+
           {status === 'error' && (
             <div data-testid="payment-error">
               <XCircle size={64} color="#ef4444" style={{ margin: '0 auto 24px' }} />
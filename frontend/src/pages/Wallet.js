@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import Header from '../components/Header';
-import { Wallet as WalletIcon, ArrowDownToLine, ArrowUpRight, TrendingUp } from 'lucide-react';
+import { Wallet as WalletIcon, ArrowDownToLine, ArrowUpRight, ArrowDownLeft, TrendingUp } from 'lucide-react';
 import { format } from 'date-fns';
 import { toast } from 'sonner';
 import { authHeaders } from '../auth';
@@ -188,17 +188,18 @@ export default function Wallet() {
                   <div style={{ display: 'flex', alignItems: 'center', gap: '12px' }}>
                     {transaction.type === 'vote' && <ArrowUpRight size={20} color="#ef4444" />}
                     {transaction.type === 'winning' && <TrendingUp size={20} color="#10b981" />}
+                    {transaction.type === 'refund' && <ArrowDownLeft size={20} color="#10b981" />}
                     <div>
                       <div style={{ fontSize: '14px', fontWeight: '600', color: '#1f2937' }}>
-                        {transaction.type === 'vote' ? 'Vote Payment' : 'Poll Winning'}
+                        {transaction.type === 'vote' ? 'Vote Payment' : transaction.type === 'refund' ? 'Vote Refund' : 'Poll Winning'}
                       </div>
                       <div style={{ fontSize: '13px', color: '#6b7280' }}>
                         {format(new Date(transaction.created_at), 'MMM d, yyyy h:mm a')}
                       </div>
                     </div>
                   </div>
-                  <div style={{ fontSize: '16px', fontWeight: '700', color: transaction.type === 'winning' ? '#10b981' : '#ef4444' }}>
-                    {transaction.type === 'winning' ? '+' : '-'}${transaction.amount.toFixed(2)}
+                  <div style={{ fontSize: '16px', fontWeight: '700', color: transaction.type === 'vote' ? '#ef4444' : '#10b981' }}>
+                    {transaction.type === 'vote' ? '-' : '+'}${transaction.amount.toFixed(2)}
                   </div>
                 </div>
               ))}
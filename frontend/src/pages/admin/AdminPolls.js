@@ -52,15 +52,19 @@ export default function AdminPolls() {
     window.scrollTo({ top: 0, behavior: 'smooth' });
   };
 
-  const fetchPollStats = async (pollId) => {
-    if (pollStats[pollId]) {
+  const fetchPollStats = async (pollId, winnersPage = null, losersPage = null) => {
+    // Without a page the button just toggles the cached stats
+    if (pollStats[pollId] && winnersPage === null && losersPage === null) {
       setExpandedPoll(expandedPoll === pollId ? null : pollId);
       return;
     }
 
     setLoadingStats({ ...loadingStats, [pollId]: true });
     try {
-      const response = await axios.get(`${API_URL}/admin/polls/${pollId}/result-stats`, { headers: authHeaders() });
+      const response = await axios.get(
+        `${API_URL}/admin/polls/${pollId}/result-stats?winners_page=${winnersPage || 1}&losers_page=${losersPage || 1}&limit=50`,
+        { headers: authHeaders() }
+      );
       setPollStats({ ...pollStats, [pollId]: response.data });
       setExpandedPoll(pollId);
     } catch (error) {
@@ -96,7 +100,7 @@ export default function AdminPolls() {
       toast.success('Poll deleted successfully');
       fetchPolls(currentPage);
     } catch (error) {
-      toast.error('Failed to delete poll');
+      toast.error(error.response?.data?.detail || 'Failed to delete poll');
     }
   };
 
@@ -104,7 +108,19 @@ export default function AdminPolls() {
     if (!window.confirm(`Set option ${winningOptionIndex + 1} as winner?`)) return;
     try {
       await axios.post(`${API_URL}/admin/polls/${pollId}/set-result?winning_option_index=${winningOptionIndex}`, {}, { headers: authHeaders() });
-      toast.success('Result declared successfully');
+      toast.info('Result declaration started');
+      fetchPolls(currentPage);
+      // Settlement runs in the background; poll its progress until it finishes
+      let progress;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        progress = (await axios.get(`${API_URL}/admin/polls/${pollId}/settlement`, { headers: authHeaders() })).data;
+      } while (progress.status === 'running');
+      if (progress.status === 'completed') {
+        toast.success('Result declared successfully');
+      } else {
+        toast.error(progress.error || 'Result declaration failed');
+      }
       fetchPolls(currentPage);
       // Clear cached stats to reload fresh data
       setPollStats({ ...pollStats, [pollId]: null });
@@ -194,6 +210,18 @@ export default function AdminPolls() {
     setFormData({ ...formData, options: newOptions });
   };
 
+  const renderStatsPager = (pollId, list, onPageChange) => {
+    if (list.pages <= 1) return null;
+    const buttonStyle = { padding: '6px 12px', borderRadius: '6px', border: '1px solid #e5e7eb', background: 'white', fontSize: '12px', cursor: 'pointer' };
+    return (
+      <div style={{ display: 'flex', justifyContent: 'flex-end', alignItems: 'center', gap: '8px', marginTop: '8px', fontSize: '12px', color: '#6b7280' }}>
+        <button style={buttonStyle} disabled={list.page <= 1 || loadingStats[pollId]} onClick={() => onPageChange(list.page - 1)}>Previous</button>
+        <span>Page {list.page} of {list.pages}</span>
+        <button style={buttonStyle} disabled={list.page >= list.pages || loadingStats[pollId]} onClick={() => onPageChange(list.page + 1)}>Next</button>
+      </div>
+    );
+  };
+
   const renderResultStats = (pollId) => {
     const stats = pollStats[pollId];
     if (!stats) return null;
@@ -209,20 +237,20 @@ export default function AdminPolls() {
         <div style={{ display: 'grid', gridTemplateColumns: 'repeat(auto-fit, minmax(150px, 1fr))', gap: '16px', marginBottom: '24px' }}>
           <div style={{ background: '#d1fae5', padding: '16px', borderRadius: '12px', textAlign: 'center' }}>
             <TrendingUp size={24} color="#065f46" style={{ marginBottom: '8px' }} />
-            <div style={{ fontSize: '24px', fontWeight: '700', color: '#065f46' }}>{stats.total_winners}</div>
+            <div style={{ fontSize: '24px', fontWeight: '700', color: '#065f46' }}>{stats.summary.total_winners}</div>
             <div style={{ fontSize: '12px', color: '#065f46' }}>Winners</div>
           </div>
           <div style={{ background: '#fee2e2', padding: '16px', borderRadius: '12px', textAlign: 'center' }}>
             <TrendingDown size={24} color="#991b1b" style={{ marginBottom: '8px' }} />
-            <div style={{ fontSize: '24px', fontWeight: '700', color: '#991b1b' }}>{stats.total_losers}</div>
+            <div style={{ fontSize: '24px', fontWeight: '700', color: '#991b1b' }}>{stats.summary.total_losers}</div>
             <div style={{ fontSize: '12px', color: '#991b1b' }}>Losers</div>
           </div>
           <div style={{ background: '#dbeafe', padding: '16px', borderRadius: '12px', textAlign: 'center' }}>
-            <div style={{ fontSize: '24px', fontWeight: '700', color: '#1e40af' }}>${stats.total_winning_amount_distributed.toFixed(2)}</div>
+            <div style={{ fontSize: '24px', fontWeight: '700', color: '#1e40af' }}>${stats.summary.total_winning_amount_distributed.toFixed(2)}</div>
             <div style={{ fontSize: '12px', color: '#1e40af' }}>Amount Distributed</div>
           </div>
           <div style={{ background: '#fef3c7', padding: '16px', borderRadius: '12px', textAlign: 'center' }}>
-            <div style={{ fontSize: '24px', fontWeight: '700', color: '#92400e' }}>${stats.total_losing_amount_collected.toFixed(2)}</div>
+            <div style={{ fontSize: '24px', fontWeight: '700', color: '#92400e' }}>${stats.summary.total_losing_amount_collected.toFixed(2)}</div>
             <div style={{ fontSize: '12px', color: '#92400e' }}>From Losers</div>
           </div>
         </div>
@@ -259,11 +287,11 @@ export default function AdminPolls() {
         </div>
 
         {/* Winners List */}
-        {stats.winners.length > 0 && (
+        {stats.winners.total > 0 && (
           <div style={{ marginBottom: '24px' }}>
             <h5 style={{ fontSize: '14px', fontWeight: '600', color: '#065f46', marginBottom: '12px', display: 'flex', alignItems: 'center', gap: '8px' }}>
               <TrendingUp size={16} />
-              Winners ({stats.winners.length})
+              Winners ({stats.winners.total})
             </h5>
             <div style={{ background: 'white', borderRadius: '8px', overflow: 'hidden', border: '1px solid #d1fae5' }}>
               <table style={{ width: '100%', borderCollapse: 'collapse' }}>
@@ -277,7 +305,7 @@ export default function AdminPolls() {
                   </tr>
                 </thead>
                 <tbody>
-                  {stats.winners.map((winner, idx) => (
+                  {stats.winners.items.map((winner, idx) => (
                     <tr key={idx} style={{ borderTop: '1px solid #e5e7eb' }}>
                       <td style={{ padding: '12px', fontSize: '13px' }}>
                         <div style={{ fontWeight: '600', color: '#1f2937' }}>{winner.user_name}</div>
@@ -292,15 +320,16 @@ export default function AdminPolls() {
                 </tbody>
               </table>
             </div>
+            {renderStatsPager(pollId, stats.winners, (page) => fetchPollStats(pollId, page, stats.losers.page))}
           </div>
         )}
 
         {/* Losers List */}
-        {stats.losers.length > 0 && (
+        {stats.losers.total > 0 && (
           <div>
             <h5 style={{ fontSize: '14px', fontWeight: '600', color: '#991b1b', marginBottom: '12px', display: 'flex', alignItems: 'center', gap: '8px' }}>
               <TrendingDown size={16} />
-              Losers ({stats.losers.length})
+              Losers ({stats.losers.total})
             </h5>
             <div style={{ background: 'white', borderRadius: '8px', overflow: 'hidden', border: '1px solid #fee2e2' }}>
               <table style={{ width: '100%', borderCollapse: 'collapse' }}>
@@ -313,7 +342,7 @@ export default function AdminPolls() {
                   </tr>
                 </thead>
                 <tbody>
-                  {stats.losers.map((loser, idx) => (
+                  {stats.losers.items.map((loser, idx) => (
                     <tr key={idx} style={{ borderTop: '1px solid #e5e7eb' }}>
                       <td style={{ padding: '12px', fontSize: '13px' }}>
                         <div style={{ fontWeight: '600', color: '#1f2937' }}>{loser.user_name}</div>
@@ -327,6 +356,7 @@ export default function AdminPolls() {
                 </tbody>
               </table>
             </div>
+            {renderStatsPager(pollId, stats.losers, (page) => fetchPollStats(pollId, stats.winners.page, page))}
           </div>
         )}
       </div>